@@ -0,0 +1,450 @@
+import os
+from datetime import date, datetime, time, timedelta
+
+import click
+
+from db import pool
+
+try:
+    import numpy as np
+except ImportError:  # optional: the same results come from plain lists, just slower on long ranges
+    np = None
+
+
+# Rows read per batch while collecting changed buckets
+ANALYTICS_BATCH = int(os.environ.get("ANALYTICS_BATCH", "5000"))
+# Source rows younger than this are left for the next refresh, so a transaction
+# that commits after a higher id was read isn't skipped
+ANALYTICS_SETTLE_SECONDS = int(os.environ.get("ANALYTICS_SETTLE_SECONDS", "60"))
+# A full rebuild recomputes this many days per statement (and commits between them)
+ANALYTICS_REBUILD_DAYS = int(os.environ.get("ANALYTICS_REBUILD_DAYS", "7"))
+ROLLING_DAYS = 7
+
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+
+
+# ---------- ROLLUPS ----------
+class Rollup:
+    """One rollup table: rows keyed by ``bucket`` (an hour or a day), recomputed a bucket range at a time."""
+
+    def __init__(self, table, step, insert_sql, extent_sql):
+        self.table = table
+        self.step = step
+        self.insert_sql = insert_sql     # INSERT ... SELECT for source rows in [%s, %s)
+        self.extent_sql = extent_sql     # first and last source timestamp
+
+    def bucket(self, value):
+        if self.step == DAY:
+            return value.date() if isinstance(value, datetime) else value
+        return value.replace(minute=0, second=0, microsecond=0)
+
+    def rebuild(self, cursor, start, end):
+        cursor.execute(f"DELETE FROM {self.table} WHERE bucket >= %s AND bucket < %s", (start, end))
+        cursor.execute(self.insert_sql, (start, end))
+
+    def ranges(self, buckets):
+        """Merge buckets into as few [start, end) ranges as possible."""
+        ranges = []
+        for b in sorted(buckets):
+            if ranges and ranges[-1][1] == b:
+                ranges[-1][1] = b + self.step
+            else:
+                ranges.append([b, b + self.step])
+        return ranges
+
+
+BOOKINGS_HOURLY = Rollup("analytics_bookings_hourly", HOUR, """
+    INSERT INTO analytics_bookings_hourly (bucket, status, bookings, total_weight, total_value, total_amount)
+    SELECT TIMESTAMP(DATE(b.booking_date), MAKETIME(HOUR(b.booking_date), 0, 0)), b.status,
+           COUNT(*), SUM(b.weight), COALESCE(SUM(b.cargo_value), 0), SUM(b.total_amount)
+    FROM cargo_bookings b
+    WHERE b.booking_date >= %s AND b.booking_date < %s
+    GROUP BY 1, 2
+""", "SELECT MIN(b.booking_date), MAX(b.booking_date) FROM cargo_bookings b")
+
+DELIVERIES_DAILY = Rollup("analytics_deliveries_daily", DAY, """
+    INSERT INTO analytics_deliveries_daily (bucket, delivered, on_time, late, delivery_hours)
+    SELECT DATE(b.actual_delivery_date), COUNT(*),
+           COALESCE(SUM(DATE(b.actual_delivery_date) <= b.expected_delivery_date), 0),
+           COALESCE(SUM(DATE(b.actual_delivery_date) > b.expected_delivery_date), 0),
+           COALESCE(SUM(TIMESTAMPDIFF(HOUR, b.booking_date, b.actual_delivery_date)), 0)
+    FROM cargo_bookings b
+    WHERE b.status = 'delivered' AND b.actual_delivery_date >= %s AND b.actual_delivery_date < %s
+    GROUP BY 1
+""", "SELECT MIN(b.actual_delivery_date), MAX(b.actual_delivery_date) FROM cargo_bookings b")
+
+# Cancelled invoices aren't revenue
+REVENUE_DAILY = Rollup("analytics_revenue_daily", DAY, """
+    INSERT INTO analytics_revenue_daily (bucket, invoices, subtotal, tax, total, paid)
+    SELECT i.issue_date, COUNT(*), SUM(i.subtotal), SUM(i.tax_amount), SUM(i.total_amount),
+           SUM(CASE WHEN i.payment_status = 'paid' THEN i.total_amount ELSE 0 END)
+    FROM invoices i
+    WHERE i.issue_date >= %s AND i.issue_date < %s AND i.payment_status <> 'cancelled'
+    GROUP BY 1
+""", "SELECT MIN(i.issue_date), MAX(i.issue_date) FROM invoices i")
+
+TICKETS_DAILY = Rollup("analytics_tickets_daily", DAY, """
+    INSERT INTO analytics_tickets_daily (bucket, category, tickets, resolved)
+    SELECT DATE(t.created_at), t.category, COUNT(*), SUM(t.status IN ('resolved', 'closed'))
+    FROM support_tickets t
+    WHERE t.created_at >= %s AND t.created_at < %s
+    GROUP BY 1, 2
+""", "SELECT MIN(t.created_at), MAX(t.created_at) FROM support_tickets t")
+
+
+# ---------- CHANGE DETECTION ----------
+# Each source reads rows past its high-water mark (an AUTO_INCREMENT id) in
+# batches and reports the buckets they fall in; ``since`` (the previous
+# refresh time) catches updates that don't create rows, like payments.
+def _scan(cursor, sql, last_id, settle):
+    while True:
+        cursor.execute(sql, (last_id, settle, ANALYTICS_BATCH))
+        rows = cursor.fetchall()
+        yield from rows
+        if len(rows) < ANALYTICS_BATCH:
+            return
+        last_id = rows[-1][0]
+
+
+def _dirty_bookings(cursor, last_id, since, settle):
+    # Every booking and status change writes a tracking_updates row, so that table is the change log
+    hours, days = set(), set()
+    for update_id, booking_date, delivered_at in _scan(cursor, """
+        SELECT tu.update_id, b.booking_date, b.actual_delivery_date
+        FROM tracking_updates tu
+        JOIN cargo_bookings b ON b.booking_id = tu.booking_id
+        WHERE tu.update_id > %s AND tu.update_timestamp < NOW() - INTERVAL %s SECOND
+        ORDER BY tu.update_id
+        LIMIT %s
+    """, last_id, settle):
+        last_id = update_id
+        hours.add(BOOKINGS_HOURLY.bucket(booking_date))
+        if delivered_at:
+            days.add(DELIVERIES_DAILY.bucket(delivered_at))
+    return last_id, {BOOKINGS_HOURLY: hours, DELIVERIES_DAILY: days}
+
+
+def _dirty_invoices(cursor, last_id, since, settle):
+    days = set()
+    for invoice_id, issue_date in _scan(cursor, """
+        SELECT i.invoice_id, i.issue_date FROM invoices i
+        WHERE i.invoice_id > %s AND i.created_at < NOW() - INTERVAL %s SECOND
+        ORDER BY i.invoice_id
+        LIMIT %s
+    """, last_id, settle):
+        last_id = invoice_id
+        days.add(issue_date)
+    if since:
+        cursor.execute("SELECT DISTINCT i.issue_date FROM invoices i WHERE i.payment_date >= %s", (since,))
+        days.update(row[0] for row in cursor.fetchall())
+    return last_id, {REVENUE_DAILY: days}
+
+
+def _dirty_tickets(cursor, last_id, since, settle):
+    days = set()
+    for ticket_id, created_at in _scan(cursor, """
+        SELECT t.ticket_id, t.created_at FROM support_tickets t
+        WHERE t.ticket_id > %s AND t.created_at < NOW() - INTERVAL %s SECOND
+        ORDER BY t.ticket_id
+        LIMIT %s
+    """, last_id, settle):
+        last_id = ticket_id
+        days.add(TICKETS_DAILY.bucket(created_at))
+    if since:
+        cursor.execute("SELECT DISTINCT DATE(t.created_at) FROM support_tickets t WHERE t.resolved_at >= %s", (since,))
+        days.update(row[0] for row in cursor.fetchall())
+    return last_id, {TICKETS_DAILY: days}
+
+
+SOURCES = {
+    "bookings": (_dirty_bookings, "SELECT MAX(update_id) FROM tracking_updates", (BOOKINGS_HOURLY, DELIVERIES_DAILY)),
+    "invoices": (_dirty_invoices, "SELECT MAX(invoice_id) FROM invoices", (REVENUE_DAILY,)),
+    "tickets": (_dirty_tickets, "SELECT MAX(ticket_id) FROM support_tickets", (TICKETS_DAILY,)),
+}
+
+
+# ---------- REFRESH ----------
+def _watermark(cursor, source):
+    # The row lock serializes concurrent refreshes of one source
+    cursor.execute("INSERT IGNORE INTO analytics_watermarks (source, last_id) VALUES (%s, 0)", (source,))
+    cursor.execute(
+        "SELECT last_id, refreshed_at FROM analytics_watermarks WHERE source = %s FOR UPDATE", (source,)
+    )
+    return cursor.fetchone()
+
+
+def _save_watermark(cursor, source, last_id, refreshed_at):
+    cursor.execute(
+        "UPDATE analytics_watermarks SET last_id = %s, refreshed_at = %s WHERE source = %s",
+        (last_id, refreshed_at, source),
+    )
+
+
+def _rebuild_all(conn, cursor, rollup):
+    cursor.execute(rollup.extent_sql)
+    first, last = cursor.fetchone()
+    cursor.execute(f"DELETE FROM {rollup.table}")
+    conn.commit()
+    if first is None:
+        return 0
+    start, end = rollup.bucket(first), rollup.bucket(last) + rollup.step
+    chunk = max(timedelta(days=ANALYTICS_REBUILD_DAYS), rollup.step)
+    while start < end:
+        rollup.rebuild(cursor, start, min(start + chunk, end))
+        conn.commit()
+        start += chunk
+    return (rollup.bucket(last) - rollup.bucket(first)) // rollup.step + 1
+
+
+def refresh(conn, full=False, progress=None):
+    """Bring every rollup up to date; returns {table: buckets recomputed}.
+
+    Incremental refreshes recompute only the buckets touched since the last
+    high-water mark, in one transaction per source. ``full`` rebuilds each
+    rollup from scratch in ANALYTICS_REBUILD_DAYS chunks, for first use or
+    after changes the change log can't see (deleted rows, re-delivered bookings).
+    """
+    recomputed = {}
+    cursor = conn.cursor()
+    try:
+        for source, (find_dirty, max_id_sql, rollups) in SOURCES.items():
+            cursor.execute("SELECT NOW() - INTERVAL %s SECOND", (ANALYTICS_SETTLE_SECONDS,))
+            settled_at = cursor.fetchone()[0]
+            last_id, since = _watermark(cursor, source)
+            if full:
+                cursor.execute(max_id_sql)
+                last_id = cursor.fetchone()[0] or 0
+                _save_watermark(cursor, source, last_id, settled_at)
+                conn.commit()   # rows after this mark are picked up incrementally
+                for rollup in rollups:
+                    recomputed[rollup.table] = _rebuild_all(conn, cursor, rollup)
+                    if progress:
+                        progress(rollup.table, recomputed[rollup.table])
+                continue
+            last_id, dirty = find_dirty(cursor, last_id, since, ANALYTICS_SETTLE_SECONDS)
+            for rollup, buckets in dirty.items():
+                for start, end in rollup.ranges(buckets):
+                    rollup.rebuild(cursor, start, end)
+                recomputed[rollup.table] = len(buckets)
+                if progress:
+                    progress(rollup.table, len(buckets))
+            _save_watermark(cursor, source, last_id, settled_at)
+            conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return recomputed
+
+
+# ---------- SERIES ----------
+# Rollup rows are spread onto a dense grid of buckets so charts and reports
+# get one value per hour/day, zeros included. With numpy the grid is an
+# array and the arithmetic is vectorized; without it, lists.
+def _zeros(n):
+    return np.zeros(n) if np is not None else [0.0] * n
+
+
+def _scatter_add(target, index, values):
+    if np is not None:
+        np.add.at(target, np.asarray(index, dtype=np.intp), np.asarray(values, dtype=float))
+    else:
+        for i, v in zip(index, values):
+            target[i] += v
+
+
+def _divide(a, b):
+    """a / b elementwise, None where b is 0."""
+    if np is not None:
+        b = np.asarray(b, dtype=float)
+        out = np.divide(a, b, out=np.zeros_like(b), where=b != 0)
+        return [None if d == 0 else v for v, d in zip(out.tolist(), b.tolist())]
+    return [None if d == 0 else n / d for n, d in zip(a, b)]
+
+
+def _rolling_sum(a, window):
+    if np is not None:
+        c = np.cumsum(np.concatenate(([0.0], np.asarray(a, dtype=float))))
+        return c[window:] - c[:-window] if len(a) >= window else np.zeros(0)
+    return [sum(a[i - window:i]) for i in range(window, len(a) + 1)]
+
+
+def _tolist(a, digits=2):
+    a = a.tolist() if np is not None and hasattr(a, "tolist") else a
+    return [None if v is None else round(v, digits) for v in a]
+
+
+class Frame:
+    """Named columns over consecutive buckets from ``start`` in ``step`` increments."""
+
+    def __init__(self, start, periods, step):
+        self.start = start
+        self.periods = periods
+        self.step = step
+        self.columns = {}
+
+    @property
+    def buckets(self):
+        return [self.start + i * self.step for i in range(self.periods)]
+
+    def index(self, bucket):
+        return (bucket - self.start) // self.step
+
+    def column(self, name):
+        if name not in self.columns:
+            self.columns[name] = _zeros(self.periods)
+        return self.columns[name]
+
+    def add(self, name, buckets, values):
+        index = [self.index(b) for b in buckets]
+        keep = [k for k, i in enumerate(index) if 0 <= i < self.periods]
+        _scatter_add(self.column(name), [index[k] for k in keep], [float(values[k] or 0) for k in keep])
+
+    def rows(self, names, digits=2):
+        columns = [_tolist(self.columns[n], digits) if n in self.columns else [0.0] * self.periods for n in names]
+        return [(b, *values) for b, *values in zip(self.buckets, *columns)]
+
+
+def _read(cursor, rollup, columns, start, end):
+    cursor.execute(
+        f"SELECT bucket, {', '.join(columns)} FROM {rollup.table} WHERE bucket >= %s AND bucket < %s ORDER BY bucket",
+        (start, end),
+    )
+    rows = cursor.fetchall()
+    return [list(col) for col in zip(*rows)] if rows else [[] for _ in range(len(columns) + 1)]
+
+
+def _frame(date_from, date_to, step):
+    if step == HOUR:
+        start = datetime.combine(date_from, time())
+        periods = (date_to - date_from).days * 24 + 24
+    else:
+        start, periods = date_from, (date_to - date_from).days + 1
+    return Frame(start, periods, step)
+
+
+def shipment_volume(cursor, date_from, date_to, step=DAY, by_status=False):
+    """Bookings, weight, value and amount per bucket (optionally one bookings column per status)."""
+    frame = _frame(date_from, date_to, step)
+    start = datetime.combine(date_from, time())
+    buckets, statuses, bookings, weight, value, amount = _read(
+        cursor, BOOKINGS_HOURLY, ("status", "bookings", "total_weight", "total_value", "total_amount"),
+        start, start + (date_to - date_from + DAY),
+    )
+    if step == DAY:
+        buckets = [b.date() for b in buckets]
+    for name, values in (("bookings", bookings), ("total_weight", weight), ("total_value", value),
+                         ("total_amount", amount)):
+        frame.add(name, buckets, values)
+    if by_status:
+        for status in sorted(set(statuses)):
+            picked = [k for k, s in enumerate(statuses) if s == status]
+            frame.add(f"bookings_{status}", [buckets[k] for k in picked], [bookings[k] for k in picked])
+    return frame
+
+
+def revenue(cursor, date_from, date_to):
+    frame = _frame(date_from, date_to, DAY)
+    columns = ("invoices", "subtotal", "tax", "total", "paid")
+    buckets, *values = _read(cursor, REVENUE_DAILY, columns, date_from, date_to + DAY)
+    for name, column in zip(columns, values):
+        frame.add(name, buckets, column)
+    return frame
+
+
+def performance(cursor, date_from, date_to):
+    """Deliveries per day with on-time rate, average delivery hours and a trailing 7-day on-time rate."""
+    # Read ROLLING_DAYS - 1 extra days so the first rolling value has a full window
+    lead = ROLLING_DAYS - 1
+    frame = _frame(date_from - timedelta(days=lead), date_to, DAY)
+    columns = ("delivered", "on_time", "late", "delivery_hours")
+    buckets, *values = _read(cursor, DELIVERIES_DAILY, columns, frame.start, date_to + DAY)
+    for name, column in zip(columns, values):
+        frame.add(name, buckets, column)
+    delivered, on_time = frame.columns["delivered"], frame.columns["on_time"]
+    out = _frame(date_from, date_to, DAY)
+    for name in columns:
+        out.columns[name] = frame.columns[name][lead:]
+    out.columns["on_time_rate"] = _divide(out.columns["on_time"], out.columns["delivered"])
+    out.columns["avg_delivery_hours"] = _divide(out.columns["delivery_hours"], out.columns["delivered"])
+    out.columns["on_time_rate_7d"] = _divide(
+        _rolling_sum(on_time, ROLLING_DAYS), _rolling_sum(delivered, ROLLING_DAYS)
+    )
+    return out
+
+
+def tickets(cursor, date_from, date_to):
+    frame = _frame(date_from, date_to, DAY)
+    buckets, categories, counts, resolved = _read(
+        cursor, TICKETS_DAILY, ("category", "tickets", "resolved"), date_from, date_to + DAY
+    )
+    frame.add("tickets", buckets, counts)
+    frame.add("resolved", buckets, resolved)
+    for category in sorted(set(categories)):
+        picked = [k for k, c in enumerate(categories) if c == category]
+        frame.add(f"tickets_{category}", [buckets[k] for k in picked], [counts[k] for k in picked])
+    return frame
+
+
+SERIES = {
+    "bookings": lambda cursor, f, t, step: shipment_volume(cursor, f, t, step, by_status=True),
+    "revenue": lambda cursor, f, t, step: revenue(cursor, f, t),
+    "performance": lambda cursor, f, t, step: performance(cursor, f, t),
+    "tickets": lambda cursor, f, t, step: tickets(cursor, f, t),
+}
+
+
+def series_json(cursor, metric, date_from, date_to, step=DAY):
+    """{"buckets": [...], "series": {name: [...]}} for a chart."""
+    frame = SERIES[metric](cursor, date_from, date_to, step)
+    names = sorted(frame.columns)
+    return {
+        "buckets": [b.isoformat() for b in frame.buckets],
+        "series": {name: _tolist(frame.columns[name], 4) for name in names},
+    }
+
+
+# ---------- REPORTS ----------
+# reports.REPORT_GENERATORS entries: read the rollups, not the base tables
+def _report_range(date_from, date_to):
+    date_to = date_to or date.today()
+    return date_from or date_to - timedelta(days=29), date_to
+
+
+def _refreshed():
+    with pool.connection() as conn:
+        refresh(conn)
+
+
+def financial_report(cursor, date_from, date_to):
+    _refreshed()
+    names = ["invoices", "subtotal", "tax", "total", "paid"]
+    return ["date", *names], revenue(cursor, *_report_range(date_from, date_to)).rows(names)
+
+
+def shipment_volume_report(cursor, date_from, date_to):
+    _refreshed()
+    names = ["bookings", "total_weight", "total_value", "total_amount"]
+    return ["date", *names], shipment_volume(cursor, *_report_range(date_from, date_to)).rows(names)
+
+
+def performance_report(cursor, date_from, date_to):
+    _refreshed()
+    names = ["delivered", "on_time", "late", "on_time_rate", "avg_delivery_hours", "on_time_rate_7d"]
+    return ["date", *names], performance(cursor, *_report_range(date_from, date_to)).rows(names, 4)
+
+
+# ---------- CLI ----------
+@click.command("analytics-refresh")
+@click.option("--full", is_flag=True, help="Rebuild every rollup from the base tables.")
+def analytics_refresh_command(full):
+    """Update the analytics rollups; run from cron every few minutes."""
+    with pool.connection() as conn:
+        result = refresh(conn, full=full, progress=lambda table, n: click.echo(f"{table}: {n} buckets"))
+    click.echo(f"Recomputed {sum(result.values())} buckets.")
+
+
+def init_app(app):
+    app.cli.add_command(analytics_refresh_command)
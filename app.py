@@ -1,50 +1,128 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
-import mysql.connector
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, session, send_file, jsonify, stream_template
 from mysql.connector import Error
-from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
+import ipaddress
+import math
 import os
 import uuid
-import random, string
-from datetime import datetime, timedelta
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+
+import analytics
+import archive
+import billing
+import db
+import instrumentation
+import notifications
+import pagecache
+import pagination
+import queries
+import reports
+import search
+import sessions
+import streams
+import tracking
+from audit import audit
+from auth import HashingBusy, hasher, login_retry_after
+from bookings import clean_booking, create_booking, generate_tracking_id
+from bulk import BulkRequestError, bulk_update_status, import_bookings, iter_import_rows, read_bulk_rows
+from db import get_db, pool
+from ids import normalize_tracking_id
+from kpis import kpis
+from pagecache import cached_page
+from pagination import keyset_page
+from queries import RecordCursor
+from reports import (
+    ReportFilterError, booking_where, claim_download, parse_booking_filters, recent_reports, report_queue,
+    stream_bookings_csv
+)
+from sessions import accounts, auth_fingerprint
+from timeline import timelines
+from tracking import (
+    BOOKING_STATUSES, booking_status_for, normalize_status, record_tracking_update, set_booking_status
+)
 
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("FLASK_SECRET", "cargo_secret_key")
 
-# ---------- DB CONFIG ----------
-DB_CONFIG = {
-    "host": "localhost",
-    "user": "root",
-    "password": "",
-    "database": "cargo_db",
-    "port":   
-}
+# ---------- DB ----------
+# One pooled connection per request, handed back to the pool on app-context teardown
+db.init_app(app)
+# Per-request query count / DB time / render time, exported on /metrics
+instrumentation.init_app(app)
+# Server-side sessions: the cookie only carries a session ID
+sessions.init_app(app)
+tracking.init_app(app)
+pagination.init_app(app)
+billing.init_app(app)
+analytics.init_app(app)
+archive.init_app(app)
+reports.init_app(app)
+notifications.init_app(app)
+# Live tracking updates pushed to browsers by the stream server
+streams.init_app(app)
+# Fails startup if a registered query names a table/column missing from README.md
+queries.init_app(app)
 
 
-def get_db_connection():
-    return mysql.connector.connect(**DB_CONFIG)
+# ---------- AUTH DECORATORS ----------
+def login_redirect(user_id, account, role=None):
+    """The redirect for a session that may not proceed, or None; shared with asgi.py."""
+    if not user_id:
+        flash("Please login first.", "warning")
+        return redirect(url_for("login"))
+    if not account or account["status"] != "active" or account["auth"] != session.get("auth"):
+        session.clear()
+        session.regenerate()
+        flash("Your session has ended. Please login again.", "warning")
+        return redirect(url_for("login"))
+    if role and account["role"] != role:
+        flash("Access denied.", "danger")
+        return redirect(url_for("login"))
+    return None
 
 
-# ---------- AUTH DECORATORS ----------
 def login_required(role=None):
     def decorator(f):
         @wraps(f)
         def wrapped(*args, **kwargs):
-            if not session.get("user_id"):
-                flash("Please login first.", "warning")
-                return redirect(url_for("login"))
-            if role and session.get("role") != role:
-                flash("Access denied.", "danger")
-                return redirect(url_for("login"))
+            user_id = session.get("user_id")
+            # Cached per user and invalidated by the admin actions and password
+            # changes below, so suspensions apply on the next request
+            account = accounts.get(user_id, get_db) if user_id else None
+            denied = login_redirect(user_id, account, role)
+            if denied:
+                return denied
             return f(*args, **kwargs)
+        wrapped.login_role = role
         return wrapped
     return decorator
 
 
 # ---------- UTILITIES ----------
-def generate_tracking_id():
-    return str(uuid.uuid4()).split("-")[0].upper()
+# Listing filters are pushed down into SQL and combined with keyset pagination
+def booking_list_filters():
+    try:
+        filters = parse_booking_filters(request.args)
+    except ReportFilterError as e:
+        flash(str(e), "warning")
+        filters = {}
+    return booking_where(filters)
+
+
+def user_list_filters(role):
+    where, params = ["u.role = %s"], [role]
+    status = request.args.get("status")
+    if status in ("active", "inactive", "suspended"):
+        where.append("u.status = %s")
+        params.append(status)
+    q = (request.args.get("q") or "").strip()
+    if q:
+        clause, text_params = search.user_text_filter(q)
+        where.append(clause)
+        params.extend(text_params)
+    return where, params
 
 
 # ---------- ROUTES ----------
@@ -67,47 +145,44 @@ def signup():
             flash("Please fill all required fields", "warning")
             return redirect(url_for("signup"))
 
-        hashed_pw = generate_password_hash(password)
+        try:
+            hashed_pw = hasher.hash(password)
+        except HashingBusy:
+            flash("We're handling a lot of sign-ups right now. Please try again shortly.", "warning")
+            return render_template("signup.html"), 503
 
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        conn = get_db()
         try:
             # Check if username or email already exists
-            cursor.execute("SELECT * FROM users WHERE username=%s OR email=%s", (username, email))
-            existing = cursor.fetchone()
+            existing = queries.fetch_one(conn, queries.USER_BY_USERNAME_OR_EMAIL, (username, email))
             if existing:
-                if existing["username"] == username:
+                if existing.username == username:
                     flash("Username already exists.", "danger")
-                elif existing["email"] == email:
+                elif existing.email == email:
                     flash("Email already registered.", "danger")
                 return redirect(url_for("signup"))
 
             # Insert into users table
-            cursor.execute(
-                """
-                INSERT INTO users (full_name, username, email, password_hash, role, status)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                """,
-                (fullname, username, email, hashed_pw, role, "active")
-            )
-            user_id = cursor.lastrowid
+            user_id = queries.execute(
+                conn, queries.INSERT_USER, (fullname, username, email, hashed_pw, role)
+            ).lastrowid
 
             # Optional: insert into role-specific tables
             if role == "customer":
-                cursor.execute("INSERT INTO customers (user_id) VALUES (%s)", (user_id,))
+                queries.execute(conn, queries.INSERT_CUSTOMER, (user_id,))
             elif role == "employee":
-                cursor.execute("INSERT INTO employees (user_id) VALUES (%s)", (user_id,))
+                queries.execute(conn, queries.INSERT_EMPLOYEE, (user_id,))
 
             conn.commit()
+            pagecache.bump("users")
+            if role in ("customer", "employee"):
+                kpis.incr("users", role + "s")
             flash("Registration successful. Please login.", "success")
             return redirect(url_for("login"))
 
         except Error as e:
             conn.rollback()
             flash(f"Error: {e}", "danger")
-        finally:
-            cursor.close()
-            conn.close()
 
     return render_template("signup.html")
 
@@ -119,27 +194,53 @@ def login():
         password = request.form.get("password")
         role = request.form.get("userType")  # dropdown in login.html
 
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        try:
-            # Check username + role
-            cursor.execute("SELECT * FROM users WHERE username=%s AND role=%s", (username, role))
-            user = cursor.fetchone()
-        finally:
-            cursor.close()
-            conn.close()
+        # Throttled before any query or hashing, so a burst costs next to nothing
+        retry_after = login_retry_after(request.remote_addr, username)
+        if retry_after:
+            flash(f"Too many login attempts. Please try again in {math.ceil(retry_after)} seconds.", "danger")
+            response = app.make_response((render_template("login.html"), 429))
+            response.headers["Retry-After"] = str(math.ceil(retry_after))
+            return response
+
+        conn = get_db()
+        # Check username + role
+        user = queries.fetch_one(conn, queries.USER_FOR_LOGIN, (username, role))
 
-        if user and check_password_hash(user["password_hash"], password):
-            session["user_id"] = user["user_id"]  # FIXED (your table uses user_id, not id)
-            session["username"] = user["username"]
-            session["role"] = user["role"]
-            session["full_name"] = user["full_name"]
+        try:
+            if not user or not hasher.verify(user.password_hash, password):
+                user = None
+        except HashingBusy:
+            flash("We're handling a lot of logins right now. Please try again shortly.", "warning")
+            return render_template("login.html"), 503
+
+        if user and hasher.needs_rehash(user.password_hash):
+            # Hash parameters changed since this password was set: upgrade it while
+            # we have the plaintext, or leave it for next time if the pool is busy
+            try:
+                new_hash = hasher.hash(password)
+            except HashingBusy:
+                new_hash = None
+            if new_hash:
+                queries.execute(conn, queries.UPDATE_PASSWORD, (new_hash, user.user_id))
+                conn.commit()
+                user = user._replace(password_hash=new_hash)
+                accounts.invalidate(user.user_id)
+        if user and (user.status or "active").lower() != "active":
+            flash("Your account is not active. Please contact support.", "danger")
+        elif user:
+            session.clear()
+            session.regenerate()
+            session["user_id"] = user.user_id  # FIXED (your table uses user_id, not id)
+            session["auth"] = auth_fingerprint(user.password_hash)
+            session["username"] = user.username
+            session["role"] = user.role
+            session["full_name"] = user.full_name
             flash("Logged in successfully", "success")
 
             # Redirect based on role
-            if user["role"] == "admin":
+            if user.role == "admin":
                 return redirect(url_for("admin_dashboard"))
-            elif user["role"] == "employee":
+            elif user.role == "employee":
                 return redirect(url_for("employee_dashboard"))
             else:
                 return redirect(url_for("customer_dashboard"))
@@ -152,94 +253,189 @@ def login():
 @app.route("/logout")
 def logout():
     session.clear()
+    session.regenerate()
     flash("Logged out", "info")
     return redirect(url_for("login"))
 
 
 
+# ---------- METRICS ----------
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+
+def _is_loopback(addr):
+    try:
+        return ipaddress.ip_address(addr or "").is_loopback
+    except ValueError:
+        return False
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Prometheus scrape endpoint.
+
+    With METRICS_TOKEN set, scrapers send ``Authorization: Bearer <token>``;
+    without it only a scraper on the same host is answered (set the token
+    behind a local reverse proxy, which makes every client look local).
+    """
+    if METRICS_TOKEN:
+        if request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+            return Response("Unauthorized\n", 401, mimetype="text/plain")
+    elif not _is_loopback(request.remote_addr):
+        return Response("Not Found\n", 404, mimetype="text/plain")
+    hashing = hasher.metrics()
+    samples = [
+        ("cargo_db_pool_connections", "gauge", "Open pooled MySQL connections.", pool.size),
+        ("cargo_db_pool_checked_out", "gauge", "Pooled connections currently in use.", pool.checked_out),
+        ("cargo_password_hash_in_flight", "gauge", "Password hashes running or queued.", hashing["in_flight"]),
+        ("cargo_password_hash_queue_depth", "gauge", "Password hashes waiting for a worker.", hashing["queue_depth"]),
+        ("cargo_password_hash_busy_total", "counter", "Hashes refused because the pool was saturated.", hashing["busy_rejections"]),
+        ("cargo_login_rate_limited_ip_total", "counter", "Login attempts rejected by the per-IP limit.", hashing["rate_limited"]["ip"]),
+        ("cargo_login_rate_limited_user_total", "counter", "Login attempts rejected by the per-user limit.", hashing["rate_limited"]["user"]),
+        ("cargo_timeline_cache_hits_total", "counter", "Tracking timeline cache hits.", timelines.hits),
+        ("cargo_timeline_cache_misses_total", "counter", "Tracking timeline cache misses.", timelines.misses),
+        ("cargo_page_cache_hits_total", "counter", "Rendered page cache hits.", pagecache.pages.hits),
+        ("cargo_page_cache_misses_total", "counter", "Rendered page cache misses.", pagecache.pages.misses),
+        ("cargo_page_cache_evictions_total", "counter", "Pages evicted to stay within the byte budget.", pagecache.pages.evictions),
+        ("cargo_page_cache_bytes", "gauge", "Bytes of rendered pages held.", pagecache.pages.weight),
+        ("cargo_audit_recorded_total", "counter", "Audit entries accepted into the buffer.", audit.recorded),
+        ("cargo_audit_written_total", "counter", "Audit entries written to system_logs.", audit.written),
+        ("cargo_audit_dropped_total", "counter", "Audit entries lost to a full buffer or failed writes.", audit.dropped),
+        ("cargo_audit_buffer_depth", "gauge", "Audit entries waiting to be written.", audit.depth),
+    ]
+    histograms = [(
+        "cargo_password_hash_seconds", "Password hash/verify latency including queue wait.", "op",
+        {op: (hashing["latency_buckets"], counts, hashing["latency_sum"][op])
+         for op, counts in hashing["latency_counts"].items()},
+    )]
+    return Response(instrumentation.metrics.render(samples, histograms), mimetype="text/plain; version=0.0.4")
+
+
+# ---------- PUBLIC TRACKING ----------
+# Served from the timeline cache: a repeat poll is answered from memory, and a
+# matching If-None-Match gets a 304 without rendering anything.
+def _conditional(etag, build):
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = build()
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "public, no-cache"
+    return response
+
+
+@app.route("/track")
+def track_lookup():
+    tracking_id = request.args.get("tracking_id", "").strip()
+    if tracking_id:
+        return redirect(url_for("track_shipment", tracking_id=normalize_tracking_id(tracking_id) or tracking_id))
+    return render_template("track.html", tracking_id=None, timeline=None)
+
+
+@app.route("/track/<tracking_id>")
+def track_shipment(tracking_id):
+    canonical = normalize_tracking_id(tracking_id)
+    return track_page(tracking_id, canonical, timelines.get(canonical, get_db) if canonical else None)
+
+
+@app.route("/api/track/<tracking_id>")
+def api_track_shipment(tracking_id):
+    canonical = normalize_tracking_id(tracking_id)
+    return track_json(timelines.get(canonical, get_db) if canonical else None)
+
+
+# Shared with asgi.py, which loads the timeline entry asynchronously
+def track_page(tracking_id, canonical, entry):
+    if entry is None:
+        return render_template("track.html", tracking_id=tracking_id, timeline=None), 404
+    return _conditional("h" + entry.etag, lambda: Response(
+        render_template("track.html", tracking_id=canonical, timeline=entry.timeline)
+    ))
+
+
+def track_json(entry):
+    if entry is None:
+        return jsonify({"error": "Tracking ID not found"}), 404
+    return _conditional("j" + entry.etag, lambda: Response(entry.json, mimetype="application/json"))
+
+
+# ---------- SEARCH ----------
+# Scopes each role may search; customers only ever see their own bookings and tickets
+SEARCH_SCOPES = {
+    "admin": search.SCOPES,
+    "employee": ("bookings",),
+    "customer": ("bookings", "tickets"),
+}
+
+
+@app.route("/api/search")
+@login_required()
+def api_search():
+    """Typeahead: ``?scope=bookings|customers|tickets&q=...&limit=10``."""
+    scope = request.args.get("scope", "bookings")
+    role = session.get("role")
+    if scope not in SEARCH_SCOPES.get(role, ()):
+        return jsonify({"error": f"Cannot search {scope}"}), 403
+    try:
+        limit = int(request.args.get("limit", search.SEARCH_DEFAULT_LIMIT))
+    except ValueError:
+        limit = search.SEARCH_DEFAULT_LIMIT
+    conn = get_db()
+    customer_id = None
+    if role == "customer":
+        customer = queries.fetch_one(conn, queries.CUSTOMER_ID_FOR_USER, (session.get("user_id"),))
+        if not customer:
+            return jsonify([])
+        customer_id = customer.customer_id
+    return jsonify(search.suggest(conn, scope, request.args.get("q", ""), limit, customer_id))
+
+
 # ---------- CUSTOMER ----------
 @app.route("/customer/dashboard")
 @login_required(role="customer")
+@cached_page("bookings", "invoices")
 def customer_dashboard():
-    user_id = session.get("user_id")
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT cb.*, tu.status AS latest_status, tu.update_timestamp
-        FROM cargo_bookings cb
-        JOIN customers c ON cb.customer_id = c.customer_id
-        LEFT JOIN (
-            SELECT booking_id, status, update_timestamp
-            FROM tracking_updates
-            WHERE (booking_id, update_timestamp) IN (
-                SELECT booking_id, MAX(update_timestamp)
-                FROM tracking_updates
-                GROUP BY booking_id
-            )
-        ) tu ON cb.booking_id = tu.booking_id
-        WHERE c.user_id = %s
-        ORDER BY cb.booking_date DESC
-    """, (user_id,))
-    shipments = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return render_template("customer_dashboard.html", shipments=shipments)
+    # Rendered as the rows arrive instead of holding a customer's whole history in memory.
+    # The session is saved before streaming starts, so this template must not read flashes.
+    conn = get_db()
+    customer = queries.fetch_one(conn, queries.CUSTOMER_ID_FOR_USER, (session.get("user_id"),))
+    shipments = queries.iter_records(conn, queries.CUSTOMER_SHIPMENTS, (session.get("user_id"),))
+    return stream_template("customer_dashboard.html", shipments=shipments,
+                           customer_id=customer.customer_id if customer else None)
 
 
-def generate_tracking_id():
-    return "TRK" + ''.join(random.choices(string.digits, k=8))
-
 @app.route("/customer/book_cargo", methods=["GET", "POST"])
 @login_required(role="customer")
 def customer_book_cargo():
     if request.method == "POST":
-        sender_name = request.form.get("sender_name")
-        sender_address = request.form.get("sender_address")
-        sender_phone = request.form.get("sender_phone")
-        recipient_name = request.form.get("recipient_name")
-        recipient_address = request.form.get("recipient_address")
-        recipient_phone = request.form.get("recipient_phone")
-        cargo_description = request.form.get("cargo_description")
-        weight = request.form.get("weight")
-        cargo_value = request.form.get("cargo_value")
-
-        conn = get_db_connection()
+        booking, error = clean_booking(request.form)
+        if error:
+            flash(f"Please check the form: {error}", "warning")
+            return render_template("customer_book_cargo.html")
+
+        conn = get_db()
         cursor = conn.cursor()
 
         try:
             # 1. Get customer_id from logged in user
-            cursor.execute("SELECT customer_id FROM customers WHERE user_id=%s", (session.get("user_id"),))
-            result = cursor.fetchone()
-            if not result:
+            customer = queries.fetch_one(conn, queries.CUSTOMER_ID_FOR_USER, (session.get("user_id"),))
+            if not customer:
                 flash("Customer profile not found!", "danger")
                 return redirect(url_for("customer_dashboard"))
-            customer_id = result[0]
+            customer_id = customer.customer_id
 
             # 2. Generate tracking ID
             tracking_id = generate_tracking_id()
 
-            # 3. Insert cargo booking
-            cursor.execute("""
-                INSERT INTO cargo_bookings 
-                (tracking_id, customer_id, sender_name, sender_address, sender_phone, 
-                 recipient_name, recipient_address, recipient_phone, cargo_description, 
-                 weight, cargo_value, total_amount, status, expected_delivery_date)
-                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-            """, (
-                tracking_id, customer_id, sender_name, sender_address, sender_phone,
-                recipient_name, recipient_address, recipient_phone, cargo_description,
-                weight, cargo_value, cargo_value, "pending", datetime.now().date() + timedelta(days=5)
-            ))
-
-            booking_id = cursor.lastrowid
-
-            # 4. Insert initial tracking update
-            cursor.execute("""
-                INSERT INTO tracking_updates (booking_id, status, location, notes) 
-                VALUES (%s, %s, %s, %s)
-            """, (booking_id, "pending", "Shipment Booked", "Shipment created by customer"))
+            # 3. Insert cargo booking and its initial tracking update (also sets the latest-status projection)
+            booking_id = create_booking(cursor, customer_id, booking, tracking_id)
+            notifications.enqueue_booking_created(cursor, [booking_id])
 
             conn.commit()
+            pagecache.bump("bookings")
+            kpis.booking_created("pending")
+            # Clears a cached "not found" from anyone who polled the ID early
+            timelines.invalidate(tracking_id)
             flash(f"Cargo booked successfully! Tracking ID: {tracking_id}", "success")
             return redirect(url_for("customer_dashboard"))
 
@@ -248,48 +444,47 @@ def customer_book_cargo():
             flash(f"Error booking cargo: {e}", "danger")
         finally:
             cursor.close()
-            conn.close()
 
     return render_template("customer_book_cargo.html")
 
 
+@app.route("/customer/bulk_book", methods=["POST"])
+@login_required(role="customer")
+def customer_bulk_book():
+    """Import many bookings from a CSV upload (one row per shipment) or a JSON {"items": [...]} body."""
+    try:
+        rows = iter_import_rows(request)
+    except BulkRequestError as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn = get_db()
+    customer = queries.fetch_one(conn, queries.CUSTOMER_ID_FOR_USER, (session.get("user_id"),))
+    if not customer:
+        return jsonify({"error": "Customer profile not found"}), 404
+
+    summary = import_bookings(conn, customer.customer_id, rows)
+    if summary.imported:
+        pagecache.bump("bookings")
+        kpis.booking_created("pending", summary.imported)
+        timelines.invalidate(*(b["tracking_id"] for b in summary.bookings))
+    return jsonify(summary.as_dict()), 200 if summary.imported or not summary.failed else 400
+
+
 @app.route("/customer/view_invoices")
 @login_required(role="customer")
+@cached_page("invoices")
 def customer_view_invoices():
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
     # Pull recipient details instead of non-existent destination_city
-    cursor.execute("""
-        SELECT i.*, 
-               c.recipient_name, 
-               c.recipient_address, 
-               c.recipient_phone
-        FROM invoices i
-        JOIN cargo_bookings c ON i.booking_id = c.booking_id
-        WHERE c.customer_id = (
-            SELECT customer_id 
-            FROM customers 
-            WHERE user_id = %s
-        )
-        ORDER BY i.issue_date DESC
-    """, (session.get("user_id"),))
-
-    invoices = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    invoices = queries.fetch_all(get_db(), queries.CUSTOMER_INVOICES, (session.get("user_id"),))
     return render_template("customer_view_invoices.html", invoices=invoices)
 
 
-import uuid
-
 @app.route("/customer/support", methods=["GET", "POST"])
 @login_required(role="customer")
 def customer_support():
     tickets = []
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    customer_id = None
+    conn = get_db()
+    customer = queries.fetch_one(conn, queries.CUSTOMER_ID_FOR_USER, (session.get("user_id"),))
 
     if request.method == "POST":
         subject = request.form.get("subject")
@@ -297,30 +492,23 @@ def customer_support():
         tracking_id = request.form.get("trackingId")
 
         try:
-            # Get customer_id from customers table using logged-in user's id
-            cursor.execute("SELECT customer_id FROM customers WHERE user_id=%s", (session.get("user_id"),))
-            customer_row = cursor.fetchone()
-
-            if customer_row:
-                customer_id = customer_row["customer_id"] if isinstance(customer_row, dict) else customer_row[0]
-
+            if customer:
                 booking_id = None
+                tracking_id = normalize_tracking_id(tracking_id)
                 if tracking_id:
                     # Try to match tracking ID with cargo_bookings
-                    cursor.execute("SELECT booking_id FROM cargo_bookings WHERE tracking_id=%s", (tracking_id,))
-                    booking = cursor.fetchone()
+                    booking = queries.fetch_one(conn, queries.BOOKING_ID_FOR_TRACKING, (tracking_id,))
                     if booking:
-                        booking_id = booking["booking_id"] if isinstance(booking, dict) else booking[0]
+                        booking_id = booking.booking_id
 
                 ticket_number = "TKT-" + str(uuid.uuid4())[:6].upper()
 
-                cursor.execute("""
-                    INSERT INTO support_tickets 
-                    (ticket_number, customer_id, booking_id, subject, description, category, status) 
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """, (ticket_number, customer_id, booking_id, subject, description, "general_inquiry", "open"))
+                queries.execute(conn, queries.INSERT_TICKET, (
+                    ticket_number, customer.customer_id, booking_id, subject, description
+                ))
 
                 conn.commit()
+                kpis.incr("tickets", "open")
                 flash("Support ticket created successfully!", "success")
 
             else:
@@ -330,19 +518,9 @@ def customer_support():
             conn.rollback()
             flash(f"Error creating ticket: {e}", "danger")
 
-    # Always get customer_id for fetching tickets
-    if not customer_id:
-        cursor.execute("SELECT customer_id FROM customers WHERE user_id=%s", (session.get("user_id"),))
-        customer_row = cursor.fetchone()
-        if customer_row:
-            customer_id = customer_row["customer_id"] if isinstance(customer_row, dict) else customer_row[0]
+    if customer:
+        tickets = queries.fetch_all(conn, queries.CUSTOMER_TICKETS, (customer.customer_id,))
 
-    if customer_id:
-        cursor.execute("SELECT * FROM support_tickets WHERE customer_id=%s ORDER BY created_at DESC", (customer_id,))
-        tickets = cursor.fetchall()
-
-    cursor.close()
-    conn.close()
     return render_template("customer_support.html", tickets=tickets)
 
 
@@ -351,17 +529,7 @@ def customer_support():
 @app.route("/customer/profile")
 @login_required(role="customer")
 def customer_profile():
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT u.*, c.* 
-        FROM users u 
-        LEFT JOIN customers c ON u.user_id = c.customer_id 
-        WHERE u.user_id = %s
-    """, (session.get("user_id"),))
-    profile = cursor.fetchone()
-    cursor.close()
-    conn.close()
+    profile = queries.fetch_one(get_db(), queries.CUSTOMER_PROFILE, (session.get("user_id"),))
     return render_template("customer_profile.html", profile=profile)
 
 @app.route("/customer/change_password", methods=["POST"])
@@ -372,23 +540,23 @@ def change_password():
     new_password = request.form.get("new-password")
     confirm_password = request.form.get("confirm-password")
 
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
+    conn = get_db()
 
     # Fetch user with hashed password
-    cursor.execute("SELECT password_hash FROM users WHERE user_id=%s", (user_id,))
-    user = cursor.fetchone()
+    user = queries.fetch_one(conn, queries.PASSWORD_HASH, (user_id,))
 
     if not user:
-        cursor.close()
-        conn.close()
         flash("User not found!", "error")
         return redirect(url_for("customer_profile"))
 
+    try:
+        password_ok = hasher.verify(user.password_hash, current_password)
+    except HashingBusy:
+        flash("Server is busy, please try again shortly", "error")
+        return redirect(url_for("customer_profile"))
+
     # Check current password
-    if not check_password_hash(user["password_hash"], current_password):
-        cursor.close()
-        conn.close()
+    if not password_ok:
         flash("Current password is incorrect", "error")
         return redirect(url_for("customer_profile"))
 
@@ -398,12 +566,18 @@ def change_password():
         return redirect(url_for("customer_profile"))
 
     # Hash and update new password
-    new_hash = generate_password_hash(new_password)
-    cursor.execute("UPDATE users SET password_hash=%s WHERE user_id=%s", (new_hash, user_id))
+    try:
+        new_hash = hasher.hash(new_password)
+    except HashingBusy:
+        flash("Server is busy, please try again shortly", "error")
+        return redirect(url_for("customer_profile"))
+    queries.execute(conn, queries.UPDATE_PASSWORD, (new_hash, user_id))
     conn.commit()
-
-    cursor.close()
-    conn.close()
+    # The hash itself stays out of the log
+    audit.record("user.change_password", "users", user_id, new={"password": "changed"})
+    # Other sessions of this user stop matching the new fingerprint; keep this one
+    accounts.invalidate(user_id)
+    session["auth"] = auth_fingerprint(new_hash)
 
     flash("Password updated successfully!", "success")
     return redirect(url_for("customer_profile"))
@@ -411,109 +585,197 @@ def change_password():
 # ---------- EMPLOYEE ----------
 @app.route("/employee/dashboard")
 @login_required(role="employee")
+@cached_page("bookings")
 def employee_dashboard():
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM cargo_bookings ORDER BY booking_date DESC LIMIT 50")
-    bookings = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return render_template("employee_dashboard.html", bookings=bookings)
+    where, params = booking_list_filters()
+    bookings = keyset_page(
+        RecordCursor(get_db()), queries.BOOKING_LIST, where, params,
+        ["b.booking_date", "b.booking_id"], request.args
+    )
+    return render_template("employee_dashboard.html", bookings=bookings, statuses=BOOKING_STATUSES)
+
+
+@app.route("/employee/shipment_history")
+@login_required(role="employee")
+@cached_page("bookings")
+def employee_shipment_history():
+    where, params = booking_list_filters()
+    where = ["e.user_id = %s", "b.status IN ('delivered', 'cancelled')"] + where
+    bookings = keyset_page(
+        RecordCursor(get_db()), queries.EMPLOYEE_HISTORY_LIST, where, [session.get("user_id")] + params,
+        ["b.booking_date", "b.booking_id"], request.args
+    )
+    return render_template("employee_shipment_history.html", bookings=bookings, statuses=("delivered", "cancelled"))
 
 
 @app.route("/employee/update_status/<int:booking_id>", methods=["GET", "POST"])
 @login_required(role="employee")
 def employee_update_status(booking_id):
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
+    conn = get_db()
     if request.method == "POST":
-        status = request.form.get("status")
+        status = normalize_status(request.form.get("status"))
         location = request.form.get("location")
-        cursor.execute("UPDATE cargo_bookings SET status=%s WHERE id=%s", (status, booking_id))
-        cursor.execute("INSERT INTO tracking_updates (booking_id, location, status) VALUES (%s,%s,%s)", (booking_id, location, status))
-        conn.commit()
+        if not status:
+            flash("Please choose a valid status.", "warning")
+            return redirect(url_for("employee_update_status", booking_id=booking_id))
+        booking = queries.fetch_one(conn, queries.BOOKING_STATE, (booking_id,))
+        if not booking:
+            flash("Booking not found.", "warning")
+            return redirect(url_for("employee_dashboard"))
+        cursor = conn.cursor()
+        try:
+            set_booking_status(cursor, [booking_id], status)
+            record_tracking_update(cursor, booking_id, status, location)
+            notifications.enqueue_status_change(cursor, [booking_id], status, location)
+            conn.commit()
+        except Error as e:
+            conn.rollback()
+            flash(f"Error updating status: {e}", "danger")
+            return redirect(url_for("employee_update_status", booking_id=booking_id))
+        finally:
+            cursor.close()
+        # The audit trail and KPIs follow cargo_bookings.status, which has no at_hub / delivery_failed
+        new_status = booking_status_for(status)
+        audit.record("booking.update_status", "cargo_bookings", booking_id,
+                     {"status": booking.status, "location": booking.latest_location},
+                     {"status": new_status, "location": location})
+        pagecache.bump("bookings")
+        kpis.move_status(booking.status, new_status)
+        timelines.invalidate(booking.tracking_id)
+        streams.publish([streams.status_event(
+            booking.tracking_id, booking_id, booking.customer_id, status, location or None
+        )])
         flash("Status updated", "success")
         return redirect(url_for("employee_dashboard"))
 
-    cursor.execute("SELECT * FROM cargo_bookings WHERE id=%s", (booking_id,))
-    booking = cursor.fetchone()
-    cursor.execute("SELECT * FROM tracking_updates WHERE booking_id=%s ORDER BY updated_timestamp DESC", (booking_id,))
-    updates = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    booking = queries.fetch_one(conn, queries.BOOKING, (booking_id,))
+    if not booking:
+        flash("Booking not found.", "warning")
+        return redirect(url_for("employee_dashboard"))
+    updates = queries.fetch_all(conn, queries.TRACKING_HISTORY, (booking_id, booking_id))
     return render_template("employee_update_status.html", booking=booking, updates=updates)
 
 
+@app.route("/employee/bulk_update_status", methods=["POST"])
+@login_required(role="employee")
+def employee_bulk_update_status():
+    """Apply one scan batch: JSON {"status", "location", "items": [...]} or a CSV upload."""
+    try:
+        rows, defaults = read_bulk_rows(request)
+    except BulkRequestError as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn = get_db()
+    employee = queries.fetch_one(conn, queries.EMPLOYEE_ID_FOR_USER, (session.get("user_id"),))
+
+    try:
+        results = bulk_update_status(conn, rows, defaults, employee.employee_id if employee else None)
+    except Error as e:
+        return jsonify({"error": f"Database error, no updates applied: {e}"}), 500
+
+    pagecache.bump("bookings")
+    kpis.invalidate("bookings")
+    timelines.invalidate(*{r["tracking_id"] for r in results if r["ok"]})
+    applied = sum(1 for r in results if r["ok"])
+    return jsonify({"applied": applied, "failed": len(results) - applied, "results": results})
+
+
 # ---------- ADMIN ----------
 @app.route("/admin/dashboard")
 @login_required(role="admin")
 def admin_dashboard():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    # Stats
-    cursor.execute("SELECT COUNT(*) FROM users WHERE role='customer'")
-    customers = cursor.fetchone()[0]
-    cursor.execute("SELECT COUNT(*) FROM users WHERE role='employee'")
-    employees = cursor.fetchone()[0]
-    cursor.execute("SELECT COUNT(*) FROM cargo_bookings")
-    bookings = cursor.fetchone()[0]
-    cursor.close()
-    conn.close()
+    # Stats come from the KPI cache; ?refresh=1 forces a reload from the DB
+    stats = kpis.snapshot(get_db(), refresh=bool(request.args.get("refresh")))
     return render_template(
         "admin_dashboard.html",
-        customers=customers,
-        employees=employees,
-        bookings=bookings
+        customers=stats["users"]["customers"],
+        employees=stats["users"]["employees"],
+        bookings=stats["bookings"]["total"],
+        stats=stats
     )
 
+
+# Time series for dashboard charts, served from the analytics rollups
+ANALYTICS_MAX_HOURLY_DAYS = 31
+
+
+@app.route("/admin/analytics/<metric>")
+@login_required(role="admin")
+def admin_analytics_series(metric):
+    """``?date_from=&date_to=&grain=day|hour``; defaults to the last 30 days."""
+    if metric not in analytics.SERIES:
+        return jsonify({"error": f"Unknown metric: {metric}"}), 404
+    try:
+        filters = parse_booking_filters(request.args)
+    except ReportFilterError as e:
+        return jsonify({"error": str(e)}), 400
+    date_to = filters.get("date_to") or date.today()
+    date_from = filters.get("date_from") or date_to - timedelta(days=29)
+    hourly = request.args.get("grain") == "hour"
+    if date_from > date_to or (hourly and (date_to - date_from).days >= ANALYTICS_MAX_HOURLY_DAYS):
+        return jsonify({"error": "Invalid date range"}), 400
+    cursor = get_db().cursor()
+    try:
+        return jsonify(analytics.series_json(
+            cursor, metric, date_from, date_to, analytics.HOUR if hourly else analytics.DAY
+        ))
+    finally:
+        cursor.close()
+
+
+@app.route("/admin/metrics/slow_queries")
+@login_required(role="admin")
+def admin_slow_queries():
+    """Recent slow statements with their EXPLAIN plans, newest first."""
+    return jsonify(list(reversed(instrumentation.metrics.slow_log)))
+
+
+@app.route("/admin/metrics/auth")
+@login_required(role="admin")
+def admin_auth_metrics():
+    """Password hashing latency histogram, queue depth and rate-limit rejections."""
+    return jsonify(hasher.metrics())
+
 # Manage Customers
 @app.route("/admin/manage_customers")
 @login_required(role="admin")
+@cached_page("users")
 def admin_manage_customers():
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT u.*, c.phone, c.address 
-        FROM users u 
-        LEFT JOIN customers c ON u.id=c.user_id 
-        WHERE u.role='customer'
-    """)
-    customers = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    where, params = user_list_filters("customer")
+    customers = keyset_page(RecordCursor(get_db()), queries.CUSTOMER_LIST, where, params, ["u.user_id"], request.args)
     return render_template("admin_manage_customers.html", customers=customers)
 
 @app.route("/admin/customers/<int:id>/edit", methods=["GET", "POST"])
 @login_required(role="admin")
 def edit_customer(id):
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
+    conn = get_db()
     if request.method == "POST":
         fullname = request.form.get("fullname")
         email = request.form.get("email")
         status = request.form.get("status")
-        cursor.execute(
-            "UPDATE users SET fullname=%s, email=%s, status=%s WHERE id=%s",
-            (fullname, email, status, id)
-        )
+        if status not in ("active", "inactive", "suspended"):
+            status = None   # left unchanged
+        before = queries.fetch_one(conn, queries.CUSTOMER_ACCOUNT, (id,))
+        queries.execute(conn, queries.UPDATE_CUSTOMER_ACCOUNT, (fullname, email, status, id))
         conn.commit()
+        if before:
+            audit.record("customer.edit", "users", id,
+                         {"full_name": before.fullname, "email": before.email, "status": before.status},
+                         {"full_name": fullname, "email": email, "status": status or before.status})
+        accounts.invalidate(id)
+        pagecache.bump("users")
         flash("Customer updated successfully!", "success")
         return redirect(url_for("admin_manage_customers"))
-    cursor.execute("SELECT * FROM users WHERE id=%s", (id,))
-    customer = cursor.fetchone()
-    cursor.close()
-    conn.close()
+    customer = queries.fetch_one(conn, queries.CUSTOMER_ACCOUNT, (id,))
+    if not customer:
+        flash("Customer not found", "warning")
+        return redirect(url_for("admin_manage_customers"))
     return render_template("edit_customer.html", customer=customer)
 
 @app.route("/admin/customers/<int:id>/view")
 @login_required(role="admin")
 def view_customer(id):
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM users WHERE id=%s", (id,))
-    customer = cursor.fetchone()
-    cursor.close()
-    conn.close()
+    customer = queries.fetch_one(get_db(), queries.CUSTOMER_ACCOUNT, (id,))
 
     if not customer:
         flash("Customer not found", "warning")
@@ -524,12 +786,14 @@ def view_customer(id):
 @app.route("/admin/customers/<int:id>/activate")
 @login_required(role="admin")
 def activate_customer(id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE users SET status='Active' WHERE id=%s", (id,))
+    conn = get_db()
+    before = queries.fetch_one(conn, queries.CUSTOMER_ACCOUNT, (id,))
+    queries.execute(conn, queries.SET_CUSTOMER_STATUS, ("active", id))
     conn.commit()
-    cursor.close()
-    conn.close()
+    if before:
+        audit.record("customer.activate", "users", id, {"status": before.status}, {"status": "active"})
+    accounts.invalidate(id)
+    pagecache.bump("users")
 
     flash("Customer activated", "success")
     return redirect(url_for("admin_manage_customers"))
@@ -538,12 +802,14 @@ def activate_customer(id):
 @app.route("/admin/customers/<int:id>/suspend")
 @login_required(role="admin")
 def suspend_customer(id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE users SET status='Suspended' WHERE id=%s", (id,))
+    conn = get_db()
+    before = queries.fetch_one(conn, queries.CUSTOMER_ACCOUNT, (id,))
+    queries.execute(conn, queries.SET_CUSTOMER_STATUS, ("suspended", id))
     conn.commit()
-    cursor.close()
-    conn.close()
+    if before:
+        audit.record("customer.suspend", "users", id, {"status": before.status}, {"status": "suspended"})
+    accounts.invalidate(id)
+    pagecache.bump("users")
 
     flash("Customer suspended", "info")
     return redirect(url_for("admin_manage_customers"))
@@ -553,124 +819,132 @@ def suspend_customer(id):
 # Manage Employees
 @app.route("/admin/manage_employees")
 @login_required(role="admin")
+@cached_page("users")
 def admin_manage_employees():
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT u.*, e.department, e.designation 
-        FROM users u 
-        LEFT JOIN employees e ON u.id=e.user_id 
-        WHERE u.role='employee'
-    """)
-    employees = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    where, params = user_list_filters("employee")
+    department = request.args.get("department")
+    if department in ("logistics", "warehouse", "customer_service", "management", "driver"):
+        where.append("e.department = %s")
+        params.append(department)
+    employees = keyset_page(RecordCursor(get_db()), queries.EMPLOYEE_LIST, where, params, ["u.user_id"], request.args)
     return render_template("admin_manage_employees.html", employees=employees)
 
 # Manage Cargo (was bookings)
 @app.route("/admin/manage_cargo")
 @login_required(role="admin")
+@cached_page("bookings", "users")
 def admin_manage_cargo():
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT b.*, u.username 
-        FROM cargo_bookings b 
-        LEFT JOIN users u ON b.user_id=u.id 
-        ORDER BY b.booking_date DESC
-    """)
-    bookings = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return render_template("admin_manage_cargo.html", bookings=bookings)
+    where, params = booking_list_filters()
+    bookings = keyset_page(
+        RecordCursor(get_db()), queries.CARGO_LIST, where, params, ["b.booking_date", "b.booking_id"], request.args
+    )
+    return render_template("admin_manage_cargo.html", bookings=bookings, statuses=BOOKING_STATUSES)
 
 # Create Invoice
 @app.route("/admin/create_invoice/<int:booking_id>", methods=["POST"])
 @login_required(role="admin")
 def admin_create_invoice(booking_id):
-    amount = request.form.get("amount")
-    conn = get_db_connection()
+    amount = request.form.get("amount", "").strip()
+    try:
+        subtotal = Decimal(amount) if amount else None   # defaults to the booking's total_amount
+        if subtotal is not None and (not subtotal.is_finite() or subtotal < 0):
+            raise InvalidOperation
+    except InvalidOperation:
+        flash("Enter a valid invoice amount.", "danger")
+        return redirect(url_for("admin_manage_cargo"))
+    conn = get_db()
     cursor = conn.cursor()
     try:
-        # Get customer_id from cargo_bookings table
-        cursor.execute("SELECT user_id FROM cargo_bookings WHERE id=%s", (booking_id,))
-        result = cursor.fetchone()
-        if not result:
-            flash("Booking not found.", "danger")
-            return redirect(url_for("admin_manage_cargo"))
-        customer_id = result[0]
-
-        cursor.execute("""
-            INSERT INTO invoices (invoice_number, booking_id, customer_id, subtotal, tax_amount, total_amount, payment_status)
-            VALUES (%s,%s,%s,%s,%s,%s,%s)
-        """, ("INV"+str(uuid.uuid4())[:6], booking_id, customer_id, float(amount), float(amount)*0.18, float(amount)*1.18, "unpaid"))
-
+        invoice_number, total = billing.create_invoice(cursor, booking_id, subtotal)
+        invoice_id = cursor.lastrowid
         conn.commit()
-        flash("Invoice created", "success")
+        audit.record("invoice.create", "invoices", invoice_id, new={
+            "invoice_number": invoice_number, "booking_id": booking_id, "subtotal": subtotal, "total_amount": total,
+        })
+        pagecache.bump("invoices")
+        kpis.incr("invoices", "unpaid")
+        kpis.incr("invoices", "unpaid_total", total)
+        flash(f"Invoice {invoice_number} created", "success")
+    except billing.BillingError as e:
+        conn.rollback()
+        flash(str(e), "danger")
     except Error as e:
         conn.rollback()
         flash(f"Error creating invoice: {e}", "danger")
     finally:
         cursor.close()
-        conn.close()
     return redirect(url_for("admin_manage_cargo"))
 
 # Track Shipments
 @app.route("/admin/track_shipments", methods=["GET", "POST"])
 @login_required(role="admin")
 def admin_track_shipments():
-    tracking_info = None
+    booking = tracking_info = None
     if request.method == "POST":
+        conn = get_db()
         booking_id = request.form.get("booking_id")
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT * FROM tracking_updates WHERE booking_id=%s ORDER BY updated_timestamp DESC",
-            (booking_id,)
-        )
-        tracking_info = cursor.fetchall()
-        cursor.close()
-        conn.close()
-    return render_template("admin_track_shipments.html", tracking_info=tracking_info)
+        booking = queries.fetch_one(conn, queries.BOOKING_STATE, (booking_id,))
+        tracking_info = queries.fetch_all(conn, queries.TRACKING_HISTORY, (booking_id, booking_id))
+    return render_template("admin_track_shipments.html", booking=booking, tracking_info=tracking_info)
 
 # Generate Reports
 @app.route("/admin/generate_reports")
 @login_required(role="admin")
 def admin_generate_reports():
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT b.id, b.sender_name, b.recipient_name, b.origin_city, b.destination_city, 
-               b.status, b.booking_date, u.username 
-        FROM cargo_bookings b 
-        LEFT JOIN users u ON b.user_id=u.id 
-        ORDER BY b.booking_date DESC
-    """)
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
-
-    # CSV response
-    lines = ["id,sender,recipient,origin,destination,status,booking_date,username"]
-    for r in rows:
-        lines.append(",".join([
-            str(r["id"]),
-            r["sender_name"] or "",
-            r["recipient_name"] or "",
-            r["origin_city"] or "",
-            r["destination_city"] or "",
-            r["status"] or "",
-            str(r["booking_date"]),
-            r["username"] or ""
-        ]))
-
-    resp = "\n".join(lines)
-    return (resp, 200, {
+    try:
+        filters = parse_booking_filters(request.args)
+    except ReportFilterError as e:
+        flash(str(e), "danger")
+        return redirect(url_for("admin_dashboard"))
+
+    # Streamed in keyset batches so memory stays flat regardless of export size
+    return Response(stream_bookings_csv(filters), 200, {
         "Content-Type": "text/csv",
         "Content-Disposition": "attachment; filename=bookings_report.csv"
     })
 
 
+# Background report jobs
+@app.route("/admin/reports", methods=["GET", "POST"])
+@login_required(role="admin")
+def admin_reports():
+    conn = get_db()
+    if request.method == "POST":
+        try:
+            filters = parse_booking_filters({
+                "date_from": request.form.get("dateFrom"),
+                "date_to": request.form.get("dateTo"),
+            })
+            report_id, created = report_queue.request(
+                conn, request.form.get("reportType"),
+                filters.get("date_from"), filters.get("date_to"), session.get("user_id")
+            )
+            if created:
+                flash(f"Report #{report_id} queued. It will appear below when ready.", "success")
+            else:
+                flash(f"An identical report (#{report_id}) is already available.", "info")
+        except ReportFilterError as e:
+            flash(f"Invalid report request: {e}", "danger")
+        except Error as e:
+            conn.rollback()
+            flash(f"Error queuing report: {e}", "danger")
+        return redirect(url_for("admin_reports"))
+
+    reports = recent_reports(conn, session.get("user_id"))
+    return render_template("admin_generate_reports.html", reports=reports)
+
+
+@app.route("/admin/reports/<int:report_id>/download")
+@login_required(role="admin")
+def admin_download_report(report_id):
+    path = claim_download(get_db(), report_id)
+    if not path:
+        flash("Report is not ready or has expired.", "warning")
+        return redirect(url_for("admin_reports"))
+    return send_file(path, mimetype="text/csv", as_attachment=True, download_name=os.path.basename(path))
+
+
 # ---------- START ----------
+# Development server; for production see asgi.py (or any WSGI server on app:app)
 if __name__ == "__main__":
      app.run(debug=True, host="0.0.0.0", port=5000)
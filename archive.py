@@ -0,0 +1,101 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import click
+
+from db import pool
+
+
+# History of finished shipments moves to the archive this long after their last update
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "90"))
+# Bookings per transaction: each batch locks only these bookings and their tracking rows
+ARCHIVE_BATCH = int(os.environ.get("ARCHIVE_BATCH", "200"))
+# Sleep between batches so replication and the live workload keep up
+ARCHIVE_PAUSE_SECONDS = float(os.environ.get("ARCHIVE_PAUSE_SECONDS", "0.05"))
+ARCHIVED_STATUSES = ("delivered", "cancelled")
+
+TRACKING_COLUMNS = "update_id, booking_id, status, location, notes, updated_by, update_timestamp, latitude, longitude"
+
+
+def archive_batch(conn, cutoff, batch_size=ARCHIVE_BATCH):
+    """Move the tracking history of up to ``batch_size`` finished bookings to the archive.
+
+    One transaction: copy the rows, delete exactly the copied ones from the
+    hot table, stamp the bookings. Bookings another transaction has locked
+    are skipped for this run. Returns (bookings, rows) moved.
+    """
+    cursor = conn.cursor()
+    try:
+        statuses = ", ".join(["%s"] * len(ARCHIVED_STATUSES))
+        cursor.execute(f"""
+            SELECT b.booking_id FROM cargo_bookings b
+            WHERE b.status IN ({statuses}) AND b.history_archived_at IS NULL AND b.latest_update_at < %s
+            ORDER BY b.latest_update_at
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (*ARCHIVED_STATUSES, cutoff, batch_size))
+        booking_ids = [row[0] for row in cursor.fetchall()]
+        if not booking_ids:
+            conn.rollback()
+            return 0, 0
+
+        ids = ", ".join(["%s"] * len(booking_ids))
+        cursor.execute(f"""
+            INSERT IGNORE INTO tracking_updates_archive ({TRACKING_COLUMNS})
+            SELECT {TRACKING_COLUMNS} FROM tracking_updates WHERE booking_id IN ({ids})
+        """, booking_ids)
+        # Joined on update_id so a row inserted after the copy is never deleted uncopied
+        cursor.execute(f"""
+            DELETE tu FROM tracking_updates tu
+            JOIN tracking_updates_archive ta ON ta.update_id = tu.update_id
+            WHERE tu.booking_id IN ({ids})
+        """, booking_ids)
+        moved = cursor.rowcount
+        cursor.execute(
+            f"UPDATE cargo_bookings SET history_archived_at = NOW() WHERE booking_id IN ({ids})", booking_ids
+        )
+        conn.commit()
+        return len(booking_ids), moved
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def run_archive(conn, older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH, max_batches=None,
+                pause=ARCHIVE_PAUSE_SECONDS, progress=None):
+    """Archive in batches until nothing is due (or ``max_batches``); returns (bookings, rows)."""
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+    total_bookings = total_rows = batches = 0
+    while max_batches is None or batches < max_batches:
+        bookings, rows = archive_batch(conn, cutoff, batch_size)
+        if not bookings:
+            break
+        batches += 1
+        total_bookings += bookings
+        total_rows += rows
+        if progress:
+            progress(total_bookings, total_rows)
+        time.sleep(pause)
+    return total_bookings, total_rows
+
+
+# ---------- CLI ----------
+@click.command("archive-tracking")
+@click.option("--older-than-days", default=ARCHIVE_AFTER_DAYS, show_default=True)
+@click.option("--batch-size", default=ARCHIVE_BATCH, show_default=True)
+@click.option("--max-batches", type=int, default=None, help="Stop after this many batches (default: until done).")
+def archive_tracking_command(older_than_days, batch_size, max_batches):
+    """Move tracking history of old delivered/cancelled shipments to tracking_updates_archive."""
+    with pool.connection() as conn:
+        bookings, rows = run_archive(
+            conn, older_than_days, batch_size, max_batches,
+            progress=lambda b, r: click.echo(f"  {b} bookings, {r} updates archived", err=True),
+        )
+    click.echo(f"Archived {rows} tracking updates from {bookings} bookings.")
+
+
+def init_app(app):
+    app.cli.add_command(archive_tracking_command)
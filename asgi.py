@@ -0,0 +1,376 @@
+"""ASGI serving mode: hot read routes on an event loop, everything else through Flask.
+
+    pip install uvicorn aiomysql
+    python asgi.py                      # or: uvicorn asgi:application --workers 4
+
+GET requests for the tracking page and API, the customer invoice page and
+page-cache hits of every @cached_page view are answered on the event loop:
+the account check, timeline and invoice queries go through an aiomysql pool,
+so thousands of them can wait on MySQL at once without a thread each. All
+other requests (writes, cache misses of the other listings, streamed pages)
+run the unchanged Flask app in a bounded thread pool. Without aiomysql
+installed every request takes that path.
+
+On shutdown new requests get 503 while those in flight finish (up to
+ASGI_DRAIN_SECONDS); then the pools are closed.
+"""
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import make_response, render_template, request, session
+from werkzeug.exceptions import HTTPException
+
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
+
+import db
+import instrumentation
+import pagecache
+import queries
+from app import app, login_redirect, track_json, track_page
+from ids import normalize_tracking_id
+from sessions import accounts
+from timeline import timelines
+
+
+log = logging.getLogger(__name__)
+
+ASGI_HOST = os.environ.get("ASGI_HOST", "0.0.0.0")
+ASGI_PORT = int(os.environ.get("ASGI_PORT", "8000"))
+ASGI_WORKERS = int(os.environ.get("ASGI_WORKERS", "1"))
+# Threads running Flask requests; more than the sync pool's connections would only queue on it
+ASGI_THREADS = int(os.environ.get("ASGI_THREADS", str(db.POOL_CONFIG["pool_size"] + db.POOL_CONFIG["max_overflow"])))
+# Connections in the async pool, per worker process
+ASGI_DB_POOL_SIZE = int(os.environ.get("ASGI_DB_POOL_SIZE", "20"))
+ASGI_DRAIN_SECONDS = float(os.environ.get("ASGI_DRAIN_SECONDS", "30"))
+# Request bodies larger than this are spooled to a temp file (CSV uploads)
+ASGI_BODY_MEMORY_BYTES = int(os.environ.get("ASGI_BODY_MEMORY_BYTES", str(1024 * 1024)))
+
+
+# ---------- ASYNC DB ----------
+class AsyncDB:
+    """aiomysql pool returning the same records as queries.fetch_all.
+
+    Statements are timed into the request's stats, so /metrics covers both
+    serving paths. Waiting for a connection is bounded like the sync pool's.
+    """
+
+    def __init__(self, config, size=ASGI_DB_POOL_SIZE, timeout=db.POOL_CONFIG["timeout"],
+                 recycle=db.POOL_CONFIG["recycle"]):
+        self.config = config
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pool = None
+
+    async def open(self):
+        self.pool = await aiomysql.create_pool(
+            host=self.config["host"], port=self.config["port"], user=self.config["user"],
+            password=self.config["password"], db=self.config["database"],
+            minsize=1, maxsize=self.size, pool_recycle=self.recycle, autocommit=True,
+        )
+
+    async def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+
+    async def fetch_all(self, sql, params=()):
+        stats = instrumentation.current_stats()
+        try:
+            conn = await asyncio.wait_for(self.pool.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise db.PoolTimeout(msg=f"Timed out after {self.timeout}s waiting for a DB connection") from None
+        try:
+            async with conn.cursor() as cursor:
+                start = time.perf_counter()
+                await cursor.execute(sql, tuple(params))
+                rows = await cursor.fetchall()
+                if stats is not None:
+                    stats.record(sql, params, time.perf_counter() - start)
+                    stats.rows += len(rows)
+                return queries._records(cursor.description, rows)
+        finally:
+            self.pool.release(conn)
+
+    async def fetch_one(self, sql, params=()):
+        rows = await self.fetch_all(sql, params)
+        return rows[0] if rows else None
+
+
+adb = AsyncDB(db.DB_CONFIG)
+
+
+# ---------- NATIVE VIEWS ----------
+# Async counterparts of Flask views, called with the view and its URL
+# arguments inside the request context, after the login check. They share
+# the sync views' rendering and caches; only the queries differ.
+async def _timeline(tracking_id):
+    canonical = normalize_tracking_id(tracking_id)
+    return canonical, (await timelines.aget(canonical, adb.fetch_all) if canonical else None)
+
+
+async def track_shipment(view, tracking_id):
+    canonical, entry = await _timeline(tracking_id)
+    return track_page(tracking_id, canonical, entry)
+
+
+async def api_track_shipment(view, tracking_id):
+    _, entry = await _timeline(tracking_id)
+    return track_json(entry)
+
+
+async def customer_view_invoices(view):
+    key = pagecache.page_key(view.cache_topics)
+    response = pagecache.cached_response(key)
+    if response is not None:
+        return response
+    invoices = await adb.fetch_all(queries.CUSTOMER_INVOICES, (session.get("user_id"),))
+    return pagecache.store_response(key, make_response(
+        render_template("customer_view_invoices.html", invoices=invoices)
+    ))
+
+
+NATIVE_VIEWS = {
+    "track_shipment": track_shipment,
+    "api_track_shipment": api_track_shipment,
+    "customer_view_invoices": customer_view_invoices,
+}
+
+
+async def authorize(view):
+    """login_required's check with the account loaded asynchronously; None lets the request through."""
+    if not hasattr(view, "login_role"):
+        return None
+    user_id = session.get("user_id")
+    account = await accounts.aget(user_id, adb.fetch_one) if user_id else None
+    return login_redirect(user_id, account, view.login_role)
+
+
+# ---------- WSGI ENVIRON ----------
+def wsgi_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client")
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0] if client else "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        name, value = name.decode("latin-1"), value.decode("latin-1")
+        if name == "content-type":
+            key = "CONTENT_TYPE"
+        elif name == "content-length":
+            key = "CONTENT_LENGTH"
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _headers(response_headers):
+    return [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in response_headers]
+
+
+# ---------- APPLICATION ----------
+class CargoASGI:
+    def __init__(self, flask_app, threads=ASGI_THREADS, drain_seconds=ASGI_DRAIN_SECONDS):
+        self.app = flask_app
+        self.threads = threads
+        self.drain_seconds = drain_seconds
+        self.executor = None
+        self.native = False
+        self.draining = False
+        self.in_flight = 0
+        self._idle = None
+        self._starting = asyncio.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    # ----- lifespan -----
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def startup(self):
+        async with self._starting:
+            if self.executor is not None:
+                return
+            if aiomysql is None:
+                log.warning("aiomysql is not installed; serving every request through the Flask thread pool")
+            else:
+                await adb.open()
+                self.native = True
+            self._idle = asyncio.Event()
+            self._idle.set()
+            self.executor = ThreadPoolExecutor(self.threads, thread_name_prefix="flask")
+
+    async def shutdown(self):
+        """Refuse new requests, let in-flight ones finish, then close the pools."""
+        self.draining = True
+        if self._idle is not None:
+            try:
+                await asyncio.wait_for(self._idle.wait(), self.drain_seconds)
+            except asyncio.TimeoutError:
+                log.warning("Shutting down with %d requests still in flight", self.in_flight)
+        self.native = False
+        await adb.close()
+        if self.executor is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+        db.pool.close()
+
+    # ----- requests -----
+    async def _http(self, scope, receive, send):
+        if self.draining:
+            await send({"type": "http.response.start", "status": 503,
+                        "headers": [(b"retry-after", b"1"), (b"connection", b"close"), (b"content-length", b"0")]})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        if self.executor is None:
+            # Server without lifespan support
+            await self.startup()
+        self.in_flight += 1
+        self._idle.clear()
+        body = None
+        try:
+            body = await self._read_body(receive)
+            environ = wsgi_environ(scope, body)
+            endpoint = self._native_endpoint(environ)
+            response = await self._native(environ, endpoint) if endpoint else None
+            if response is None:
+                await asyncio.get_running_loop().run_in_executor(
+                    self.executor, self._run_wsgi, environ, send, asyncio.get_running_loop()
+                )
+            else:
+                await send({"type": "http.response.start", "status": response.status_code,
+                            "headers": _headers(response.headers.to_wsgi_list())})
+                await send({"type": "http.response.body", "body": response.get_data()})
+        finally:
+            if body is not None:
+                body.close()
+            self.in_flight -= 1
+            if not self.in_flight:
+                self._idle.set()
+
+    async def _read_body(self, receive):
+        body = tempfile.SpooledTemporaryFile(max_size=ASGI_BODY_MEMORY_BYTES)
+        more = True
+        while more:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+            body.write(message.get("body", b""))
+            more = message.get("more_body", False)
+        body.seek(0)
+        return body
+
+    def _native_endpoint(self, environ):
+        """The endpoint when this request can be served on the loop, else None."""
+        if not self.native or environ["REQUEST_METHOD"] != "GET":
+            return None
+        try:
+            endpoint, _ = self.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return None
+        if endpoint in NATIVE_VIEWS:
+            return endpoint
+        view = self.app.view_functions.get(endpoint)
+        if pagecache.PAGE_CACHE_ENABLED and hasattr(view, "cache_topics"):
+            return endpoint
+        return None
+
+    async def _native(self, environ, endpoint):
+        """Run one request on the loop, like Flask's full_dispatch_request; None hands it to Flask."""
+        view = self.app.view_functions[endpoint]
+        handler = NATIVE_VIEWS.get(endpoint)
+        with self.app.request_context(environ):
+            hit = None
+            if handler is None:
+                # Only hits are served here; a miss renders in a worker thread
+                hit = pagecache.cached_response(pagecache.page_key(view.cache_topics))
+                if hit is None:
+                    return None
+            try:
+                try:
+                    rv = self.app.preprocess_request()
+                    if rv is None:
+                        rv = await authorize(view)
+                    if rv is None:
+                        rv = hit if handler is None else await handler(view, **request.view_args)
+                except Exception as e:
+                    rv = self.app.handle_user_exception(e)
+                return self.app.finalize_request(rv)
+            except Exception as e:
+                return self.app.handle_exception(e)
+
+    def _run_wsgi(self, environ, send, loop):
+        """Run the Flask app for one request in a worker thread, relaying the response to ``send``.
+
+        The whole exchange stays on this thread, so streamed responses keep
+        their request context; each chunk waits until the server took it.
+        """
+        def emit(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [int(status.split(" ", 1)[0]), _headers(headers)]
+
+        body = self.app(environ, start_response)
+        try:
+            emit({"type": "http.response.start", "status": started[0], "headers": started[1]})
+            for chunk in body:
+                if chunk:
+                    emit({"type": "http.response.body", "body": chunk, "more_body": True})
+            emit({"type": "http.response.body", "body": b""})
+        finally:
+            close = getattr(body, "close", None)
+            if close is not None:
+                close()
+
+
+application = CargoASGI(app)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(
+        "asgi:application", host=ASGI_HOST, port=ASGI_PORT, workers=ASGI_WORKERS,
+        lifespan="on", timeout_graceful_shutdown=int(ASGI_DRAIN_SECONDS),
+    )
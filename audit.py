@@ -0,0 +1,174 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from flask import has_request_context, request, session
+from mysql.connector import Error
+
+from db import pool
+
+
+AUDIT_ENABLED = os.environ.get("AUDIT", "1") != "0"
+# Entries held in memory waiting to be written
+AUDIT_BUFFER_SIZE = int(os.environ.get("AUDIT_BUFFER_SIZE", "10000"))
+# Rows per multi-row INSERT; a full batch is written at once, a partial one after the interval
+AUDIT_BATCH = int(os.environ.get("AUDIT_BATCH", "500"))
+AUDIT_FLUSH_SECONDS = float(os.environ.get("AUDIT_FLUSH_SECONDS", "1.0"))
+# With the buffer full, a request waits this long for room before its entry is dropped
+AUDIT_MAX_WAIT_SECONDS = float(os.environ.get("AUDIT_MAX_WAIT_SECONDS", "0.5"))
+# How long process exit waits for the buffer to drain
+AUDIT_SHUTDOWN_SECONDS = float(os.environ.get("AUDIT_SHUTDOWN_SECONDS", "10"))
+
+log = logging.getLogger(__name__)
+
+INSERT_SQL = """
+    INSERT INTO system_logs (user_id, action, table_affected, record_id, old_values, new_values,
+                             ip_address, user_agent)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+
+def diff(old, new):
+    """The keys of ``new`` whose values differ from ``old``, as (before, after) dicts."""
+    old = old or {}
+    changed = [k for k, v in new.items() if old.get(k) != v]
+    return {k: old.get(k) for k in changed}, {k: new[k] for k in changed}
+
+
+def _json(values):
+    # Decimals and dates come straight from records
+    return None if values is None else json.dumps(values, default=str)
+
+
+class AuditLog:
+    """Buffers system_logs rows in memory and writes them in batches from a background thread.
+
+    ``record`` only appends to a bounded buffer, so auditing costs a request
+    a lock and a tuple rather than a round trip. When the buffer is full the
+    request waits up to ``max_wait`` for the writer to make room, then drops
+    the entry (counted in ``dropped``). Whatever is buffered at process exit
+    is written before the interpreter stops.
+    """
+
+    def __init__(self, capacity=AUDIT_BUFFER_SIZE, batch_size=AUDIT_BATCH, interval=AUDIT_FLUSH_SECONDS,
+                 max_wait=AUDIT_MAX_WAIT_SECONDS):
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_wait = max_wait
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.write_errors = 0
+        self._buffer = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = None
+        self._pid = None
+
+    @property
+    def depth(self):
+        return len(self._buffer)
+
+    def record(self, action, table=None, record_id=None, old=None, new=None, user_id=None):
+        """Queue one audit row; ``old``/``new`` are reduced to the keys that changed."""
+        if not AUDIT_ENABLED:
+            return True
+        if old is not None and new is not None:
+            old, new = diff(old, new)
+        ip = agent = None
+        if has_request_context():
+            ip = request.remote_addr
+            agent = request.user_agent.string or None
+            if user_id is None:
+                user_id = session.get("user_id")
+        entry = (user_id, action, table, record_id, old, new, ip, agent)
+
+        with self._cond:
+            self._ensure_writer()
+            if len(self._buffer) >= self.capacity:
+                self._cond.notify_all()
+                if not self._cond.wait_for(lambda: len(self._buffer) < self.capacity, self.max_wait):
+                    self.dropped += 1
+                    log.warning("Audit buffer full; dropped %s on %s %s", action, table, record_id)
+                    return False
+            self._buffer.append(entry)
+            self.recorded += 1
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()
+        return True
+
+    def _ensure_writer(self):
+        # Started on first use, and again in a forked worker, which inherits the object but not the thread
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def _take(self):
+        n = min(len(self._buffer), self.batch_size)
+        batch = [self._buffer.popleft() for _ in range(n)]
+        self._cond.notify_all()   # wakes requests waiting for room
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self._buffer) >= self.batch_size or self._closed, self.interval)
+                batch = self._take()
+                closing = self._closed
+            if batch and not self._write(batch):
+                if closing:
+                    self.dropped += len(batch)
+                    continue
+                with self._cond:
+                    # Keep the rows for the next attempt if there's room, oldest first
+                    room = self.capacity - len(self._buffer)
+                    self._buffer.extendleft(reversed(batch[:room]))
+                    self.dropped += len(batch) - max(room, 0)
+                time.sleep(self.interval)
+            if closing and not self._buffer:
+                return
+
+    def _write(self, batch):
+        rows = [(user_id, action, table, record_id, _json(old), _json(new), ip, agent)
+                for user_id, action, table, record_id, old, new, ip, agent in batch]
+        try:
+            with pool.connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.executemany(INSERT_SQL, rows)
+                    conn.commit()
+                finally:
+                    cursor.close()
+        except Error:
+            self.write_errors += 1
+            log.exception("Writing %d audit rows failed", len(rows))
+            return False
+        self.written += len(rows)
+        return True
+
+    def flush(self, timeout=AUDIT_SHUTDOWN_SECONDS):
+        """Stop the writer after it has written everything buffered (or ``timeout`` passes)."""
+        with self._cond:
+            thread = self._thread
+            if thread is None or self._pid != os.getpid():
+                return
+            self._closed = True
+            self._cond.notify_all()
+        thread.join(timeout)
+        if thread.is_alive():
+            log.error("Audit writer still busy after %ss; %d entries may be lost", timeout, len(self._buffer))
+        with self._cond:
+            if self._thread is thread:
+                self._thread = None
+
+
+audit = AuditLog()
+atexit.register(audit.flush)
@@ -0,0 +1,194 @@
+import bisect
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+from cache import TTLCache
+
+
+# ---------- SETTINGS ----------
+# Any werkzeug method string, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:1000000".
+# Stored hashes made with other parameters are upgraded on the user's next login.
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+PASSWORD_SALT_LENGTH = int(os.environ.get("PASSWORD_SALT_LENGTH", "16"))
+# 0 hashes on the request thread (development); otherwise a process pool of this size
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", str(max((os.cpu_count() or 2) // 2, 1))))
+# Hashes allowed to wait for a worker; beyond this requests are turned away at once
+HASH_MAX_QUEUE = int(os.environ.get("HASH_MAX_QUEUE", "32"))
+HASH_TIMEOUT_SECONDS = float(os.environ.get("HASH_TIMEOUT_SECONDS", "5"))
+
+# Token buckets: BURST attempts at once, refilled at PER_MINUTE
+LOGIN_USER_BURST = int(os.environ.get("LOGIN_USER_BURST", "5"))
+LOGIN_USER_PER_MINUTE = float(os.environ.get("LOGIN_USER_PER_MINUTE", "5"))
+LOGIN_IP_BURST = int(os.environ.get("LOGIN_IP_BURST", "20"))
+LOGIN_IP_PER_MINUTE = float(os.environ.get("LOGIN_IP_PER_MINUTE", "30"))
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class HashingBusy(Exception):
+    """Raised instead of queueing when the hashing pool is saturated."""
+
+
+def canonical_method(method):
+    """Spell out werkzeug's defaults so a method compares equal to a stored hash prefix."""
+    name, *args = method.split(":")
+    if name == "scrypt" and not args:
+        return "scrypt:32768:8:1"
+    if name == "pbkdf2":
+        hash_name = args[0] if args else "sha256"
+        iterations = args[1] if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    return method
+
+
+# ---------- RATE LIMITING ----------
+class RateLimiter:
+    """Per-key token buckets. ``take`` returns 0 when allowed, else seconds until the next token.
+
+    Buckets live in a bounded LRU, so under a flood of distinct keys the
+    least recently seen ones are forgotten (i.e. reset to full).
+    """
+
+    def __init__(self, burst, per_minute, maxsize=100000):
+        self.burst = burst
+        self.rate = per_minute / 60.0
+        self._buckets = TTLCache(maxsize=maxsize, ttl=burst / self.rate if self.rate else 3600)
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def take(self, key):
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key) or (self.burst, now)
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self._buckets.set(key, (tokens, now))
+                self.rejected += 1
+                return (1 - tokens) / self.rate if self.rate else 60.0
+            self._buckets.set(key, (tokens - 1, now))
+            return 0
+
+
+login_ip_limits = RateLimiter(LOGIN_IP_BURST, LOGIN_IP_PER_MINUTE)
+login_user_limits = RateLimiter(LOGIN_USER_BURST, LOGIN_USER_PER_MINUTE)
+
+
+def login_retry_after(ip, username):
+    """Charge one attempt to both the client IP and the username; returns seconds to wait or 0."""
+    return max(login_ip_limits.take(ip or "-"), login_user_limits.take((username or "").strip().lower()))
+
+
+# ---------- HASHING ----------
+class PasswordHasher:
+    """Runs werkzeug hashing on a bounded process pool so a login burst can't pin the web workers.
+
+    At most ``workers + max_queue`` hashes are in flight, counting ones whose
+    caller has timed out but which are still queued or running; past that,
+    ``hash``/``verify`` raise HashingBusy rather than queue unboundedly.
+    """
+
+    def __init__(self, method=PASSWORD_HASH_METHOD, salt_length=PASSWORD_SALT_LENGTH,
+                 workers=HASH_WORKERS, max_queue=HASH_MAX_QUEUE, timeout=HASH_TIMEOUT_SECONDS):
+        self.method = canonical_method(method)
+        self.salt_length = salt_length
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(workers, 1) + max_queue)
+        self._executor = None
+        self._lock = threading.Lock()
+        # metrics
+        self.in_flight = 0
+        self.busy_rejections = 0
+        self.latency_counts = {"hash": [0] * (len(LATENCY_BUCKETS) + 1), "verify": [0] * (len(LATENCY_BUCKETS) + 1)}
+        self.latency_sum = {"hash": 0.0, "verify": 0.0}
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: forking a process that is already running threads isn't safe
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _release(self, _future=None):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def _run(self, op, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.busy_rejections += 1
+            raise HashingBusy()
+        start = time.perf_counter()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            if not self.workers:
+                try:
+                    return fn(*args)
+                finally:
+                    self._release()
+            try:
+                future = self._pool().submit(fn, *args)
+            except BaseException:
+                self._release()
+                raise
+            # The slot is held until the job is really finished or cancelled, so
+            # work abandoned by a timed-out caller still counts against the bound
+            future.add_done_callback(self._release)
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeout:
+                future.cancel()
+                raise HashingBusy() from None
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed); start a fresh pool on the next call
+            self.shutdown()
+            raise HashingBusy() from None
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.latency_counts[op][bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+                self.latency_sum[op] += elapsed
+
+    def hash(self, password):
+        return self._run("hash", generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, password_hash, password):
+        return self._run("verify", check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        return password_hash.split("$", 1)[0] != self.method
+
+    @property
+    def queue_depth(self):
+        return max(self.in_flight - max(self.workers, 1), 0)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "method": self.method,
+                "workers": self.workers,
+                "in_flight": self.in_flight,
+                "queue_depth": self.queue_depth,
+                "busy_rejections": self.busy_rejections,
+                "rate_limited": {"ip": login_ip_limits.rejected, "user": login_user_limits.rejected},
+                "latency_buckets": list(LATENCY_BUCKETS),
+                "latency_counts": {op: list(c) for op, c in self.latency_counts.items()},
+                "latency_sum": dict(self.latency_sum),
+            }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,248 @@
+"""Requests/sec of the sync (WSGI) and ASGI serving modes side by side at 1, 100 and 1000 clients.
+
+    python benchmarks/seed.py --scale small
+    gunicorn -w 4 --threads 8 -b 127.0.0.1:5000 app:app &     # or: python app.py
+    ASGI_WORKERS=4 python asgi.py &                           # serves on :8000
+    python benchmarks/asgi_concurrency.py --sync http://127.0.0.1:5000 --asgi http://127.0.0.1:8000
+
+Run both servers against the same database with the same number of worker
+processes. Each client is one keep-alive connection issuing requests back to
+back; all of them run on one asyncio loop here, so 1000 clients cost the
+benchmark 1000 sockets rather than 1000 threads (raise `ulimit -n` on both
+sides). Routes:
+
+    track      public tracking page for a seeded tracking ID
+    track_api  the same as JSON
+    invoices   a logged-in customer's invoice page (--sessions customers share the clients)
+
+Tracking IDs come from the seed manifest. Both modes serve repeat reads from
+the same in-process caches, so the numbers compare how each mode waits on
+MySQL and on the client, not how often it queries. Anything but a 200 (or a
+timeout) counts as an error.
+"""
+import argparse
+import asyncio
+import http.cookiejar
+import json
+import os
+import random
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+MANIFEST = os.path.join(os.path.dirname(os.path.abspath(__file__)), "seed_manifest.json")
+ROUTES = ("track", "track_api", "invoices")
+LEVELS = (1, 100, 1000)
+
+
+# ---------- HTTP CLIENT ----------
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def login_cookie(base_url, username, password):
+    """Log in once over urllib and return the Cookie header of the new session."""
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar), _NoRedirect)
+    body = urllib.parse.urlencode({"username": username, "password": password, "userType": "customer"}).encode()
+    try:
+        opener.open(base_url.rstrip("/") + "/login", body, timeout=30).read()
+    except urllib.error.HTTPError as e:
+        e.read()
+    cookies = "; ".join(f"{c.name}={c.value}" for c in jar)
+    if not cookies:
+        raise SystemExit(f"login as {username} on {base_url} failed; was the database seeded?")
+    return cookies
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection; reconnects when the server closes it."""
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = self.writer = None
+
+    async def _connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    async def get(self, path, headers=""):
+        """Status of GET ``path``, with the whole body read."""
+        try:
+            return await asyncio.wait_for(self._get(path, headers), self.timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            self.close()
+            return None
+
+    async def _get(self, path, headers):
+        if self.writer is None:
+            await self._connect()
+        self.writer.write(f"GET {path} HTTP/1.1\r\nHost: {self.host}\r\n{headers}\r\n".encode())
+        await self.writer.drain()
+        status = int((await self.reader.readuntil(b"\r\n")).split()[1])
+        length, chunked, close = None, False, False
+        while (line := await self.reader.readuntil(b"\r\n")) != b"\r\n":
+            name, _, value = line.decode("latin-1").partition(":")
+            name, value = name.strip().lower(), value.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "transfer-encoding":
+                chunked = "chunked" in value
+            elif name == "connection":
+                close = value == "close"
+        if chunked:
+            while size := int((await self.reader.readuntil(b"\r\n")).split(b";")[0], 16):
+                await self.reader.readexactly(size + 2)
+            await self.reader.readuntil(b"\r\n")
+        elif length is not None:
+            await self.reader.readexactly(length)
+        else:
+            await self.reader.read()
+            close = True
+        if close:
+            self.close()
+        return status
+
+
+# ---------- MEASUREMENT ----------
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def request_for(route, rng, manifest, cookies):
+    if route == "invoices":
+        return "/customer/view_invoices", f"Cookie: {rng.choice(cookies)}\r\n"
+    tracking_id = rng.choice(manifest["tracking_ids"])
+    return (f"/api/track/{tracking_id}" if route == "track_api" else f"/track/{tracking_id}"), ""
+
+
+async def run_level(base_url, route, clients, args, manifest, cookies):
+    url = urllib.parse.urlsplit(base_url)
+    latencies, errors = [], 0
+    start_at = time.monotonic() + args.warmup
+    stop_at = start_at + args.duration
+
+    async def client(index):
+        nonlocal errors
+        rng = random.Random(args.seed * 100000 + index)
+        conn = Connection(url.hostname, url.port or 80, args.timeout)
+        # Spread connection setup so 1000 clients don't all SYN in the same millisecond
+        await asyncio.sleep(rng.random() * min(args.warmup, 1.0))
+        try:
+            while (start := time.monotonic()) < stop_at:
+                path, headers = request_for(route, rng, manifest, cookies)
+                status = await conn.get(path, headers)
+                if start >= start_at:
+                    latencies.append(time.monotonic() - start)
+                    errors += status != 200
+                if status is None:
+                    await asyncio.sleep(0.05)   # don't spin on a refused or reset connection
+        finally:
+            conn.close()
+
+    await asyncio.gather(*(client(i) for i in range(clients)))
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / args.duration, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def raise_file_limit(needed):
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(needed, hard), hard))
+        if hard < needed:
+            print(f"Warning: only {hard} open files allowed; the top level will see connection errors",
+                  file=sys.stderr)
+
+
+async def main_async(args, manifest, modes, routes, levels):
+    cookies = {}
+    if "invoices" in routes:
+        rng = random.Random(args.seed)
+        names = [f"bench_c{rng.randrange(manifest['customers'])}" for _ in range(args.sessions)]
+        for mode, base_url in modes.items():
+            cookies[mode] = [login_cookie(base_url, name, manifest["password"]) for name in names]
+
+    print(f"{args.duration:g}s per run after {args.warmup:g}s warmup")
+    print(f"{'route':<12}{'clients':>8}{'mode':>6}{'reqs':>9}{'err':>7}{'rps':>10}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    results = {}
+    for route in routes:
+        for clients in levels:
+            for mode, base_url in modes.items():
+                r = await run_level(base_url, route, clients, args, manifest, cookies.get(mode, []))
+                results.setdefault(route, {}).setdefault(str(clients), {})[mode] = r
+                print(f"{route:<12}{clients:>8}{mode:>6}{r['requests']:>9}{r['errors']:>7}{r['rps']:>10.1f}"
+                      f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}")
+            row = results[route][str(clients)]
+            if len(row) == 2 and row["sync"]["rps"]:
+                print(f"{'':<12}{'':>8}{'':>6}  asgi/sync throughput: {row['asgi']['rps'] / row['sync']['rps']:.2f}x")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sync", help="base URL of the WSGI server")
+    parser.add_argument("--asgi", help="base URL of the ASGI server (python asgi.py)")
+    parser.add_argument("--manifest", default=MANIFEST)
+    parser.add_argument("--routes", default=",".join(ROUTES), help="comma-separated subset of: " + ", ".join(ROUTES))
+    parser.add_argument("--levels", default=",".join(map(str, LEVELS)), help="concurrent clients per run")
+    parser.add_argument("--duration", type=float, default=15, help="measured seconds per run")
+    parser.add_argument("--warmup", type=float, default=3, help="unmeasured seconds per run")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds before a request counts as failed")
+    parser.add_argument("--sessions", type=int, default=20, help="customers logged in for the invoices route")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    modes = {mode: url for mode, url in (("sync", args.sync), ("asgi", args.asgi)) if url}
+    if not modes:
+        parser.error("give --sync and/or --asgi")
+    routes = [r.strip() for r in args.routes.split(",") if r.strip()]
+    unknown = [r for r in routes if r not in ROUTES]
+    if unknown:
+        parser.error("unknown routes: " + ", ".join(unknown))
+    levels = [int(n) for n in args.levels.split(",") if n.strip()]
+
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+    if not manifest.get("tracking_ids"):
+        parser.error("the manifest has no tracking_ids; re-run benchmarks/seed.py")
+    raise_file_limit(max(levels) + 100)
+
+    results = asyncio.run(main_async(args, manifest, modes, routes, levels))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({
+                "bookings": manifest["bookings"], "duration": args.duration, "modes": modes,
+                "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "routes": results,
+            }, f, indent=2)
+        print(f"\nResults written to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
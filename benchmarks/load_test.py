@@ -0,0 +1,284 @@
+"""Drive the main routes with concurrent clients and report latency percentiles.
+
+    python benchmarks/seed.py --scale small
+    LOGIN_IP_BURST=100000 LOGIN_USER_BURST=100000 python app.py &
+    python benchmarks/load_test.py --server-pid $! --save-baseline benchmarks/baseline.json
+    ... change something ...
+    python benchmarks/load_test.py --server-pid $! --baseline benchmarks/baseline.json
+
+Each route runs for --duration seconds with --concurrency client threads,
+each holding its own logged-in session. Reports throughput, p50/p95/p99
+latency, errors and (with --server-pid, Linux only) the server's peak RSS
+while that route ran. With --baseline, exits non-zero when a route's p95 or
+throughput regresses by more than --tolerance.
+
+Note that update_status writes: it adds tracking updates to seeded bookings.
+The login rate limits must be raised on the server, as above, or the login
+route will mostly measure 429s.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+MANIFEST = os.path.join(os.path.dirname(os.path.abspath(__file__)), "seed_manifest.json")
+STATUSES = ("confirmed", "picked_up", "in_transit", "at_hub", "out_for_delivery")
+
+
+# ---------- HTTP CLIENT ----------
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Client:
+    """One browser-like session: keeps cookies, doesn't follow redirects, reads whole bodies."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect
+        )
+
+    def request(self, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        try:
+            with self.opener.open(self.base_url + path, body, timeout=60) as resp:
+                resp.read()
+                return resp.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+    def login(self, username, password, role):
+        return self.request("/login", {"username": username, "password": password, "userType": role})
+
+
+# ---------- SCENARIOS ----------
+# name -> (picks the user to log in as, or None; fn(client, rng, manifest) -> HTTP status;
+#          statuses that count as success). GETs must return 200: a 302 means the session was lost.
+def _customer(manifest, rng):
+    return f"bench_c{rng.randrange(manifest['customers'])}", "customer"
+
+
+def _employee(manifest, rng):
+    return f"bench_e{rng.randrange(manifest['employees'])}", "employee"
+
+
+def _admin(manifest, rng):
+    return manifest["admin_username"], "admin"
+
+
+def customer_dashboard(client, rng, manifest):
+    return client.request("/customer/dashboard")
+
+
+def update_status(client, rng, manifest):
+    low, high = manifest["booking_ids"]
+    booking_id = rng.randint(low, high)
+    return client.request(f"/employee/update_status/{booking_id}", {
+        "status": rng.choice(STATUSES), "location": "Load test",
+    })
+
+
+def manage_cargo(client, rng, manifest):
+    return client.request("/admin/manage_cargo")
+
+
+def generate_reports(client, rng, manifest):
+    # A month of bookings ending at the seed anchor, streamed as CSV
+    anchor = time.strptime(manifest["anchor"], "%Y-%m-%d")
+    end = time.strftime("%Y-%m-%d", anchor)
+    start = time.strftime("%Y-%m-%d", time.localtime(time.mktime(anchor) - 30 * 86400))
+    return client.request(f"/admin/generate_reports?date_from={start}&date_to={end}")
+
+
+def login(client, rng, manifest):
+    username, role = _customer(manifest, rng)
+    return client.login(username, manifest["password"], role)
+
+
+SCENARIOS = {
+    "customer_dashboard": (_customer, customer_dashboard, (200,)),
+    "update_status": (_employee, update_status, (302,)),
+    "manage_cargo": (_admin, manage_cargo, (200,)),
+    "generate_reports": (_admin, generate_reports, (200,)),
+    "login": (None, login, (302,)),
+}
+
+
+# ---------- MEASUREMENT ----------
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class RssSampler(threading.Thread):
+    """Polls /proc/<pid>/status and keeps the highest VmRSS seen since the last reset."""
+
+    def __init__(self, pid, interval=0.05):
+        super().__init__(daemon=True)
+        self.path = f"/proc/{pid}/status"
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop_event = threading.Event()
+
+    def _rss_kb(self):
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1])
+        except OSError:
+            pass
+        return 0
+
+    def reset(self):
+        self.peak_kb = self._rss_kb()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.peak_kb = max(self.peak_kb, self._rss_kb())
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def run_route(name, args, manifest, sampler):
+    who, fn, ok_statuses = SCENARIOS[name]
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.warmup + args.duration
+    measure_from = time.monotonic() + args.warmup
+
+    def worker(index):
+        nonlocal errors
+        rng = random.Random(args.seed * 1000 + index)
+        client = Client(args.base_url)
+        if who:
+            username, role = who(manifest, rng)
+            if client.login(username, manifest["password"], role) != 302:
+                print(f"\n{name}: login as {username} failed; was the database seeded?", file=sys.stderr)
+                return
+        local, local_errors = [], 0
+        while True:
+            start = time.monotonic()
+            if start >= deadline:
+                break
+            status = fn(client, rng, manifest)
+            elapsed = time.monotonic() - start
+            if start >= measure_from:
+                local.append(elapsed)
+                local_errors += status not in ok_statuses
+        with lock:
+            latencies.extend(local)
+            errors += local_errors
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    if sampler:
+        sampler.reset()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / args.duration, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "peak_rss_mb": round(sampler.peak_kb / 1024, 1) if sampler else None,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print deltas against ``baseline``; return the names of regressed routes."""
+    regressed = []
+    print(f"\n{'vs baseline':<20}{'rps':>10}{'p95':>10}{'p99':>10}")
+    for name, r in results.items():
+        base = baseline.get("routes", {}).get(name)
+        if not base:
+            continue
+
+        def delta(key):
+            return (r[key] - base[key]) / base[key] * 100 if base[key] else 0.0
+        d_rps, d_p95, d_p99 = delta("rps"), delta("p95_ms"), delta("p99_ms")
+        flag = ""
+        if d_rps < -tolerance * 100 or d_p95 > tolerance * 100:
+            regressed.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<20}{d_rps:>+9.1f}%{d_p95:>+9.1f}%{d_p99:>+9.1f}%{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--manifest", default=MANIFEST)
+    parser.add_argument("--routes", default=",".join(SCENARIOS), help="comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20, help="measured seconds per route")
+    parser.add_argument("--warmup", type=float, default=3, help="unmeasured seconds per route")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--server-pid", type=int, help="sample this process's RSS (Linux)")
+    parser.add_argument("--baseline", help="compare against a JSON file written by --save-baseline")
+    parser.add_argument("--save-baseline", help="write results to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed p95/rps regression (fraction)")
+    args = parser.parse_args()
+
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+    routes = [r.strip() for r in args.routes.split(",") if r.strip()]
+    unknown = [r for r in routes if r not in SCENARIOS]
+    if unknown:
+        parser.error("unknown routes: " + ", ".join(unknown))
+
+    sampler = None
+    if args.server_pid:
+        sampler = RssSampler(args.server_pid)
+        sampler.start()
+
+    print(f"{manifest['bookings']:,} bookings, {args.concurrency} clients, {args.duration:g}s per route")
+    print(f"{'route':<20}{'reqs':>8}{'err':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak RSS':>10}")
+    results = {}
+    for name in routes:
+        r = results[name] = run_route(name, args, manifest, sampler)
+        rss = f"{r['peak_rss_mb']:.0f} MB" if r["peak_rss_mb"] is not None else "-"
+        print(f"{name:<20}{r['requests']:>8}{r['errors']:>6}{r['rps']:>9.1f}"
+              f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}{rss:>10}")
+    if sampler:
+        sampler.stop()
+
+    report = {
+        "bookings": manifest["bookings"], "concurrency": args.concurrency,
+        "duration": args.duration, "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "routes": results,
+    }
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline written to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("bookings") != manifest["bookings"] or baseline.get("concurrency") != args.concurrency:
+            print("\nWarning: baseline was recorded at a different scale or concurrency")
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
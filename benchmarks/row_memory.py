@@ -0,0 +1,151 @@
+"""Measure the memory a page of booking rows costs in each row representation.
+
+    python benchmarks/row_memory.py                  # 100k synthetic rows, no database needed
+    python benchmarks/row_memory.py --rows 20000 --db  # also fetch real rows from the seeded database
+
+Compares what the listing pages used to hold (one dict per row with every
+cargo_bookings column, as ``cursor(dictionary=True)`` + ``SELECT b.*``
+returns) with what they hold now (a record of just the projected columns,
+from queries.CARGO_LIST). Synthetic values are shaped like benchmarks/seed.py
+output; each variant builds its own values, as a driver would. Sizes are
+the sys.getsizeof of the list, each row container and each distinct value
+object, so values shared between rows (small ints, interned strings) count
+once.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import queries  # noqa: E402
+
+# SELECT b.*, u.username on the cargo page, in table order
+ALL_COLUMNS = (
+    "booking_id", "tracking_id", "customer_id", "sender_name", "sender_address", "sender_phone",
+    "recipient_name", "recipient_address", "recipient_phone", "cargo_description", "weight", "dimensions",
+    "cargo_value", "booking_date", "expected_delivery_date", "actual_delivery_date", "status",
+    "assigned_employee_id", "total_amount", "payment_status", "special_instructions",
+    "latest_status", "latest_location", "latest_update_at", "latest_update_id", "username",
+)
+
+
+def projected_columns(query):
+    """Output names of a registered query's SELECT list."""
+    select = re.search(r"SELECT (.*?) FROM ", query).group(1)
+    return tuple(re.split(r"[ .]", item.strip())[-1] for item in select.split(","))
+
+
+def make_value(column, i, rng):
+    # Fresh objects per call, like a driver decoding a row
+    now = datetime(2026, 1, 1) - timedelta(seconds=i * 37)
+    if column.endswith("_id") or column == "latest_update_id":
+        return i + rng.randrange(1000)
+    if column in ("weight", "cargo_value", "total_amount"):
+        return Decimal(f"{rng.uniform(1, 5000):.2f}")
+    if column.endswith("_date") or column.endswith("_at"):
+        return now
+    if column.endswith("_address"):
+        return f"{rng.randrange(1, 999)} Harbour Road, Warehouse District, Kochi {682000 + i % 100}, India"
+    if column in ("cargo_description", "special_instructions"):
+        return "General cargo, palletised, keep dry. " * rng.randint(1, 4)
+    if column.endswith("_phone"):
+        return f"+91{rng.randrange(10**9, 10**10)}"
+    if column in ("status", "latest_status"):
+        return rng.choice(("pending", "in_transit", "delivered"))
+    if column == "payment_status":
+        return "unpaid"
+    if column == "tracking_id":
+        return f"CG{i:014d}"
+    return f"{column} {i}"
+
+
+def build(kind, columns, rows, seed):
+    rng = random.Random(seed)
+    if kind == "dict":
+        return [{c: make_value(c, i, rng) for c in columns} for i in range(rows)]
+    make = queries.record_type(columns)._make
+    return [make(make_value(c, i, rng) for c in columns) for i in range(rows)]
+
+
+def deep_size(rows):
+    total, seen = sys.getsizeof(rows), set()
+    for row in rows:
+        total += sys.getsizeof(row)
+        for value in (row.values() if isinstance(row, dict) else row):
+            if id(value) not in seen:
+                seen.add(id(value))
+                total += sys.getsizeof(value)
+    return total
+
+
+HEADER = f"{'representation':<38}{'rows':>9}{'bytes/row':>11}{'MB':>9}{'build s':>9}{'smaller':>9}"
+
+
+def report(label, rows, seconds, baseline=None):
+    size = deep_size(rows)
+    per_row = size / len(rows) if rows else 0
+    ratio = f"{baseline / per_row:>8.1f}x" if baseline and per_row else ""
+    print(f"{label:<38}{len(rows):>9,}{per_row:>11,.0f}{size / 2**20:>9.1f}{seconds:>9.2f}{ratio}")
+    return per_row
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def synthetic(rows, seed):
+    projected = projected_columns(queries.CARGO_LIST)
+    print(f"Synthetic: {rows:,} rows; projected columns: {', '.join(projected)}")
+    print(HEADER)
+    base = report("dict, all columns (before)", *timed(lambda: build("dict", ALL_COLUMNS, rows, seed)))
+    report("record, all columns", *timed(lambda: build("record", ALL_COLUMNS, rows, seed)), base)
+    report("record, projected (after)", *timed(lambda: build("record", projected, rows, seed)), base)
+
+
+def from_database(rows):
+    from db import pool
+
+    order = " ORDER BY b.booking_date DESC, b.booking_id DESC LIMIT %s"
+    legacy = """
+        SELECT b.*, u.username
+        FROM cargo_bookings b
+        JOIN customers c ON b.customer_id = c.customer_id
+        LEFT JOIN users u ON c.user_id = u.user_id
+    """ + order
+
+    print(f"\nDatabase: newest {rows:,} bookings")
+    print(HEADER)
+    with pool.connection() as conn:
+        def fetch_dicts():
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(legacy, (rows,))
+            result = cursor.fetchall()
+            cursor.close()
+            return result
+        base = report("dict cursor, SELECT b.* (before)", *timed(fetch_dicts))
+        report("queries.fetch_all, projected (after)",
+               *timed(lambda: queries.fetch_all(conn, queries.CARGO_LIST + order, (rows,))), base)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", action="store_true", help="also measure real rows (uses the DB_* settings)")
+    args = parser.parse_args()
+
+    synthetic(args.rows, args.seed)
+    if args.db:
+        from_database(args.rows)
+
+
+if __name__ == "__main__":
+    main()
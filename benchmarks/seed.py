@@ -0,0 +1,233 @@
+"""Seed a MySQL database with synthetic users, bookings and tracking history.
+
+    python benchmarks/seed.py --scale small            # 10k bookings
+    python benchmarks/seed.py --scale medium --reset   # 1M bookings, wiping earlier bench data
+    python benchmarks/seed.py --bookings 250000 --seed 7
+
+Uses the same DB_* environment variables as the app and expects the schema
+from README.md (including the latest-status columns). Output is
+deterministic for a given --seed, --bookings and --anchor, so two runs on
+different machines load the same data. A manifest describing what was
+seeded is written for benchmarks/load_test.py.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from auth import PASSWORD_HASH_METHOD  # noqa: E402
+from db import DB_CONFIG  # noqa: E402
+from ids import MAX_NODE, format_tracking_id  # noqa: E402
+
+
+SCALES = {"small": 10_000, "medium": 1_000_000, "large": 10_000_000}
+BATCH = 2000
+TRACKING_SAMPLE = 1000     # tracking IDs listed in the manifest
+MANIFEST = os.path.join(os.path.dirname(os.path.abspath(__file__)), "seed_manifest.json")
+
+CITIES = (
+    "Kochi", "Mumbai", "Delhi", "Chennai", "Bengaluru", "Hyderabad", "Kolkata", "Pune",
+    "Ahmedabad", "Jaipur", "Lucknow", "Surat", "Nagpur", "Indore", "Bhopal", "Visakhapatnam",
+)
+# Lifecycle a shipment walks through; older bookings get further along it
+LIFECYCLE = ("pending", "confirmed", "picked_up", "in_transit", "at_hub", "out_for_delivery", "delivered")
+BOOKING_STATUS = {"at_hub": "in_transit"}
+
+
+def batched(rows, size=BATCH):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def next_id(cursor, table, column):
+    cursor.execute(f"SELECT COALESCE(MAX({column}), 0) + 1 FROM {table}")
+    return cursor.fetchone()[0]
+
+
+def reset(conn):
+    """Delete rows created by earlier seed runs (users named bench_*), children first."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        DELETE tu FROM tracking_updates tu
+        JOIN cargo_bookings cb ON cb.booking_id = tu.booking_id
+        JOIN customers c ON c.customer_id = cb.customer_id
+        JOIN users u ON u.user_id = c.user_id
+        WHERE u.username LIKE 'bench\\_%'
+    """)
+    cursor.execute("""
+        DELETE cb FROM cargo_bookings cb
+        JOIN customers c ON c.customer_id = cb.customer_id
+        JOIN users u ON u.user_id = c.user_id
+        WHERE u.username LIKE 'bench\\_%'
+    """)
+    cursor.execute("DELETE FROM users WHERE username LIKE 'bench\\_%'")   # customers/employees cascade
+    conn.commit()
+    cursor.close()
+
+
+def seed(conn, bookings, rng, anchor, days, password_hash):
+    cursor = conn.cursor()
+    # Bulk-load settings for this session only
+    cursor.execute("SET unique_checks = 0, foreign_key_checks = 0")
+
+    n_customers = max(bookings // 50, 10)
+    n_employees = max(bookings // 2000, 5)
+    user_id = first_user = next_id(cursor, "users", "user_id")
+    customer_id = first_customer = next_id(cursor, "customers", "customer_id")
+    employee_id = first_employee = next_id(cursor, "employees", "employee_id")
+    booking_id = first_booking = next_id(cursor, "cargo_bookings", "booking_id")
+    update_id = next_id(cursor, "tracking_updates", "update_id")
+    # Evenly spaced tracking IDs for the public tracking routes; taken by position, so the data doesn't change
+    tracking_every = max(bookings // TRACKING_SAMPLE, 1)
+    tracking_sample = []
+
+    def users():
+        nonlocal user_id
+        yield (user_id, "bench_admin", password_hash, "bench_admin@example.test", "Bench Admin", "admin")
+        user_id += 1
+        for role, prefix, count in (("customer", "bench_c", n_customers), ("employee", "bench_e", n_employees)):
+            for i in range(count):
+                yield (user_id, f"{prefix}{i}", password_hash, f"{prefix}{i}@example.test", f"Bench {role.title()} {i}", role)
+                user_id += 1
+
+    for batch in batched(users()):
+        cursor.executemany("""
+            INSERT INTO users (user_id, username, password_hash, email, full_name, role, status)
+            VALUES (%s, %s, %s, %s, %s, %s, 'active')
+        """, batch)
+    conn.commit()
+
+    first_customer_user = first_user + 1
+    cursor.executemany("""
+        INSERT INTO customers (customer_id, user_id, customer_code, city) VALUES (%s, %s, %s, %s)
+    """, [(customer_id + i, first_customer_user + i, f"BC{customer_id + i}", rng.choice(CITIES))
+          for i in range(n_customers)])
+    first_employee_user = first_customer_user + n_customers
+    cursor.executemany("""
+        INSERT INTO employees (employee_id, user_id, employee_code, department) VALUES (%s, %s, %s, 'logistics')
+    """, [(employee_id + i, first_employee_user + i, f"BE{employee_id + i}") for i in range(n_employees)])
+    conn.commit()
+
+    start = time.perf_counter()
+    span = days * 86400
+    for done in range(0, bookings, BATCH):
+        booking_rows, update_rows = [], []
+        for _ in range(min(BATCH, bookings - done)):
+            age = rng.random() * span
+            booked = anchor - timedelta(seconds=age)
+            # ~1 step per day of age, capped at delivered; 3% of the rest cancelled
+            steps = min(int(age / 86400) + 1, len(LIFECYCLE))
+            history = list(LIFECYCLE[:steps])
+            if history[-1] != "delivered" and rng.random() < 0.03:
+                history.append("cancelled")
+            status = history[-1]
+            origin, destination = rng.sample(CITIES, 2)
+            weight = round(rng.uniform(0.5, 500), 2)
+            value = round(weight * rng.uniform(20, 200), 2)
+            employee = employee_id + rng.randrange(n_employees)
+            when = booked
+            for step in history:
+                update_rows.append((update_id, booking_id, step, destination if step == "delivered" else origin, employee, when))
+                update_id += 1
+                when += timedelta(hours=rng.uniform(2, 20))
+            last_update = update_rows[-1]
+            # node/sequence taken from booking_id so IDs are unique without a lookup
+            tracking_id = format_tracking_id(
+                int(booked.timestamp() * 1000), (booking_id >> 12) & MAX_NODE, booking_id & 0xFFF
+            )
+            if (booking_id - first_booking) % tracking_every == 0 and len(tracking_sample) < TRACKING_SAMPLE:
+                tracking_sample.append(tracking_id)
+            booking_rows.append((
+                booking_id, tracking_id,
+                customer_id + rng.randrange(n_customers),
+                f"Sender {booking_id}", f"{origin}, India", f"Recipient {booking_id}", f"{destination}, India",
+                "General cargo", weight, value, value, booked, (booked + timedelta(days=5)).date(),
+                last_update[5] if status == "delivered" else None,
+                BOOKING_STATUS.get(status, status), employee,
+                status, last_update[3], last_update[5], last_update[0],
+            ))
+            booking_id += 1
+        cursor.executemany("""
+            INSERT INTO cargo_bookings
+            (booking_id, tracking_id, customer_id, sender_name, sender_address, recipient_name, recipient_address,
+             cargo_description, weight, cargo_value, total_amount, booking_date, expected_delivery_date,
+             actual_delivery_date, status, assigned_employee_id,
+             latest_status, latest_location, latest_update_at, latest_update_id)
+            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+        """, booking_rows)
+        cursor.executemany("""
+            INSERT INTO tracking_updates (update_id, booking_id, status, location, updated_by, update_timestamp)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, update_rows)
+        conn.commit()
+        total = done + len(booking_rows)
+        rate = total / (time.perf_counter() - start)
+        print(f"\r  bookings {total:,}/{bookings:,}  ({rate:,.0f}/s)", end="", flush=True)
+    print()
+
+    cursor.execute("SET unique_checks = 1, foreign_key_checks = 1")
+    cursor.close()
+    return {
+        "customers": n_customers, "employees": n_employees,
+        "customer_usernames": "bench_c{0..%d}" % (n_customers - 1),
+        "employee_usernames": "bench_e{0..%d}" % (n_employees - 1),
+        "admin_username": "bench_admin",
+        "booking_ids": [first_booking, booking_id - 1],
+        "first_customer_id": first_customer, "first_employee_id": first_employee,
+        "tracking_ids": tracking_sample,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--bookings", type=int, help="overrides --scale")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--days", type=int, default=365, help="spread booking dates over this many days")
+    parser.add_argument("--anchor", default="2026-01-01", help="latest booking date (YYYY-MM-DD)")
+    parser.add_argument("--password", default="benchmark")
+    parser.add_argument("--reset", action="store_true", help="delete earlier bench_* data first")
+    args = parser.parse_args()
+
+    bookings = args.bookings or SCALES[args.scale]
+    rng = random.Random(args.seed)
+    anchor = datetime.strptime(args.anchor, "%Y-%m-%d")
+    # One hash shared by every seeded user keeps seeding fast; logins still verify it
+    password_hash = generate_password_hash(args.password, method=PASSWORD_HASH_METHOD)
+
+    conn = mysql.connector.connect(**DB_CONFIG)
+    try:
+        if args.reset:
+            print("Removing earlier bench_* data...")
+            reset(conn)
+        print(f"Seeding {bookings:,} bookings into {DB_CONFIG['database']}@{DB_CONFIG['host']}")
+        started = time.perf_counter()
+        summary = seed(conn, bookings, rng, anchor, args.days, password_hash)
+    finally:
+        conn.close()
+
+    summary.update(
+        bookings=bookings, seed=args.seed, anchor=args.anchor, days=args.days, password=args.password,
+        seconds=round(time.perf_counter() - started, 1),
+    )
+    with open(MANIFEST, "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"Done in {summary['seconds']}s; manifest written to {MANIFEST}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Tracking ID generation rate and index insert locality.
+
+    python benchmarks/tracking_ids.py [--count 200000]
+
+Compares the legacy "TRK" + 8 random digits scheme with ids.TrackingIdGenerator.
+Locality is measured by replaying the generated keys into a sorted list (a
+stand-in for the idx_tracking_id B-tree) and recording where each one lands:
+appends hit the same right-most leaf page, random positions touch a
+different page almost every time.
+"""
+import argparse
+import bisect
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ids import TrackingIdGenerator  # noqa: E402
+
+
+KEYS_PER_PAGE = 300   # ~16 KB InnoDB page / ~50 bytes per secondary index entry
+WINDOW = 1000         # inserts per "batch" when counting distinct leaf pages touched
+
+
+def legacy_tracking_id():
+    return "TRK" + ''.join(random.choices(string.digits, k=8))
+
+
+def rate(fn, count):
+    start = time.perf_counter()
+    fn(count)
+    return count / (time.perf_counter() - start)
+
+
+def locality(keys):
+    """Return (share of inserts that append at the right edge, avg leaf pages touched per WINDOW inserts)."""
+    index = []
+    appends = 0
+    windows = []
+    pages = set()
+    for i, key in enumerate(keys, 1):
+        pos = bisect.bisect_left(index, key)
+        if pos == len(index):
+            appends += 1
+        index.insert(pos, key)
+        pages.add(pos // KEYS_PER_PAGE)
+        if i % WINDOW == 0:
+            windows.append(len(pages))
+            pages = set()
+    return appends / len(keys), sum(windows) / max(len(windows), 1)
+
+
+def collisions(keys):
+    return len(keys) - len(set(keys))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=200000)
+    parser.add_argument("--locality-count", type=int, default=50000)
+    args = parser.parse_args()
+
+    gen = TrackingIdGenerator(node_id=1)
+    rows = [
+        ("legacy random", lambda n: [legacy_tracking_id() for _ in range(n)]),
+        ("snowflake next()", lambda n: [gen.next() for _ in range(n)]),
+        ("snowflake reserve()", gen.reserve),
+    ]
+
+    print(f"{'generator':<22}{'ids/sec':>12}{'collisions':>12}{'append %':>10}{'pages/1k':>10}")
+    for name, fn in rows:
+        per_sec = rate(fn, args.count)
+        sample = fn(args.locality_count)
+        append_ratio, pages = locality(sample)
+        print(f"{name:<22}{per_sec:>12,.0f}{collisions(fn(args.count)):>12}{append_ratio * 100:>9.1f}%{pages:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import os
+from datetime import date, datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+import click
+
+from db import pool
+
+
+TAX_RATE = Decimal(os.environ.get("BILLING_TAX_RATE", "18.00"))   # percent, as in invoices.tax_rate
+DUE_DAYS = int(os.environ.get("BILLING_DUE_DAYS", "30"))
+BILLING_BATCH = int(os.environ.get("BILLING_BATCH", "500"))
+
+CENT = Decimal("0.01")
+
+
+class BillingError(ValueError):
+    pass
+
+
+# ---------- AMOUNTS ----------
+def invoice_amounts(subtotal, tax_rate=TAX_RATE):
+    """Return (subtotal, tax_amount, total_amount) rounded to cents, half-up."""
+    subtotal = Decimal(subtotal).quantize(CENT, ROUND_HALF_UP)
+    tax = (subtotal * Decimal(tax_rate) / 100).quantize(CENT, ROUND_HALF_UP)
+    return subtotal, tax, subtotal + tax
+
+
+# ---------- NUMBERING ----------
+def allocate_invoice_numbers(cursor, count, issue_date):
+    """Reserve ``count`` consecutive numbers in the issue year's series, e.g. INV-2026-0000042.
+
+    The series row stays locked until the caller commits or rolls back, so
+    numbers are gap-free (a rollback hands them back) and every invoice
+    writer is serialized on it, which is also what stops two runs billing
+    the same booking.
+    """
+    series = f"INV-{issue_date.year}"
+    cursor.execute(
+        "INSERT INTO invoice_sequences (series, next_value) VALUES (%s, 1) "
+        "ON DUPLICATE KEY UPDATE next_value = next_value",
+        (series,),
+    )
+    cursor.execute("SELECT next_value FROM invoice_sequences WHERE series = %s FOR UPDATE", (series,))
+    first = cursor.fetchone()[0]
+    cursor.execute("UPDATE invoice_sequences SET next_value = %s WHERE series = %s", (first + count, series))
+    return [f"{series}-{n:07d}" for n in range(first, first + count)]
+
+
+# ---------- WRITE PATH ----------
+_UNINVOICED = """
+    NOT EXISTS (
+        SELECT 1 FROM invoices i
+        WHERE i.booking_id = cb.booking_id AND i.payment_status <> 'cancelled'
+    )
+"""
+
+INSERT_INVOICE_SQL = """
+    INSERT INTO invoices
+    (invoice_number, booking_id, customer_id, subtotal, tax_rate, tax_amount, total_amount,
+     issue_date, due_date, payment_status)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, 'unpaid')
+"""
+
+
+def _invoice_rows(numbers, bookings, tax_rate, issue_date):
+    due = issue_date + timedelta(days=DUE_DAYS)
+    rows = []
+    for number, (booking_id, customer_id, amount) in zip(numbers, bookings):
+        subtotal, tax, total = invoice_amounts(amount, tax_rate)
+        rows.append((number, booking_id, customer_id, subtotal, tax_rate, tax, total, issue_date, due))
+    return rows
+
+
+def create_invoice(cursor, booking_id, subtotal=None, tax_rate=TAX_RATE, issue_date=None):
+    """Invoice one booking on the caller's transaction; returns (invoice_number, total).
+
+    ``subtotal`` defaults to the booking's total_amount. Raises BillingError
+    if the booking doesn't exist or already has a live invoice.
+    """
+    issue_date = issue_date or date.today()
+    # Number first: it takes the series lock that serializes invoice writers
+    number = allocate_invoice_numbers(cursor, 1, issue_date)[0]
+    cursor.execute(f"""
+        SELECT cb.booking_id, cb.customer_id, cb.total_amount, {_UNINVOICED} AS uninvoiced
+        FROM cargo_bookings cb WHERE cb.booking_id = %s
+    """, (booking_id,))
+    row = cursor.fetchone()
+    if not row:
+        raise BillingError("Booking not found.")
+    if not row[3]:
+        raise BillingError("This booking already has an invoice.")
+    invoice = _invoice_rows([number], [(row[0], row[1], row[2] if subtotal is None else subtotal)],
+                            Decimal(tax_rate), issue_date)[0]
+    cursor.execute(INSERT_INVOICE_SQL, invoice)
+    return number, invoice[6]
+
+
+# ---------- BILLING RUNS ----------
+def _find_or_start_run(cursor, date_from, date_to, tax_rate, started_by):
+    cursor.execute("""
+        SELECT run_id, last_booking_id, invoices_created, total_amount, status
+        FROM billing_runs
+        WHERE period_from = %s AND period_to = %s AND tax_rate = %s
+        ORDER BY run_id DESC LIMIT 1
+    """, (date_from, date_to, tax_rate))
+    row = cursor.fetchone()
+    if row and row[4] != "completed":
+        cursor.execute("UPDATE billing_runs SET status = 'running', finished_at = NULL WHERE run_id = %s", (row[0],))
+        return row[0], row[1], row[2], Decimal(row[3])
+    cursor.execute("""
+        INSERT INTO billing_runs (period_from, period_to, tax_rate, status, started_by)
+        VALUES (%s, %s, %s, 'running', %s)
+    """, (date_from, date_to, tax_rate, started_by))
+    return cursor.lastrowid, 0, 0, Decimal("0.00")
+
+
+def run_billing(conn, date_from, date_to, tax_rate=TAX_RATE, batch_size=BILLING_BATCH,
+                issue_date=None, started_by=None, progress=None):
+    """Invoice every delivered, uninvoiced booking delivered in [date_from, date_to].
+
+    Bookings are taken in booking_id order, ``batch_size`` per transaction.
+    Each transaction allocates the numbers, inserts the invoices and moves
+    the run's checkpoint, so an interrupted run resumes where it stopped
+    when started again for the same period and rate. Running a completed
+    period again starts a new run that only picks up bookings delivered or
+    un-invoiced since. Returns a summary dict.
+    """
+    if date_to < date_from:
+        raise BillingError("date_to is before date_from")
+    tax_rate = Decimal(tax_rate).quantize(CENT)
+    issue_date = issue_date or date.today()
+    cursor = conn.cursor()
+    run_id, last_id, created, total = _find_or_start_run(cursor, date_from, date_to, tax_rate, started_by)
+    conn.commit()
+    try:
+        while True:
+            # Take the series lock before looking for work, so a concurrent run or
+            # admin invoice can't bill the same booking between the SELECT and INSERT
+            allocate_invoice_numbers(cursor, 0, issue_date)
+            # idx_status is (status, booking_id) under the hood, so this is a range scan in id order
+            cursor.execute(f"""
+                SELECT cb.booking_id, cb.customer_id, cb.total_amount
+                FROM cargo_bookings cb
+                WHERE cb.status = 'delivered'
+                  AND cb.booking_id > %s
+                  AND cb.actual_delivery_date >= %s AND cb.actual_delivery_date < %s
+                  AND {_UNINVOICED}
+                ORDER BY cb.booking_id
+                LIMIT %s
+            """, (last_id, date_from, date_to + timedelta(days=1), batch_size))
+            bookings = cursor.fetchall()
+            if not bookings:
+                conn.rollback()
+                break
+            numbers = allocate_invoice_numbers(cursor, len(bookings), issue_date)
+            rows = _invoice_rows(numbers, bookings, tax_rate, issue_date)
+            cursor.executemany(INSERT_INVOICE_SQL, rows)
+            last_id = bookings[-1][0]
+            created += len(rows)
+            total += sum(r[6] for r in rows)
+            cursor.execute("""
+                UPDATE billing_runs SET last_booking_id = %s, invoices_created = %s, total_amount = %s
+                WHERE run_id = %s
+            """, (last_id, created, total, run_id))
+            conn.commit()
+            if progress:
+                progress(created, last_id)
+        cursor.execute(
+            "UPDATE billing_runs SET status = 'completed', finished_at = %s WHERE run_id = %s",
+            (datetime.now(), run_id),
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        cursor.execute("UPDATE billing_runs SET status = 'failed' WHERE run_id = %s AND status = 'running'", (run_id,))
+        conn.commit()
+        raise
+    finally:
+        cursor.close()
+    return {"run_id": run_id, "invoices_created": created, "total_amount": total, "last_booking_id": last_id}
+
+
+# ---------- CLI ----------
+@click.command("billing-run")
+@click.option("--from", "date_from", required=True, type=click.DateTime(["%Y-%m-%d"]))
+@click.option("--to", "date_to", required=True, type=click.DateTime(["%Y-%m-%d"]))
+@click.option("--tax-rate", default=str(TAX_RATE), show_default=True, help="Percent.")
+@click.option("--batch-size", default=BILLING_BATCH, show_default=True)
+def billing_run_command(date_from, date_to, tax_rate, batch_size):
+    """Invoice delivered bookings in a delivery-date range; safe to re-run or resume."""
+    def progress(created, last_id):
+        click.echo(f"\r  {created} invoices (through booking {last_id})", nl=False)
+
+    with pool.connection() as conn:
+        summary = run_billing(conn, date_from.date(), date_to.date(), Decimal(tax_rate), batch_size,
+                              progress=progress)
+    click.echo(f"\nBilling run {summary['run_id']}: {summary['invoices_created']} invoices, "
+               f"total {summary['total_amount']}.")
+
+
+def init_app(app):
+    app.cli.add_command(billing_run_command)
@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from ids import tracking_ids
+from tracking import record_tracking_update, record_tracking_updates
+
+
+BOOKING_FIELDS = (
+    "sender_name", "sender_address", "sender_phone",
+    "recipient_name", "recipient_address", "recipient_phone",
+    "cargo_description", "weight", "cargo_value",
+)
+REQUIRED_FIELDS = ("sender_name", "sender_address", "recipient_name", "recipient_address", "weight", "cargo_value")
+DELIVERY_DAYS = 5
+
+INITIAL_STATUS = "pending"
+INITIAL_LOCATION = "Shipment Booked"
+INITIAL_NOTES = "Shipment created by customer"
+
+INSERT_BOOKING_SQL = """
+    INSERT INTO cargo_bookings
+    (tracking_id, customer_id, sender_name, sender_address, sender_phone,
+     recipient_name, recipient_address, recipient_phone, cargo_description,
+     weight, cargo_value, total_amount, status, expected_delivery_date)
+    VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+"""
+
+
+# ---------- TRACKING IDS ----------
+# Time-ordered, node-scoped IDs (see ids.py): unique without a DB check
+def generate_tracking_id():
+    return tracking_ids.next()
+
+
+def generate_tracking_ids(count):
+    return tracking_ids.reserve(count)
+
+
+# ---------- VALIDATION ----------
+def clean_booking(data):
+    """Return (booking, error) where booking holds the stripped BOOKING_FIELDS values."""
+    booking = {f: (str(data.get(f)).strip() if data.get(f) is not None else "") for f in BOOKING_FIELDS}
+    missing = [f for f in REQUIRED_FIELDS if not booking[f]]
+    if missing:
+        return None, "missing " + ", ".join(missing)
+    for field in ("weight", "cargo_value"):
+        try:
+            value = Decimal(booking[field])
+        except InvalidOperation:
+            return None, f"{field} must be a number"
+        if value < 0 or (field == "weight" and value == 0):
+            return None, f"{field} must be positive"
+        booking[field] = value
+    for field in BOOKING_FIELDS:
+        if booking[field] == "":
+            booking[field] = None
+    return booking, None
+
+
+def _booking_params(tracking_id, customer_id, b, expected_delivery):
+    return (
+        tracking_id, customer_id, b["sender_name"], b["sender_address"], b["sender_phone"],
+        b["recipient_name"], b["recipient_address"], b["recipient_phone"], b["cargo_description"],
+        b["weight"], b["cargo_value"], b["cargo_value"], INITIAL_STATUS, expected_delivery,
+    )
+
+
+# ---------- WRITE PATH ----------
+def create_booking(cursor, customer_id, booking, tracking_id):
+    """Insert one booking plus its initial tracking update; returns the booking_id."""
+    expected_delivery = datetime.now().date() + timedelta(days=DELIVERY_DAYS)
+    cursor.execute(INSERT_BOOKING_SQL, _booking_params(tracking_id, customer_id, booking, expected_delivery))
+    booking_id = cursor.lastrowid
+    record_tracking_update(cursor, booking_id, INITIAL_STATUS, INITIAL_LOCATION, INITIAL_NOTES)
+    return booking_id
+
+
+def create_bookings(cursor, customer_id, bookings, tracking_ids):
+    """Bulk form of create_booking; returns {tracking_id: booking_id}.
+
+    Bookings go in as one multi-row INSERT. Their ids are read back through the
+    unique tracking_id index rather than assumed to be consecutive, which
+    InnoDB doesn't guarantee under concurrent inserts.
+    """
+    expected_delivery = datetime.now().date() + timedelta(days=DELIVERY_DAYS)
+    cursor.executemany(INSERT_BOOKING_SQL, [
+        _booking_params(tid, customer_id, b, expected_delivery) for tid, b in zip(tracking_ids, bookings)
+    ])
+    placeholders = ", ".join(["%s"] * len(tracking_ids))
+    cursor.execute(
+        f"SELECT tracking_id, booking_id FROM cargo_bookings WHERE tracking_id IN ({placeholders})",
+        list(tracking_ids),
+    )
+    booking_ids = dict(cursor.fetchall())
+    record_tracking_updates(cursor, [
+        (booking_ids[tid], INITIAL_STATUS, INITIAL_LOCATION, INITIAL_NOTES, None) for tid in tracking_ids
+    ])
+    return booking_ids
@@ -0,0 +1,239 @@
+import csv
+import io
+import os
+
+from mysql.connector import Error
+
+import notifications
+import streams
+from bookings import clean_booking, create_bookings, generate_tracking_ids
+from ids import normalize_tracking_id
+from tracking import normalize_status, record_tracking_updates, set_booking_status
+
+
+BULK_MAX_ITEMS = int(os.environ.get("BULK_MAX_ITEMS", "5000"))
+IMPORT_MAX_ROWS = int(os.environ.get("IMPORT_MAX_ROWS", "100000"))
+IMPORT_CHUNK = int(os.environ.get("IMPORT_CHUNK", "500"))
+# Row-level errors beyond this are counted but not listed
+MAX_REPORTED_ERRORS = 1000
+# Keeps IN (...) lists well under max_allowed_packet and the optimizer's range limits
+LOOKUP_CHUNK = 1000
+
+
+class BulkRequestError(ValueError):
+    pass
+
+
+# ---------- INPUT ----------
+def read_bulk_rows(request, limit=BULK_MAX_ITEMS):
+    """Return (rows, defaults) from a JSON body or an uploaded CSV file.
+
+    JSON: ``{"status": ..., "location": ..., "items": [...]}`` where each item is
+    a dict of column values or a bare tracking ID string. CSV: a ``file`` upload
+    with a header row; other form fields act as defaults.
+    """
+    if request.is_json:
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict) or not isinstance(payload.get("items"), list):
+            raise BulkRequestError('Expected a JSON object with an "items" list')
+        rows = [item if isinstance(item, dict) else {"tracking_id": str(item)} for item in payload["items"]]
+        defaults = {k: v for k, v in payload.items() if k != "items"}
+    else:
+        rows = []
+        for row in iter_csv_upload(request):
+            rows.append(row)
+            if len(rows) > limit:
+                break
+        defaults = request.form.to_dict()
+    if len(rows) > limit:
+        raise BulkRequestError(f"At most {limit} items per request")
+    return rows, defaults
+
+
+def iter_csv_upload(request, field="file"):
+    """Yield rows of an uploaded CSV as dicts with lower-cased keys, without reading it all first."""
+    upload = request.files.get(field)
+    if not upload:
+        raise BulkRequestError(f"Send a JSON body or upload a CSV file as '{field}'")
+    text = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+    for row in csv.DictReader(text):
+        yield {(k or "").strip().lower(): (v or "").strip() for k, v in row.items()}
+
+
+def iter_import_rows(request):
+    if request.is_json:
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict) or not isinstance(payload.get("items"), list):
+            raise BulkRequestError('Expected a JSON object with an "items" list')
+        return iter(payload["items"])
+    # Fail fast on a missing upload instead of on first iteration
+    if not request.files.get("file"):
+        raise BulkRequestError("Send a JSON body or upload a CSV file as 'file'")
+    return iter_csv_upload(request)
+
+
+def _chunks(seq, size=LOOKUP_CHUNK):
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+# ---------- BULK STATUS UPDATE ----------
+def resolve_bookings(cursor, tracking_ids=(), booking_ids=()):
+    """Map tracking IDs and booking IDs to (booking_id, tracking_id, customer_id) with chunked IN lookups."""
+    by_tracking, by_booking = {}, {}
+    for column, values, target in (("tracking_id", list(tracking_ids), by_tracking),
+                                   ("booking_id", list(booking_ids), by_booking)):
+        for chunk in _chunks(values):
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(
+                f"SELECT booking_id, tracking_id, customer_id FROM cargo_bookings WHERE {column} IN ({placeholders})",
+                chunk,
+            )
+            for booking_id, tracking_id, customer_id in cursor.fetchall():
+                target[tracking_id if column == "tracking_id" else booking_id] = (booking_id, tracking_id, customer_id)
+    return by_tracking, by_booking
+
+
+def bulk_update_status(conn, rows, defaults, updated_by=None):
+    """Validate and apply many status changes in one transaction; returns per-item results.
+
+    Items that fail validation are reported and skipped; the valid ones are
+    written with one multi-row tracking insert and one booking UPDATE per
+    distinct status, then committed together.
+    """
+    results = []
+    pending = []   # (result, booking ref key, status, location, notes)
+    tracking_ids, booking_ids = set(), set()
+
+    for index, row in enumerate(rows):
+        result = {"index": index, "ok": False}
+        results.append(result)
+        raw_tracking_id = str(row.get("tracking_id") or "").strip()
+        booking_id = str(row.get("booking_id") or "").strip()
+        raw_status = row.get("status") or defaults.get("status")
+        status = normalize_status(raw_status)
+        if raw_tracking_id:
+            # Reject mistyped scans on the check digit before they cost a lookup
+            tracking_id = normalize_tracking_id(raw_tracking_id)
+            result["tracking_id"] = tracking_id or raw_tracking_id
+            if not tracking_id:
+                result["error"] = "invalid tracking_id"
+                continue
+            key = ("t", tracking_id)
+            tracking_ids.add(tracking_id)
+        elif booking_id.isdigit():
+            result["booking_id"] = int(booking_id)
+            key = ("b", int(booking_id))
+            booking_ids.add(int(booking_id))
+        else:
+            result["error"] = "tracking_id or booking_id is required"
+            continue
+        if not status:
+            result["error"] = f"invalid status: {raw_status!r}"
+            continue
+        location = row.get("location") or defaults.get("location") or None
+        notes = row.get("notes") or defaults.get("notes") or None
+        pending.append((result, key, status, location, notes))
+
+    cursor = conn.cursor()
+    try:
+        by_tracking, by_booking = resolve_bookings(cursor, sorted(tracking_ids), sorted(booking_ids))
+        updates = []
+        events = []
+        final_status = {}   # booking_id -> last status in the batch
+        for result, (kind, ref), status, location, notes in pending:
+            found = (by_tracking if kind == "t" else by_booking).get(ref)
+            if not found:
+                result["error"] = "booking not found"
+                continue
+            booking_id, tracking_id, customer_id = found
+            result.update(booking_id=booking_id, tracking_id=tracking_id, status=status, ok=True)
+            updates.append((booking_id, status, location, notes, updated_by))
+            events.append(streams.status_event(tracking_id, booking_id, customer_id, status, location))
+            final_status[booking_id] = status
+
+        if updates:
+            by_status = {}
+            for booking_id, status in final_status.items():
+                by_status.setdefault(status, []).append(booking_id)
+            for status, ids in by_status.items():
+                for chunk in _chunks(sorted(ids)):
+                    set_booking_status(cursor, chunk, status)
+                    notifications.enqueue_status_change(cursor, chunk, status)
+            record_tracking_updates(cursor, updates)
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    streams.publish(events)
+    return results
+
+
+# ---------- BULK BOOKING IMPORT ----------
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.bookings = []   # {"row", "tracking_id"}
+        self.errors = []     # {"row", "error"}
+
+    def error(self, row_no, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_no, "error": message})
+
+    def as_dict(self):
+        return {
+            "imported": self.imported, "failed": self.failed,
+            "bookings": self.bookings, "errors": self.errors,
+        }
+
+
+def import_bookings(conn, customer_id, rows, chunk_size=IMPORT_CHUNK, max_rows=IMPORT_MAX_ROWS):
+    """Validate and insert bookings for one customer, committing every ``chunk_size`` rows.
+
+    ``rows`` may be any iterable (e.g. a streamed CSV). A chunk that hits a
+    database error is rolled back and its rows reported as failed; earlier
+    chunks stay committed.
+    """
+    result = ImportResult()
+    batch = []
+
+    def flush():
+        cursor = conn.cursor()
+        try:
+            tracking_ids = generate_tracking_ids(len(batch))
+            booking_ids = create_bookings(cursor, customer_id, [b for _, b in batch], tracking_ids)
+            for chunk in _chunks(sorted(booking_ids.values())):
+                notifications.enqueue_booking_created(cursor, chunk)
+            conn.commit()
+        except Error as e:
+            conn.rollback()
+            for row_no, _ in batch:
+                result.error(row_no, f"database error: {e.msg}")
+        else:
+            result.imported += len(batch)
+            result.bookings.extend({"row": row_no, "tracking_id": tid} for (row_no, _), tid in zip(batch, tracking_ids))
+        finally:
+            cursor.close()
+        batch.clear()
+
+    for row_no, row in enumerate(rows, 1):
+        if row_no > max_rows:
+            result.error(row_no, f"import limit of {max_rows} rows reached; remaining rows skipped")
+            break
+        if not isinstance(row, dict):
+            result.error(row_no, "expected an object of booking fields")
+            continue
+        booking, error = clean_booking(row)
+        if error:
+            result.error(row_no, error)
+            continue
+        batch.append((row_no, booking))
+        if len(batch) >= chunk_size:
+            flush()
+    if batch:
+        flush()
+    return result
@@ -0,0 +1,191 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire ``ttl`` seconds after being set."""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING or entry[0] <= time.monotonic():
+                if entry is not _MISSING:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_load(self, key, loader, ttl=None):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value, ttl)
+        return value
+
+    def update(self, key, fn):
+        """Apply ``fn`` to a live entry in place, keeping its expiry. Returns False on a miss."""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING or entry[0] <= time.monotonic():
+                return False
+            self._data[key] = (entry[0], fn(entry[1]))
+            return True
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+            return None if entry is _MISSING else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class LoadingCache:
+    """A TTLCache filled by a loader, where writers invalidate keys after committing.
+
+    A load that began before an invalidation of the same key is returned to
+    its caller but not stored, so a read racing a write can't put the old
+    value back after the writer has cleared it. ``None`` results are cached
+    for ``miss_ttl`` seconds.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60, miss_ttl=None):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # key -> monotonic time of the last invalidation; only has to outlive loads in flight
+        self._invalidated = TTLCache(maxsize=maxsize, ttl=60)
+        self._lock = threading.Lock()
+        self.miss_ttl = ttl if miss_ttl is None else miss_ttl
+
+    def __len__(self):
+        return len(self._cache)
+
+    @property
+    def hits(self):
+        return self._cache.hits
+
+    @property
+    def misses(self):
+        return self._cache.misses
+
+    def get(self, key, loader):
+        value = self._cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        started = time.monotonic()
+        value = loader()
+        self._store(key, value, started)
+        return value
+
+    async def aget(self, key, loader):
+        """``get`` with a coroutine ``loader``, for the ASGI event loop (see asgi.py)."""
+        value = self._cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        started = time.monotonic()
+        value = await loader()
+        self._store(key, value, started)
+        return value
+
+    def _store(self, key, value, started):
+        with self._lock:
+            if self._invalidated.get(key, 0) < started:
+                self._cache.set(key, value, None if value is not None else self.miss_ttl)
+
+    def invalidate(self, *keys):
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                self._invalidated.set(key, now)
+                self._cache.pop(key)
+
+    def clear(self):
+        self._cache.clear()
+
+
+class SizedTTLCache:
+    """Thread-safe LRU cache bounded by the total ``weigh(value)`` of its entries, e.g. bytes.
+
+    Entries expire ``ttl`` seconds after being set. Values heavier than
+    ``max_item`` aren't stored at all, so one huge value can't flush the rest.
+    """
+
+    def __init__(self, maxweight, ttl=60, max_item=None, weigh=len):
+        self.maxweight = maxweight
+        self.max_item = maxweight if max_item is None else max_item
+        self.ttl = ttl
+        self.weigh = weigh
+        self.weight = 0
+        self._data = OrderedDict()   # key -> (expires_at, weight, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def _drop(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.weight -= entry[1]
+        return entry
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value, ttl=None):
+        weight = self.weigh(value)
+        with self._lock:
+            self._drop(key)
+            if weight > self.max_item:
+                return False
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), weight, value)
+            self.weight += weight
+            while self.weight > self.maxweight:
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+            return True
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._drop(key)
+            return None if entry is None else entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import Error
+from flask import g
+
+import instrumentation
+
+
+# ---------- DB CONFIG ----------
+DB_CONFIG = {
+    "host": os.environ.get("DB_HOST", "localhost"),
+    "user": os.environ.get("DB_USER", "root"),
+    "password": os.environ.get("DB_PASSWORD", ""),
+    "database": os.environ.get("DB_NAME", "cargo_db"),
+    "port": int(os.environ.get("DB_PORT", "3306")),
+}
+
+POOL_CONFIG = {
+    "pool_size": int(os.environ.get("DB_POOL_SIZE", "10")),
+    "max_overflow": int(os.environ.get("DB_POOL_MAX_OVERFLOW", "5")),
+    "timeout": float(os.environ.get("DB_POOL_TIMEOUT", "10")),
+    "recycle": int(os.environ.get("DB_POOL_RECYCLE", "3600")),
+}
+
+
+class PoolTimeout(Error):
+    pass
+
+
+# ---------- CONNECTION POOL ----------
+class ConnectionPool:
+    """Thread-safe pool of MySQL connections.
+
+    Keeps up to ``pool_size`` idle connections, opens at most ``max_overflow``
+    extra ones under load, and makes callers wait up to ``timeout`` seconds
+    for a free slot before raising ``PoolTimeout``. Connections are pinged on
+    checkout and replaced when dead or older than ``recycle`` seconds.
+    """
+
+    def __init__(self, config, pool_size=10, max_overflow=5, timeout=10.0, recycle=3600):
+        self.config = dict(config)
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self._idle = []
+        self._born = {}          # id(conn) -> monotonic time it was opened
+        self._size = 0           # open connections plus ones being opened
+        self._checked_out = 0
+        self._cond = threading.Condition()
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def checked_out(self):
+        return self._checked_out
+
+    def _open(self):
+        conn = mysql.connector.connect(**self.config)
+        self._born[id(conn)] = time.monotonic()
+        return conn
+
+    def _close(self, conn):
+        self._born.pop(id(conn), None)
+        try:
+            conn.close()
+        except Error:
+            pass
+
+    def _healthy(self, conn):
+        if self.recycle and time.monotonic() - self._born.get(id(conn), 0) > self.recycle:
+            return False
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Error:
+            return False
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.pool_size + self.max_overflow:
+                    self._size += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(msg=f"Timed out after {self.timeout}s waiting for a DB connection")
+                self._cond.wait(remaining)
+            self._checked_out += 1
+
+        # Ping / connect outside the lock so slow network I/O doesn't block other threads
+        try:
+            if conn is not None and not self._healthy(conn):
+                self._close(conn)
+                conn = None
+            if conn is None:
+                conn = self._open()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._checked_out -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def release(self, conn):
+        # Never hand an open transaction to the next borrower
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            reusable = True
+        except Error:
+            reusable = False
+
+        with self._cond:
+            self._checked_out -= 1
+            if reusable and len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+            else:
+                self._close(conn)
+                self._size -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        with self._cond:
+            while self._idle:
+                self._close(self._idle.pop())
+                self._size -= 1
+
+
+pool = ConnectionPool(DB_CONFIG, **POOL_CONFIG)
+
+
+# ---------- REQUEST-SCOPED CONNECTION ----------
+def get_db():
+    """Return the connection bound to the current app context, checking one out on first use."""
+    if "db_conn" not in g:
+        start = time.perf_counter()
+        conn = pool.acquire()
+        # Wrapped so per-request query count/time are recorded (see instrumentation.py)
+        g.db_conn = instrumentation.instrument(conn, time.perf_counter() - start)
+    return g.db_conn
+
+
+def close_db(exc=None):
+    conn = g.pop("db_conn", None)
+    if conn is not None:
+        pool.release(instrumentation.unwrap(conn))
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
@@ -0,0 +1,215 @@
+import os
+import re
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to a pid-derived node id
+    fcntl = None
+
+
+# ---------- LAYOUT ----------
+# 41 bits of milliseconds since EPOCH_MS | 10 bits node (host, worker) | 12 bits sequence, written as
+# 13 Crockford base32 digits plus one Luhn mod-32 check digit: "TRK" + 14 chars = 17,
+# which fits cargo_bookings.tracking_id VARCHAR(20). Fixed-width big-endian digits sort
+# in creation order, so new rows land on the right edge of idx_tracking_id.
+PREFIX = "TRK"
+EPOCH_MS = 1704067200000          # 2024-01-01T00:00:00Z
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+MAX_NODE = (1 << NODE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+BODY_LENGTH = 13
+
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"   # Crockford base32: no I, L, O, U
+_VALUE = {c: i for i, c in enumerate(ALPHABET)}
+# Characters commonly misread or mistyped for Crockford digits
+_ALIASES = str.maketrans({"O": "0", "I": "1", "L": "1"})
+
+_LEGACY_PATTERNS = (
+    re.compile(r"^TRK\d{8}$"),        # "TRK" + 8 random digits
+    re.compile(r"^[0-9A-F]{8}$"),     # first block of a uuid4
+)
+
+
+class InvalidTrackingId(ValueError):
+    pass
+
+
+# ---------- ENCODING ----------
+def _encode(value):
+    chars = []
+    for _ in range(BODY_LENGTH):
+        value, rem = divmod(value, 32)
+        chars.append(ALPHABET[rem])
+    return "".join(reversed(chars))
+
+
+def _decode(body):
+    value = 0
+    for c in body:
+        value = value * 32 + _VALUE[c]
+    return value
+
+
+def check_digit(body):
+    """Luhn mod-32 check digit: catches any single-character typo and most adjacent swaps."""
+    total = 0
+    factor = 2
+    for c in reversed(body):
+        addend = factor * _VALUE[c]
+        total += addend // 32 + addend % 32
+        factor = 1 if factor == 2 else 2
+    return ALPHABET[(32 - total % 32) % 32]
+
+
+def normalize_tracking_id(value):
+    """Return the canonical form of a tracking ID, or None if it can't be one of ours.
+
+    Accepts lower case, separators and Crockford look-alikes (O/0, I/L/1) for
+    new-style IDs, rejects them when the check digit fails, and passes legacy
+    IDs through so existing shipments stay trackable.
+    """
+    if not value:
+        return None
+    text = re.sub(r"[\s\-#]", "", str(value)).upper()
+    if any(p.match(text) for p in _LEGACY_PATTERNS):
+        return text
+    if not text.startswith(PREFIX):
+        return None
+    rest = text[len(PREFIX):].translate(_ALIASES)
+    if len(rest) != BODY_LENGTH + 1 or any(c not in _VALUE for c in rest):
+        return None
+    body, check = rest[:-1], rest[-1]
+    if check_digit(body) != check:
+        return None
+    return PREFIX + rest
+
+
+def is_valid_tracking_id(value):
+    return normalize_tracking_id(value) is not None
+
+
+def parse_tracking_id(value):
+    """Split a new-style ID into (unix_ms, node, sequence)."""
+    canonical = normalize_tracking_id(value)
+    if not canonical or not canonical.startswith(PREFIX) or len(canonical) != len(PREFIX) + BODY_LENGTH + 1:
+        raise InvalidTrackingId(value)
+    n = _decode(canonical[len(PREFIX):-1])
+    return (n >> (NODE_BITS + SEQUENCE_BITS)) + EPOCH_MS, (n >> SEQUENCE_BITS) & MAX_NODE, n & MAX_SEQUENCE
+
+
+def format_tracking_id(unix_ms, node, sequence):
+    """Inverse of parse_tracking_id, for fixtures that need reproducible IDs."""
+    body = _encode(((unix_ms - EPOCH_MS) << (NODE_BITS + SEQUENCE_BITS)) | (node << SEQUENCE_BITS) | sequence)
+    return PREFIX + body + check_digit(body)
+
+
+# ---------- NODE ID ----------
+# The node bits are split into a host part, set per host, and a worker part
+# claimed by each process, so forked workers on one host never share a node.
+HOST_BITS = int(os.environ.get("TRACKING_HOST_BITS", "5"))
+WORKER_BITS = NODE_BITS - HOST_BITS
+MAX_HOST = (1 << HOST_BITS) - 1
+MAX_WORKER = (1 << WORKER_BITS) - 1
+NODE_DIR = os.environ.get("TRACKING_NODE_DIR", os.path.join(tempfile.gettempdir(), "cargo_tracking_nodes"))
+
+
+def _host_id():
+    if os.environ.get("TRACKING_NODE_ID") is not None:
+        # One fixed node for every process would let forked workers mint the same IDs
+        raise RuntimeError("TRACKING_NODE_ID is no longer supported; set TRACKING_HOST_ID per host instead")
+    host = int(os.environ.get("TRACKING_HOST_ID", "0"))
+    if not 0 <= host <= MAX_HOST:
+        raise ValueError(f"TRACKING_HOST_ID must be between 0 and {MAX_HOST}")
+    return host
+
+
+def _claim_node_id():
+    """Pick this process's node id without a database round trip.
+
+    The host part is TRACKING_HOST_ID (required to differ between hosts that
+    generate IDs). The worker part is the first free slot file under NODE_DIR,
+    exclusively locked for the life of the process.
+    """
+    host = _host_id() << WORKER_BITS
+    if fcntl is None:
+        return host | (os.getpid() & MAX_WORKER), None
+    directory = os.path.join(NODE_DIR, str(host >> WORKER_BITS))
+    os.makedirs(directory, exist_ok=True)
+    for worker in range(MAX_WORKER + 1):
+        f = open(os.path.join(directory, f"{worker}.lock"), "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            continue
+        return host | worker, f
+    raise RuntimeError(f"All {MAX_WORKER + 1} tracking worker slots in {directory} are in use")
+
+
+# ---------- GENERATOR ----------
+class TrackingIdGenerator:
+    def __init__(self, node_id=None):
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._claimed = node_id is None
+        self.node_id = node_id
+        self._last_ms = -1
+        self._sequence = 0
+
+    def _ensure_node(self):
+        if self.node_id is None:
+            self.node_id, self._lock_file = _claim_node_id()
+
+    def _reset_after_fork(self):
+        # The parent still holds its slot; the child claims its own lazily
+        self._lock = threading.Lock()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+        if self._claimed:
+            self.node_id = None
+        self._last_ms = -1
+        self._sequence = 0
+
+    def _next_int(self):
+        now = int(time.time() * 1000)
+        # Never step backwards if the wall clock does; keep counting from the last timestamp
+        if now <= self._last_ms:
+            now = self._last_ms
+            self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+            if self._sequence == 0:
+                now += 1
+                # Borrowed a millisecond; wait for the clock if we're far ahead of it
+                while now - int(time.time() * 1000) > 1000:
+                    time.sleep(0.001)
+        else:
+            self._sequence = 0
+        self._last_ms = now
+        return ((now - EPOCH_MS) << (NODE_BITS + SEQUENCE_BITS)) | (self.node_id << SEQUENCE_BITS) | self._sequence
+
+    def _format(self, n):
+        body = _encode(n)
+        return PREFIX + body + check_digit(body)
+
+    def next(self):
+        with self._lock:
+            self._ensure_node()
+            n = self._next_int()
+        return self._format(n)
+
+    def reserve(self, count):
+        """Reserve ``count`` consecutive IDs in one lock acquisition, for bulk paths."""
+        with self._lock:
+            self._ensure_node()
+            values = [self._next_int() for _ in range(count)]
+        return [self._format(n) for n in values]
+
+
+_host_id()   # a bad host setting stops the app at import, not on the first booking
+tracking_ids = TrackingIdGenerator()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=tracking_ids._reset_after_fork)
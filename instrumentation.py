@@ -0,0 +1,392 @@
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+from flask import before_render_template, g, has_app_context, request, template_rendered
+from mysql.connector import Error
+
+from cache import TTLCache
+
+
+SQL_STATS_ENABLED = os.environ.get("SQL_STATS", "1") == "1"
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "200"))
+# Same statement shape run this many times in one request is reported as N+1
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("N_PLUS_ONE_THRESHOLD", "10"))
+# EXPLAIN a given slow statement shape at most once per this many seconds
+EXPLAIN_INTERVAL_SECONDS = int(os.environ.get("EXPLAIN_INTERVAL_SECONDS", "300"))
+# Slow statements waiting for a background EXPLAIN; more than this are logged without a plan
+EXPLAIN_QUEUE_SIZE = int(os.environ.get("EXPLAIN_QUEUE_SIZE", "100"))
+# Adds Server-Timing / X-SQL-Stats headers to every response
+SQL_DEBUG_HEADERS = os.environ.get("SQL_DEBUG_HEADERS", "0") == "1"
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+log = logging.getLogger(__name__)
+
+
+# ---------- STATEMENT SHAPES ----------
+_WS = re.compile(r"\s+")
+_IN_LIST = re.compile(r"\(\s*(?:%s\s*,\s*)+%s\s*\)")
+_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\b\d+\b")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """Collapse whitespace, literals and IN-lists so repeats of one statement group together."""
+    sql = _WS.sub(" ", sql).strip()
+    sql = _IN_LIST.sub("(...)", sql)
+    return _LITERAL.sub("?", sql)
+
+
+# ---------- PER-REQUEST STATS ----------
+class RequestStats:
+    __slots__ = ("queries", "db_time", "acquire_time", "rows", "render_time", "statements", "slow", "_render_start")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.acquire_time = 0.0
+        self.rows = 0
+        self.render_time = 0.0
+        self.statements = {}    # fingerprint -> count
+        self.slow = []          # (fingerprint, sql, params, seconds)
+        self._render_start = None
+
+    def record(self, sql, params, elapsed):
+        shape = fingerprint(sql)
+        self.queries += 1
+        self.db_time += elapsed
+        self.statements[shape] = self.statements.get(shape, 0) + 1
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            self.slow.append((shape, sql, params, elapsed))
+
+    def n_plus_one(self):
+        return {shape: n for shape, n in self.statements.items() if n >= N_PLUS_ONE_THRESHOLD}
+
+
+def current_stats():
+    """The current request's RequestStats, or None outside a request or when disabled."""
+    if not SQL_STATS_ENABLED or not has_app_context():
+        return None
+    stats = g.get("sql_stats")
+    if stats is None:
+        stats = g.sql_stats = RequestStats()
+    return stats
+
+
+# ---------- CONNECTION / CURSOR PROXIES ----------
+class InstrumentedCursor:
+    """Times execute calls and counts fetched rows; everything else goes to the real cursor."""
+
+    __slots__ = ("_cursor", "_stats")
+
+    def __init__(self, cursor, stats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def execute(self, sql, params=(), *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(sql, params, *args, **kwargs)
+        finally:
+            self._stats.record(sql, params, time.perf_counter() - start)
+
+    def executemany(self, sql, seq, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(sql, seq, *args, **kwargs)
+        finally:
+            self._stats.record(sql, None, time.perf_counter() - start)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._stats.rows += 1
+        return row
+
+    def fetchmany(self, size=1):
+        rows = self._cursor.fetchmany(size)
+        self._stats.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._stats.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._stats.rows += 1
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    __slots__ = ("raw", "_stats")
+
+    def __init__(self, conn, stats):
+        self.raw = conn
+        self._stats = stats
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self.raw.cursor(*args, **kwargs), self._stats)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+def instrument(conn, acquire_time=0.0):
+    stats = current_stats()
+    if stats is None:
+        return conn
+    stats.acquire_time += acquire_time
+    return InstrumentedConnection(conn, stats)
+
+
+def unwrap(conn):
+    return conn.raw if isinstance(conn, InstrumentedConnection) else conn
+
+
+# ---------- PROCESS-WIDE METRICS ----------
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Metrics:
+    """Counters and histograms per endpoint, rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = {}                  # endpoint -> dict of counters/histograms
+        self.slow_log = deque(maxlen=50)     # recent slow queries, newest last
+        self._explained = TTLCache(maxsize=1024, ttl=EXPLAIN_INTERVAL_SECONDS)
+
+    def _endpoint(self, name):
+        data = self.endpoints.get(name)
+        if data is None:
+            data = self.endpoints[name] = {
+                "duration": _Histogram(REQUEST_BUCKETS),
+                "queries": _Histogram(QUERY_COUNT_BUCKETS),
+                "db_seconds": 0.0, "acquire_seconds": 0.0, "render_seconds": 0.0,
+                "rows": 0, "slow_queries": 0, "n_plus_one": 0,
+            }
+        return data
+
+    def observe(self, endpoint, duration, stats):
+        with self._lock:
+            data = self._endpoint(endpoint)
+            data["duration"].observe(duration)
+            if stats is None:
+                return
+            data["queries"].observe(stats.queries)
+            data["db_seconds"] += stats.db_time
+            data["acquire_seconds"] += stats.acquire_time
+            data["render_seconds"] += stats.render_time
+            data["rows"] += stats.rows
+            data["slow_queries"] += len(stats.slow)
+            data["n_plus_one"] += len(stats.n_plus_one())
+
+    def should_explain(self, shape):
+        with self._lock:
+            if self._explained.get(shape):
+                return False
+            self._explained.set(shape, True)
+            return True
+
+    def render(self, samples=(), histograms=()):
+        """Prometheus exposition text.
+
+        ``samples`` adds (name, type, help, value) for single values such as pool state;
+        ``histograms`` adds (name, help, label, {label_value: (buckets, counts, sum)}).
+        """
+        lines = []
+
+        def header(name, help_text, kind):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            endpoints = sorted(self.endpoints.items())
+            header("cargo_http_request_duration_seconds", "Request wall time.", "histogram")
+            for name, data in endpoints:
+                h = data["duration"]
+                _render_histogram(lines, "cargo_http_request_duration_seconds", "endpoint", name, h.buckets, h.counts, h.sum)
+            header("cargo_db_queries_per_request", "SQL statements executed per request.", "histogram")
+            for name, data in endpoints:
+                h = data["queries"]
+                _render_histogram(lines, "cargo_db_queries_per_request", "endpoint", name, h.buckets, h.counts, h.sum)
+            for metric, field, help_text in (
+                ("cargo_db_seconds_total", "db_seconds", "Time spent in SQL execute calls."),
+                ("cargo_db_acquire_seconds_total", "acquire_seconds", "Time spent waiting for a pooled connection."),
+                ("cargo_template_seconds_total", "render_seconds", "Time spent rendering templates."),
+                ("cargo_db_rows_fetched_total", "rows", "Rows fetched from MySQL."),
+                ("cargo_db_slow_queries_total", "slow_queries", f"Statements slower than {SLOW_QUERY_MS:g} ms."),
+                ("cargo_db_n_plus_one_total", "n_plus_one", "Statement shapes repeated N_PLUS_ONE_THRESHOLD+ times in one request."),
+            ):
+                header(metric, help_text, "counter")
+                for name, data in endpoints:
+                    lines.append(f'{metric}{{endpoint="{name}"}} {data[field]:g}')
+        for name, kind, help_text, value in samples:
+            header(name, help_text, kind)
+            lines.append(f"{name} {value:g}")
+        for name, help_text, label, series in histograms:
+            header(name, help_text, "histogram")
+            for value, (buckets, counts, total) in sorted(series.items()):
+                _render_histogram(lines, name, label, value, buckets, counts, total)
+        return "\n".join(lines) + "\n"
+
+
+def _render_histogram(lines, metric, label, value, buckets, counts, total):
+    cumulative = 0
+    for bound, count in zip(buckets, counts):
+        cumulative += count
+        lines.append(f'{metric}_bucket{{{label}="{value}",le="{bound:g}"}} {cumulative}')
+    cumulative += counts[-1]
+    lines.append(f'{metric}_bucket{{{label}="{value}",le="+Inf"}} {cumulative}')
+    lines.append(f'{metric}_sum{{{label}="{value}"}} {total:g}')
+    lines.append(f'{metric}_count{{{label}="{value}"}} {cumulative}')
+
+
+metrics = Metrics()
+
+
+# ---------- BACKGROUND EXPLAIN ----------
+def _explain(conn, sql, params):
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    try:
+        cursor.execute("EXPLAIN " + sql, params)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+class Explainer:
+    """EXPLAINs slow statements on one background thread with its own pooled connection.
+
+    The request that ran the statement is never delayed, and a connection a
+    view left mid-result or mid-transaction is never reused for it; the plan
+    is filled into the slow_log entry once it is known.
+    """
+
+    def __init__(self, capacity=EXPLAIN_QUEUE_SIZE):
+        self.capacity = capacity
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+
+    def submit(self, entry, sql, params):
+        with self._cond:
+            if len(self._queue) >= self.capacity:
+                return False
+            self._ensure_worker()
+            self._queue.append((entry, sql, params))
+            self._cond.notify()
+        return True
+
+    def _ensure_worker(self):
+        # Like the audit writer: a forked worker inherits the object but not the thread
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="sql-explain", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        from db import pool   # db imports this module
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue)
+                entry, sql, params = self._queue.popleft()
+            try:
+                with pool.connection() as conn:
+                    entry["explain"] = _explain(conn, sql, params)
+                    conn.rollback()
+            except Error as e:
+                entry["explain"] = [{"error": str(e)}]
+            except Exception:
+                log.exception("EXPLAIN failed for %s", entry["sql"])
+
+
+explainer = Explainer()
+
+
+# ---------- REQUEST HOOKS ----------
+def _before_request():
+    g.request_started = time.perf_counter()
+    g.sql_stats = RequestStats()
+
+
+def _before_render(sender, template, context, **extra):
+    stats = current_stats()
+    if stats is not None:
+        stats._render_start = time.perf_counter()
+
+
+def _rendered(sender, template, context, **extra):
+    stats = current_stats()
+    if stats is not None and stats._render_start is not None:
+        stats.render_time += time.perf_counter() - stats._render_start
+        stats._render_start = None
+
+
+def _after_request(response):
+    stats = g.get("sql_stats")
+    if stats is not None and SQL_DEBUG_HEADERS:
+        response.headers["Server-Timing"] = (
+            f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries", '
+            f"acquire;dur={stats.acquire_time * 1000:.1f}, render;dur={stats.render_time * 1000:.1f}"
+        )
+        response.headers["X-SQL-Stats"] = (
+            f"queries={stats.queries}; rows={stats.rows}; slow={len(stats.slow)}; n_plus_one={len(stats.n_plus_one())}"
+        )
+    return response
+
+
+def _teardown_request(exc=None):
+    started = g.pop("request_started", None)
+    if started is None:
+        return
+    stats = g.get("sql_stats")
+    endpoint = request.endpoint or "none"
+    if stats is not None:
+        for shape, count in stats.n_plus_one().items():
+            log.warning("N+1 on %s: %d x %s", endpoint, count, shape)
+        for shape, sql, params, elapsed in stats.slow:
+            log.warning("Slow query on %s (%.0f ms): %s", endpoint, elapsed * 1000, shape)
+            entry = {
+                "endpoint": endpoint, "ms": round(elapsed * 1000, 1), "sql": shape,
+                "at": time.time(), "explain": None,
+            }
+            metrics.slow_log.append(entry)
+            # Plans for SELECTs only, worked out off the request path
+            if shape.upper().startswith("SELECT") and metrics.should_explain(shape):
+                explainer.submit(entry, sql, params)
+    metrics.observe(endpoint, time.perf_counter() - started, stats)
+
+
+def init_app(app):
+    if not SQL_STATS_ENABLED:
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
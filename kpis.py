@@ -0,0 +1,106 @@
+import os
+from decimal import Decimal
+
+from cache import TTLCache
+from tracking import BOOKING_STATUSES
+
+
+KPI_TTL_SECONDS = int(os.environ.get("KPI_TTL_SECONDS", "60"))
+
+
+# ---------- LOADERS ----------
+# Each group is loaded with a single round trip and cached independently, so a
+# write that only touches invoices doesn't force the booking counts to reload.
+def _load_users(cursor):
+    cursor.execute("SELECT role, COUNT(*) FROM users WHERE role IN ('customer', 'employee') GROUP BY role")
+    counts = dict(cursor.fetchall())
+    return {"customers": counts.get("customer", 0), "employees": counts.get("employee", 0)}
+
+
+def _load_bookings(cursor):
+    cursor.execute("SELECT status, COUNT(*) FROM cargo_bookings GROUP BY status")
+    by_status = {s: 0 for s in BOOKING_STATUSES}
+    by_status.update(cursor.fetchall())
+    return {"total": sum(by_status.values()), "by_status": by_status}
+
+
+def _load_invoices(cursor):
+    cursor.execute("""
+        SELECT COUNT(*), COALESCE(SUM(total_amount), 0)
+        FROM invoices WHERE payment_status IN ('unpaid', 'overdue')
+    """)
+    count, total = cursor.fetchone()
+    return {"unpaid": count, "unpaid_total": Decimal(total)}
+
+
+def _load_tickets(cursor):
+    cursor.execute("SELECT COUNT(*) FROM support_tickets WHERE status IN ('open', 'in_progress')")
+    return {"open": cursor.fetchone()[0]}
+
+
+KPI_LOADERS = {
+    "users": _load_users,
+    "bookings": _load_bookings,
+    "invoices": _load_invoices,
+    "tickets": _load_tickets,
+}
+
+
+class KpiStore:
+    """Dashboard counters served from a TTL cache and nudged in place by write paths.
+
+    ``incr``/``move_status`` only touch groups that are currently cached; a
+    missing group is simply reloaded on the next read, and the TTL bounds drift
+    from writes made by other processes.
+    """
+
+    def __init__(self, ttl=KPI_TTL_SECONDS):
+        self._cache = TTLCache(maxsize=len(KPI_LOADERS), ttl=ttl)
+
+    def snapshot(self, conn, refresh=False):
+        if refresh:
+            self.invalidate()
+        cursor = conn.cursor()
+        try:
+            return {
+                name: self._cache.get_or_load(name, lambda loader=loader: loader(cursor))
+                for name, loader in KPI_LOADERS.items()
+            }
+        finally:
+            cursor.close()
+
+    def invalidate(self, *groups):
+        if not groups:
+            self._cache.clear()
+        for group in groups:
+            self._cache.pop(group)
+
+    def incr(self, group, field, delta=1):
+        def apply(values):
+            values = dict(values)
+            values[field] = values.get(field, 0) + delta
+            return values
+        self._cache.update(group, apply)
+
+    def move_status(self, old_status, new_status, count=1):
+        """Shift ``count`` bookings between status buckets; unknown buckets force a reload."""
+        if old_status not in BOOKING_STATUSES or new_status not in BOOKING_STATUSES:
+            self.invalidate("bookings")
+            return
+
+        def apply(values):
+            by_status = dict(values["by_status"])
+            by_status[old_status] -= count
+            by_status[new_status] += count
+            return {"total": values["total"], "by_status": by_status}
+        self._cache.update("bookings", apply)
+
+    def booking_created(self, status="pending", count=1):
+        def apply(values):
+            by_status = dict(values["by_status"])
+            by_status[status] = by_status.get(status, 0) + count
+            return {"total": values["total"] + count, "by_status": by_status}
+        self._cache.update("bookings", apply)
+
+
+kpis = KpiStore()
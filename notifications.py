@@ -0,0 +1,393 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import smtplib
+import time
+import urllib.request
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+
+import click
+
+from db import pool
+
+
+log = logging.getLogger(__name__)
+
+# Channels a customer is notified on; sms only goes to customers with a phone number
+NOTIFY_CHANNELS = [c.strip() for c in os.environ.get("NOTIFY_CHANNELS", "email,sms").split(",") if c.strip()]
+NOTIFY_BATCH = int(os.environ.get("NOTIFY_BATCH", "100"))
+NOTIFY_CONCURRENCY = int(os.environ.get("NOTIFY_CONCURRENCY", "20"))
+NOTIFY_SEND_TIMEOUT_SECONDS = float(os.environ.get("NOTIFY_SEND_TIMEOUT_SECONDS", "10"))
+NOTIFY_POLL_SECONDS = float(os.environ.get("NOTIFY_POLL_SECONDS", "2"))
+NOTIFY_MAX_ATTEMPTS = int(os.environ.get("NOTIFY_MAX_ATTEMPTS", "5"))
+NOTIFY_BACKOFF_SECONDS = float(os.environ.get("NOTIFY_BACKOFF_SECONDS", "30"))
+NOTIFY_BACKOFF_MAX_SECONDS = float(os.environ.get("NOTIFY_BACKOFF_MAX_SECONDS", "3600"))
+# A 'sending' row whose worker hasn't recorded a result by then is claimed again
+NOTIFY_CLAIM_LEASE_SECONDS = int(os.environ.get("NOTIFY_CLAIM_LEASE_SECONDS", "300"))
+
+# Senders: "log" just logs (development), "smtp"/"http" deliver for real
+NOTIFY_EMAIL_BACKEND = os.environ.get("NOTIFY_EMAIL_BACKEND", "log")
+NOTIFY_SMTP_HOST = os.environ.get("NOTIFY_SMTP_HOST", "localhost")
+NOTIFY_SMTP_PORT = int(os.environ.get("NOTIFY_SMTP_PORT", "25"))
+NOTIFY_EMAIL_FROM = os.environ.get("NOTIFY_EMAIL_FROM", "no-reply@cargo.example")
+NOTIFY_SMS_BACKEND = os.environ.get("NOTIFY_SMS_BACKEND", "log")
+NOTIFY_SMS_URL = os.environ.get("NOTIFY_SMS_URL", "http://localhost:1026/sms")
+
+
+# ---------- OUTBOX (request side) ----------
+# Routes only add pending rows on their own transaction; nothing is sent inline.
+_ENQUEUE_SQL = """
+    INSERT INTO notifications (user_id, booking_id, title, message, type, email_address, phone_number)
+    SELECT c.user_id, b.booking_id, %s, CONCAT({message}), %s, u.email, c.phone_number
+    FROM cargo_bookings b
+    JOIN customers c ON c.customer_id = b.customer_id
+    JOIN users u ON u.user_id = c.user_id
+    WHERE b.booking_id IN ({ids}) {channel_filter}
+"""
+_CHANNEL_FILTERS = {"sms": "AND c.phone_number IS NOT NULL"}
+
+
+def _enqueue(cursor, booking_ids, title, message_sql, message_params):
+    if not booking_ids or not NOTIFY_CHANNELS:
+        return
+    ids = ", ".join(["%s"] * len(booking_ids))
+    for channel in NOTIFY_CHANNELS:
+        cursor.execute(
+            _ENQUEUE_SQL.format(message=message_sql, ids=ids, channel_filter=_CHANNEL_FILTERS.get(channel, "")),
+            [title, *message_params, channel, *booking_ids],
+        )
+
+
+def enqueue_status_change(cursor, booking_ids, status, location=None):
+    """Queue "shipment is now <status>" notifications to the customers of ``booking_ids``."""
+    detail = f" is now {status.replace('_', ' ')}" + (f" ({location})" if location else "") + "."
+    _enqueue(cursor, list(booking_ids), "Shipment update", "'Shipment ', b.tracking_id, %s", [detail])
+
+
+def enqueue_booking_created(cursor, booking_ids):
+    _enqueue(cursor, list(booking_ids), "Booking received",
+             "'We have received your booking. Track it with ID ', b.tracking_id, '.'", [])
+
+
+# ---------- SENDERS ----------
+# A sender has ``async send(notification)`` and raises on failure.
+Notification = namedtuple(
+    "Notification", "notification_id user_id booking_id title message type email_address phone_number attempts"
+)
+
+
+class SendError(Exception):
+    pass
+
+
+class LogSender:
+    async def send(self, n):
+        log.info("notification %s (%s) to user %s: %s", n.notification_id, n.type, n.user_id, n.message)
+
+
+class MemorySender:
+    """Keeps what it was given; ``fail_first`` sends raise first, to exercise retries."""
+
+    def __init__(self, fail_first=0):
+        self.sent = []
+        self.fail_first = fail_first
+
+    async def send(self, n):
+        if self.fail_first > 0:
+            self.fail_first -= 1
+            raise SendError("simulated failure")
+        self.sent.append(n)
+
+
+class SMTPSender:
+    def __init__(self, host=NOTIFY_SMTP_HOST, port=NOTIFY_SMTP_PORT, sender=NOTIFY_EMAIL_FROM,
+                 timeout=NOTIFY_SEND_TIMEOUT_SECONDS):
+        self.host, self.port, self.sender, self.timeout = host, port, sender, timeout
+
+    def _send(self, n):
+        if not n.email_address:
+            raise SendError("no email address")
+        msg = EmailMessage()
+        msg["From"] = self.sender
+        msg["To"] = n.email_address
+        msg["Subject"] = n.title
+        msg.set_content(n.message)
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            smtp.send_message(msg)
+
+    async def send(self, n):
+        await asyncio.get_running_loop().run_in_executor(None, self._send, n)
+
+
+class HTTPSMSSender:
+    """POSTs {"to", "message"} as JSON to an SMS gateway."""
+
+    def __init__(self, url=NOTIFY_SMS_URL, timeout=NOTIFY_SEND_TIMEOUT_SECONDS):
+        self.url, self.timeout = url, timeout
+
+    def _send(self, n):
+        if not n.phone_number:
+            raise SendError("no phone number")
+        body = json.dumps({"to": n.phone_number, "message": n.message}).encode()
+        req = urllib.request.Request(self.url, body, {"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            if resp.status >= 300:
+                raise SendError(f"gateway returned {resp.status}")
+
+    async def send(self, n):
+        await asyncio.get_running_loop().run_in_executor(None, self._send, n)
+
+
+def default_senders():
+    email = SMTPSender() if NOTIFY_EMAIL_BACKEND == "smtp" else LogSender()
+    sms = HTTPSMSSender() if NOTIFY_SMS_BACKEND == "http" else LogSender()
+    # "system" rows are the in-app inbox: storing them was the delivery
+    return {"email": email, "sms": sms, "push": LogSender(), "system": LogSender()}
+
+
+# ---------- DISPATCHER (worker side) ----------
+def backoff_seconds(attempts):
+    """Exponential backoff with full jitter after the ``attempts``-th failure."""
+    return random.uniform(0, min(NOTIFY_BACKOFF_MAX_SECONDS, NOTIFY_BACKOFF_SECONDS * 2 ** (attempts - 1)))
+
+
+class Dispatcher:
+    """Claims due pending notifications and sends them concurrently.
+
+    Each batch is picked with SELECT ... FOR UPDATE SKIP LOCKED and marked
+    'sending' with a lease in a short transaction, so sends hold no row locks
+    and any number of workers can run side by side. A worker that dies
+    mid-batch leaves its rows to be claimed again once the lease runs out, so
+    delivery is at-least-once. All times are the database's NOW().
+    """
+
+    def __init__(self, senders=None, batch_size=NOTIFY_BATCH, concurrency=NOTIFY_CONCURRENCY,
+                 max_attempts=NOTIFY_MAX_ATTEMPTS, send_timeout=NOTIFY_SEND_TIMEOUT_SECONDS,
+                 lease=NOTIFY_CLAIM_LEASE_SECONDS):
+        self.senders = senders or default_senders()
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.send_timeout = send_timeout
+        self.lease = lease
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    def _claim(self, conn):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT notification_id, user_id, booking_id, title, message, type,
+                       email_address, phone_number, attempts
+                FROM notifications
+                WHERE status IN ('pending', 'sending') AND next_attempt_at <= NOW()
+                ORDER BY next_attempt_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            """, (self.batch_size,))
+            batch = [Notification(*row) for row in cursor.fetchall()]
+            if batch:
+                ids = ", ".join(["%s"] * len(batch))
+                cursor.execute(f"""
+                    UPDATE notifications SET status = 'sending', next_attempt_at = NOW() + INTERVAL %s SECOND
+                    WHERE notification_id IN ({ids})
+                """, [self.lease, *(n.notification_id for n in batch)])
+            conn.commit()
+            return batch
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def _record(self, conn, outcomes):
+        sent, retry, failed = [], [], []
+        for n, error in outcomes:
+            if error is None:
+                sent.append((n.notification_id,))
+                continue
+            attempts = n.attempts + 1
+            message = str(error)[:255] or type(error).__name__
+            if attempts >= self.max_attempts:
+                failed.append((attempts, message, n.notification_id))
+            else:
+                retry.append((attempts, message, round(backoff_seconds(attempts)), n.notification_id))
+        cursor = conn.cursor()
+        try:
+            if sent:
+                cursor.executemany(
+                    "UPDATE notifications SET status = 'sent', sent_at = NOW() WHERE notification_id = %s", sent
+                )
+            if retry:
+                cursor.executemany("""
+                    UPDATE notifications
+                    SET status = 'pending', attempts = %s, last_error = %s,
+                        next_attempt_at = NOW() + INTERVAL %s SECOND
+                    WHERE notification_id = %s
+                """, retry)
+            if failed:
+                cursor.executemany("""
+                    UPDATE notifications SET status = 'failed', attempts = %s, last_error = %s
+                    WHERE notification_id = %s
+                """, failed)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        self.sent += len(sent)
+        self.retried += len(retry)
+        self.failed += len(failed)
+
+    async def _send_all(self, batch):
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def send(n):
+            sender = self.senders.get(n.type)
+            if sender is None:
+                return n, SendError(f"no sender for {n.type}")
+            async with limit:
+                try:
+                    await asyncio.wait_for(sender.send(n), self.send_timeout)
+                    return n, None
+                except Exception as e:   # any sender failure is retried
+                    return n, e
+
+        return await asyncio.gather(*(send(n) for n in batch))
+
+    async def run_once(self, conn):
+        """Claim, send and record one batch on ``conn``; returns how many were claimed."""
+        loop = asyncio.get_running_loop()
+        batch = await loop.run_in_executor(None, self._claim, conn)
+        if not batch:
+            return 0
+        # No transaction is open while sending; unrecorded rows come back when their lease expires
+        outcomes = await self._send_all(batch)
+        await loop.run_in_executor(None, self._record, conn, outcomes)
+        return len(batch)
+
+    async def run(self, poll=NOTIFY_POLL_SECONDS, once=False):
+        loop = asyncio.get_running_loop()
+        # Blocking SMTP/HTTP sends and DB calls run here; size it to the send concurrency
+        loop.set_default_executor(ThreadPoolExecutor(self.concurrency + 1, thread_name_prefix="notify"))
+        with pool.connection() as conn:
+            while True:
+                claimed = await self.run_once(conn)
+                if claimed:
+                    log.info("notifications: %d claimed (%d sent, %d retrying, %d failed so far)",
+                             claimed, self.sent, self.retried, self.failed)
+                elif once:
+                    return
+                else:
+                    await asyncio.sleep(poll)
+
+
+# ---------- LOCAL SINKS ----------
+# Stand-ins for an SMTP relay and an SMS gateway, for development and tests:
+# everything they receive is appended as JSON lines to one file.
+class _Sink:
+    def __init__(self, path):
+        self.path = path
+
+    def record(self, kind, **fields):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"kind": kind, "at": time.time(), **fields}) + "\n")
+
+    async def smtp(self, reader, writer):
+        async def reply(line):
+            writer.write(line.encode() + b"\r\n")
+            await writer.drain()
+
+        await reply("220 cargo notify sink")
+        envelope = {"from": None, "to": []}
+        while line := (await reader.readline()).decode(errors="replace").rstrip("\r\n"):
+            verb = line[:4].upper()
+            if verb in ("HELO", "EHLO", "RSET", "NOOP"):
+                await reply("250 ok")
+            elif verb == "MAIL":
+                envelope = {"from": line.split(":", 1)[1].strip(" <>"), "to": []}
+                await reply("250 ok")
+            elif verb == "RCPT":
+                envelope["to"].append(line.split(":", 1)[1].strip(" <>"))
+                await reply("250 ok")
+            elif verb == "DATA":
+                await reply("354 end with .")
+                data = []
+                while (chunk := await reader.readline()) not in (b".\r\n", b".\n", b""):
+                    data.append(chunk.decode(errors="replace"))
+                self.record("email", **envelope, data="".join(data))
+                await reply("250 queued")
+            elif verb == "QUIT":
+                await reply("221 bye")
+                break
+            else:
+                await reply("502 not implemented")
+        writer.close()
+
+    async def sms(self, reader, writer):
+        headers = {}
+        request_line = (await reader.readline()).decode(errors="replace")
+        while (line := (await reader.readline()).decode(errors="replace").strip()):
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+        try:
+            self.record("sms", path=request_line.split()[1], **json.loads(body))
+            status = "200 OK"
+        except (ValueError, IndexError, TypeError):
+            status = "400 Bad Request"
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode())
+        await writer.drain()
+        writer.close()
+
+
+async def run_sinks(path, smtp_port, sms_port, host="127.0.0.1"):
+    sink = _Sink(path)
+    smtp = await asyncio.start_server(sink.smtp, host, smtp_port)
+    sms = await asyncio.start_server(sink.sms, host, sms_port)
+    async with smtp, sms:
+        await asyncio.gather(smtp.serve_forever(), sms.serve_forever())
+
+
+# ---------- CLI ----------
+@click.command("notify-worker")
+@click.option("--once", is_flag=True, help="Exit when nothing is due instead of polling.")
+@click.option("--batch-size", default=NOTIFY_BATCH, show_default=True)
+@click.option("--concurrency", default=NOTIFY_CONCURRENCY, show_default=True)
+def notify_worker_command(once, batch_size, concurrency):
+    """Send pending notifications; run as many as needed."""
+    dispatcher = Dispatcher(batch_size=batch_size, concurrency=concurrency)
+    try:
+        asyncio.run(dispatcher.run(once=once))
+    except KeyboardInterrupt:
+        pass
+    click.echo(f"{dispatcher.sent} sent, {dispatcher.retried} retrying, {dispatcher.failed} failed.")
+
+
+@click.command("notify-sink")
+@click.option("--smtp-port", default=1025, show_default=True)
+@click.option("--sms-port", default=1026, show_default=True)
+@click.option("--out", default=os.path.join("instance", "notify-sink.jsonl"), show_default=True)
+def notify_sink_command(smtp_port, sms_port, out):
+    """Run a local fake SMTP server and SMS gateway that record to a file.
+
+    Point the worker at them with NOTIFY_EMAIL_BACKEND=smtp NOTIFY_SMTP_PORT=1025
+    NOTIFY_SMS_BACKEND=http NOTIFY_SMS_URL=http://localhost:1026/sms.
+    """
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    click.echo(f"SMTP on :{smtp_port}, SMS on :{sms_port}, writing to {out}")
+    try:
+        asyncio.run(run_sinks(out, smtp_port, sms_port))
+    except KeyboardInterrupt:
+        pass
+
+
+def init_app(app):
+    app.cli.add_command(notify_worker_command)
+    app.cli.add_command(notify_sink_command)
@@ -0,0 +1,143 @@
+import hashlib
+import os
+import threading
+from functools import wraps
+
+from flask import Response, make_response, request, session
+
+from cache import SizedTTLCache
+
+
+PAGE_CACHE_ENABLED = os.environ.get("PAGE_CACHE", "1") != "0"
+PAGE_CACHE_MAX_BYTES = int(os.environ.get("PAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Pages bigger than this are served but never stored
+PAGE_CACHE_MAX_PAGE_BYTES = int(os.environ.get("PAGE_CACHE_MAX_PAGE_BYTES", str(2 * 1024 * 1024)))
+# Versions are per process, so a write handled by another worker (or the
+# billing CLI) only reaches this process's pages when they expire
+PAGE_CACHE_TTL_SECONDS = int(os.environ.get("PAGE_CACHE_TTL_SECONDS", "30"))
+
+
+# ---------- DATA VERSIONS ----------
+class DataVersions:
+    """A counter per kind of data ("bookings", "invoices", "users"), bumped by the routes that write it.
+
+    Cached pages are keyed by the versions they were rendered at, so a bump
+    makes them unreachable at once, including ones still rendering when the
+    write committed.
+    """
+
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def bump(self, *topics):
+        with self._lock:
+            for topic in topics:
+                self._versions[topic] = self._versions.get(topic, 0) + 1
+
+    def current(self, topics):
+        return tuple(self._versions.get(topic, 0) for topic in topics)
+
+
+versions = DataVersions()
+
+
+def bump(*topics):
+    versions.bump(*topics)
+
+
+# ---------- PAGE CACHE ----------
+class CachedPage:
+    __slots__ = ("body", "mimetype", "etag")
+
+    def __init__(self, body, mimetype):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+
+
+pages = SizedTTLCache(
+    PAGE_CACHE_MAX_BYTES, ttl=PAGE_CACHE_TTL_SECONDS, max_item=PAGE_CACHE_MAX_PAGE_BYTES,
+    weigh=lambda page: len(page.body),
+)
+
+
+def _revalidatable(response, etag):
+    # private: pages are per user, so shared proxies mustn't keep them
+    response.headers["Cache-Control"] = "private, no-cache"
+    if etag:
+        response.set_etag(etag)
+        response.make_conditional(request)
+    return response
+
+
+def _store_streamed(response, key):
+    """Pass a streamed body through unchanged, keeping a copy to store if it finishes small enough."""
+    chunks = response.response
+
+    def tee():
+        kept, size = [], 0
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            if kept is not None:
+                size += len(chunk)
+                if size <= PAGE_CACHE_MAX_PAGE_BYTES:
+                    kept.append(chunk)
+                else:
+                    kept = None
+            yield chunk
+        if kept is not None:
+            pages.set(key, CachedPage(b"".join(kept), response.mimetype))
+
+    response.response = tee()
+    return response
+
+
+def page_key(topics):
+    """Cache key of the current request, or None when it must not be cached."""
+    if not PAGE_CACHE_ENABLED or request.method != "GET":
+        return None
+    return (request.endpoint, session.get("user_id"), session.get("role"),
+            request.full_path, versions.current(topics))
+
+
+def cached_response(key):
+    """The stored page for ``key`` as a response (304 when the ETag matches), or None."""
+    page = pages.get(key) if key is not None else None
+    if page is None:
+        return None
+    return _revalidatable(Response(page.body, mimetype=page.mimetype), page.etag)
+
+
+def store_response(key, response):
+    """Keep a rendered 200 response under ``key`` and return it ready to send."""
+    if key is None or response.status_code != 200:
+        return response
+    if response.is_streamed:
+        # The ETag isn't known until the body is; the next request gets one from the cache
+        return _revalidatable(_store_streamed(response, key), None)
+    page = CachedPage(response.get_data(), response.mimetype)
+    pages.set(key, page)
+    return _revalidatable(response, page.etag)
+
+
+def cached_page(*topics):
+    """Serve a GET view from the page cache, keyed by user, URL and the versions of ``topics``.
+
+    Goes under @login_required, so access checks still run on every hit.
+    Only 200 responses are stored. A hit whose ETag matches If-None-Match is
+    answered with 304 without touching the view or the database.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            key = page_key(topics)
+            response = cached_response(key)
+            if response is not None:
+                return response
+            return store_response(key, make_response(view(*args, **kwargs)))
+        # Read by the ASGI app to answer hits without a worker thread
+        wrapped.cache_topics = topics
+        return wrapped
+    return decorator
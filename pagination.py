@@ -0,0 +1,154 @@
+import base64
+import json
+from datetime import date, datetime
+
+from flask import request, url_for
+
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 200
+
+
+class Page:
+    def __init__(self, items, next_cursor=None, prev_cursor=None, per_page=DEFAULT_PER_PAGE):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.per_page = per_page
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+# ---------- CURSOR TOKENS ----------
+# Cursors are the sort-key values of a boundary row, so a link keeps pointing at
+# the same position even when rows are inserted ahead of it.
+def encode_cursor(values):
+    encoded = []
+    for v in values:
+        if isinstance(v, datetime):
+            encoded.append({"dt": v.isoformat()})
+        elif isinstance(v, date):
+            encoded.append({"d": v.isoformat()})
+        else:
+            encoded.append(v)
+    raw = json.dumps(encoded, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = []
+        for v in json.loads(raw):
+            if isinstance(v, dict) and "dt" in v:
+                v = datetime.fromisoformat(v["dt"])
+            elif isinstance(v, dict) and "d" in v:
+                v = date.fromisoformat(v["d"])
+            values.append(v)
+        return values
+    except (ValueError, TypeError):
+        return None
+
+
+def per_page_arg(args, default=DEFAULT_PER_PAGE):
+    try:
+        return max(1, min(int(args.get("per_page", default)), MAX_PER_PAGE))
+    except (TypeError, ValueError):
+        return default
+
+
+def prefix_pattern(text):
+    """LIKE pattern for an index-friendly prefix match with wildcards in the input escaped."""
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+
+# ---------- KEYSET QUERY ----------
+def _after(columns, values, descending):
+    """Build "(a, b) past (x, y)" as an OR-expansion MySQL can use as an index range."""
+    op = "<" if descending else ">"
+    ors, params = [], []
+    for i in range(len(columns)):
+        ands = [f"{columns[j]} = %s" for j in range(i)] + [f"{columns[i]} {op} %s"]
+        ors.append("(" + " AND ".join(ands) + ")")
+        params.extend(values[:i + 1])
+    return "(" + " OR ".join(ors) + ")", params
+
+
+def keyset_page(cursor, select_sql, where, params, order_by, args, descending=True, per_page=None):
+    """Run one page of ``select_sql`` ordered by the ``order_by`` column list.
+
+    ``where``/``params`` are the caller's filter clauses, ``order_by`` must be a
+    unique index prefix (e.g. ``["b.booking_date", "b.booking_id"]``) and each
+    row, a dict or a record, must expose the same names as its trailing key. ``args`` supplies the
+    ``after``/``before`` cursor tokens and ``per_page``.
+    """
+    per_page = per_page or per_page_arg(args)
+    after = decode_cursor(args.get("after"))
+    before = decode_cursor(args.get("before")) if not after else None
+    key_names = [col.split(".")[-1] for col in order_by]
+
+    clauses, page_params = list(where), list(params)
+    backwards = False
+    if after and len(after) == len(order_by):
+        clause, extra = _after(order_by, after, descending)
+        clauses.append(clause)
+        page_params.extend(extra)
+    elif before and len(before) == len(order_by):
+        # Walk the other way from the boundary, then flip the rows back into display order
+        clause, extra = _after(order_by, before, not descending)
+        clauses.append(clause)
+        page_params.extend(extra)
+        backwards = True
+
+    direction = "ASC" if descending == backwards else "DESC"
+    where_sql = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+    order_sql = ", ".join(f"{col} {direction}" for col in order_by)
+    cursor.execute(f"{select_sql} {where_sql} ORDER BY {order_sql} LIMIT %s", page_params + [per_page + 1])
+    rows = cursor.fetchall()
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    def key(row):
+        if isinstance(row, dict):
+            return encode_cursor([row[name] for name in key_names])
+        return encode_cursor([getattr(row, name) for name in key_names])
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if more or backwards:
+            next_cursor = key(rows[-1])
+        if (more and backwards) or (not backwards and after):
+            prev_cursor = key(rows[0])
+    return Page(rows, next_cursor, prev_cursor, per_page)
+
+
+# ---------- TEMPLATE HELPERS ----------
+def page_url(**changes):
+    """URL of the current listing with its filters kept and the cursor replaced."""
+    args = request.args.to_dict()
+    args.pop("after", None)
+    args.pop("before", None)
+    args.update({k: v for k, v in changes.items() if v is not None})
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+
+def init_app(app):
+    app.add_template_global(page_url)
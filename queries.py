@@ -0,0 +1,492 @@
+import os
+import re
+import threading
+import weakref
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+
+from mysql.connector import Error
+
+import instrumentation
+
+
+# ---------- SETTINGS ----------
+# Server-side prepared statements, kept open per pooled connection. Set to 0
+# behind a proxy that doesn't support COM_STMT_* (e.g. some ProxySQL setups).
+PREPARED_STATEMENTS = os.environ.get("DB_PREPARED_STATEMENTS", "1") != "0"
+# Prepared statements kept per connection; the least recently used is closed past this
+STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", "64"))
+# Schema the registry is checked against at startup
+SCHEMA_FILE = os.environ.get(
+    "QUERY_SCHEMA_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "README.md")
+)
+
+
+class SchemaMismatch(RuntimeError):
+    pass
+
+
+# ---------- REGISTRY ----------
+class Query(str):
+    """SQL text with a name. Always the same object, so a cached prepared cursor skips re-preparing it."""
+
+    def __new__(cls, name, sql):
+        query = super().__new__(cls, " ".join(sql.split()))
+        query.name = name
+        return query
+
+
+QUERIES = {}
+
+
+def define(name, sql):
+    if name in QUERIES:
+        raise ValueError(f"query {name!r} is already defined")
+    QUERIES[name] = Query(name, sql)
+    return QUERIES[name]
+
+
+# ---------- USERS ----------
+USER_BY_USERNAME_OR_EMAIL = define("user_by_username_or_email", """
+    SELECT u.user_id, u.username, u.email FROM users u
+    WHERE u.username = %s OR u.email = %s
+    LIMIT 1
+""")
+USER_FOR_LOGIN = define("user_for_login", """
+    SELECT u.user_id, u.username, u.full_name, u.role, u.status, u.password_hash
+    FROM users u
+    WHERE u.username = %s AND u.role = %s
+""")
+PASSWORD_HASH = define("password_hash", "SELECT u.password_hash FROM users u WHERE u.user_id = %s")
+INSERT_USER = define("insert_user", """
+    INSERT INTO users (full_name, username, email, password_hash, role, status)
+    VALUES (%s, %s, %s, %s, %s, 'active')
+""")
+INSERT_CUSTOMER = define("insert_customer", "INSERT INTO customers (user_id) VALUES (%s)")
+INSERT_EMPLOYEE = define("insert_employee", "INSERT INTO employees (user_id) VALUES (%s)")
+UPDATE_PASSWORD = define("update_password", "UPDATE users u SET u.password_hash = %s WHERE u.user_id = %s")
+UPDATE_CUSTOMER_ACCOUNT = define("update_customer_account", """
+    UPDATE users u SET u.full_name = %s, u.email = %s, u.status = COALESCE(%s, u.status)
+    WHERE u.user_id = %s AND u.role = 'customer'
+""")
+SET_CUSTOMER_STATUS = define(
+    "set_customer_status", "UPDATE users u SET u.status = %s WHERE u.user_id = %s AND u.role = 'customer'"
+)
+# Names the admin customer templates expect (fullname, id, phone)
+CUSTOMER_ACCOUNT = define("customer_account", """
+    SELECT u.user_id, u.user_id AS id, u.username, u.full_name AS fullname, u.email, u.status, u.created_at,
+           c.phone_number AS phone, c.address
+    FROM users u
+    LEFT JOIN customers c ON c.user_id = u.user_id
+    WHERE u.user_id = %s AND u.role = 'customer'
+""")
+
+# ---------- CUSTOMERS ----------
+CUSTOMER_ID_FOR_USER = define("customer_id_for_user", "SELECT c.customer_id FROM customers c WHERE c.user_id = %s")
+CUSTOMER_PROFILE = define("customer_profile", """
+    SELECT u.user_id, u.username, u.full_name, u.email, u.created_at,
+           c.customer_id, c.customer_code, c.phone_number AS phone, c.address, c.city, c.state,
+           c.country, c.postal_code
+    FROM users u
+    LEFT JOIN customers c ON c.user_id = u.user_id
+    WHERE u.user_id = %s
+""")
+CUSTOMER_SHIPMENTS = define("customer_shipments", """
+    SELECT cb.booking_id, cb.tracking_id, cb.recipient_address, cb.booking_date, cb.status, cb.latest_status
+    FROM customers c
+    JOIN cargo_bookings cb ON cb.customer_id = c.customer_id
+    WHERE c.user_id = %s
+    ORDER BY cb.booking_date DESC
+""")
+CUSTOMER_INVOICES = define("customer_invoices", """
+    SELECT i.invoice_id, i.invoice_number, i.booking_id, i.total_amount, i.issue_date, i.due_date,
+           i.payment_status, cb.tracking_id, cb.recipient_name, cb.recipient_address, cb.recipient_phone
+    FROM customers c
+    JOIN invoices i ON i.customer_id = c.customer_id
+    JOIN cargo_bookings cb ON cb.booking_id = i.booking_id
+    WHERE c.user_id = %s
+    ORDER BY i.issue_date DESC
+""")
+CUSTOMER_TICKETS = define("customer_tickets", """
+    SELECT t.ticket_id, t.ticket_number, t.booking_id, t.subject, t.category, t.status, t.created_at
+    FROM support_tickets t
+    WHERE t.customer_id = %s
+    ORDER BY t.created_at DESC
+""")
+INSERT_TICKET = define("insert_ticket", """
+    INSERT INTO support_tickets (ticket_number, customer_id, booking_id, subject, description, category, status)
+    VALUES (%s, %s, %s, %s, %s, 'general_inquiry', 'open')
+""")
+
+# ---------- BOOKINGS ----------
+BOOKING = define("booking", """
+    SELECT b.*, b.booking_id AS id, b.latest_location AS current_location
+    FROM cargo_bookings b
+    WHERE b.booking_id = %s
+""")
+BOOKING_ID_FOR_TRACKING = define(
+    "booking_id_for_tracking", "SELECT b.booking_id FROM cargo_bookings b WHERE b.tracking_id = %s"
+)
+BOOKING_STATE = define(
+    "booking_state",
+    "SELECT b.tracking_id, b.customer_id, b.status, b.latest_location FROM cargo_bookings b WHERE b.booking_id = %s"
+)
+# Archived history (archive.py) is read alongside the hot rows, so timelines stay complete
+TRACKING_HISTORY = define("tracking_history", """
+    SELECT tu.update_id, tu.booking_id, tu.status, tu.location, tu.notes, tu.updated_by, tu.update_timestamp
+    FROM tracking_updates tu
+    WHERE tu.booking_id = %s
+    UNION ALL
+    SELECT ta.update_id, ta.booking_id, ta.status, ta.location, ta.notes, ta.updated_by, ta.update_timestamp
+    FROM tracking_updates_archive ta
+    WHERE ta.booking_id = %s
+    ORDER BY update_timestamp DESC, update_id DESC
+""")
+EMPLOYEE_ID_FOR_USER = define("employee_id_for_user", "SELECT e.employee_id FROM employees e WHERE e.user_id = %s")
+
+# ---------- LISTINGS ----------
+# Base SELECTs for pagination.keyset_page, which appends WHERE/ORDER BY/LIMIT.
+# Only the columns the list templates show (plus the page key): no notes,
+# descriptions or other wide columns riding along on every row.
+BOOKING_LIST = define("booking_list", """
+    SELECT b.booking_id, b.booking_date, b.tracking_id, b.sender_address, b.recipient_address, b.status
+    FROM cargo_bookings b
+""")
+EMPLOYEE_HISTORY_LIST = define("employee_history_list", """
+    SELECT b.booking_id, b.booking_date, b.tracking_id, b.sender_address, b.recipient_address, b.status,
+           b.actual_delivery_date
+    FROM cargo_bookings b
+    JOIN employees e ON b.assigned_employee_id = e.employee_id
+""")
+CARGO_LIST = define("cargo_list", """
+    SELECT b.booking_id, b.booking_date, b.tracking_id, b.recipient_address, b.status,
+           b.assigned_employee_id, u.username
+    FROM cargo_bookings b
+    JOIN customers c ON b.customer_id = c.customer_id
+    LEFT JOIN users u ON c.user_id = u.user_id
+""")
+CUSTOMER_LIST = define("customer_list", """
+    SELECT u.user_id, u.user_id AS id, u.full_name AS fullname, u.username, u.email,
+           u.status, u.created_at, c.phone_number AS phone, c.address
+    FROM users u
+    LEFT JOIN customers c ON u.user_id = c.user_id
+""")
+EMPLOYEE_LIST = define("employee_list", """
+    SELECT u.user_id, u.full_name, u.email, u.status, e.employee_code, e.department,
+           e.position, e.hire_date
+    FROM users u
+    LEFT JOIN employees e ON u.user_id = e.user_id
+""")
+
+# ---------- SEARCH ----------
+# search.py supplies the boolean-mode FULLTEXT terms or an escaped prefix
+# pattern; the MATCH column lists must equal the FULLTEXT index definitions.
+# "(%s IS NULL OR ... = %s)" optionally scopes results to one customer.
+SEARCH_BOOKINGS_TEXT = define("search_bookings_text", """
+    SELECT b.booking_id, b.tracking_id, b.sender_name, b.recipient_name, b.status,
+           MATCH(b.sender_name, b.sender_phone, b.sender_address, b.recipient_name, b.recipient_phone,
+                 b.recipient_address) AGAINST (%s IN BOOLEAN MODE) AS score
+    FROM cargo_bookings b
+    WHERE MATCH(b.sender_name, b.sender_phone, b.sender_address, b.recipient_name, b.recipient_phone,
+                b.recipient_address) AGAINST (%s IN BOOLEAN MODE)
+      AND (%s IS NULL OR b.customer_id = %s)
+    ORDER BY score DESC
+    LIMIT %s
+""")
+SEARCH_BOOKINGS_TRACKING = define("search_bookings_tracking", """
+    SELECT b.booking_id, b.tracking_id, b.sender_name, b.recipient_name, b.status
+    FROM cargo_bookings b
+    WHERE b.tracking_id LIKE %s AND (%s IS NULL OR b.customer_id = %s)
+    ORDER BY b.tracking_id
+    LIMIT %s
+""")
+SEARCH_BOOKINGS_PHONE = define("search_bookings_phone", """
+    SELECT b.booking_id, b.tracking_id, b.sender_name, b.recipient_name, b.status
+    FROM cargo_bookings b
+    WHERE (b.sender_phone_digits LIKE %s OR b.recipient_phone_digits LIKE %s)
+      AND (%s IS NULL OR b.customer_id = %s)
+    ORDER BY b.booking_id DESC
+    LIMIT %s
+""")
+SEARCH_CUSTOMERS_TEXT = define("search_customers_text", """
+    SELECT u.user_id, u.username, u.full_name, u.email, u.status,
+           MATCH(u.username, u.full_name, u.email) AGAINST (%s IN BOOLEAN MODE) AS score
+    FROM users u
+    WHERE MATCH(u.username, u.full_name, u.email) AGAINST (%s IN BOOLEAN MODE) AND u.role = 'customer'
+    ORDER BY score DESC
+    LIMIT %s
+""")
+SEARCH_CUSTOMERS_PHONE = define("search_customers_phone", """
+    SELECT u.user_id, u.username, u.full_name, u.email, u.status
+    FROM customers c
+    JOIN users u ON u.user_id = c.user_id
+    WHERE c.phone_digits LIKE %s
+    ORDER BY c.phone_digits
+    LIMIT %s
+""")
+SEARCH_TICKETS_TEXT = define("search_tickets_text", """
+    SELECT t.ticket_id, t.ticket_number, t.subject, t.status,
+           MATCH(t.subject, t.description) AGAINST (%s IN BOOLEAN MODE) AS score
+    FROM support_tickets t
+    WHERE MATCH(t.subject, t.description) AGAINST (%s IN BOOLEAN MODE)
+      AND (%s IS NULL OR t.customer_id = %s)
+    ORDER BY score DESC
+    LIMIT %s
+""")
+SEARCH_TICKETS_NUMBER = define("search_tickets_number", """
+    SELECT t.ticket_id, t.ticket_number, t.subject, t.status
+    FROM support_tickets t
+    WHERE t.ticket_number LIKE %s AND (%s IS NULL OR t.customer_id = %s)
+    ORDER BY t.ticket_number
+    LIMIT %s
+""")
+
+
+# ---------- RECORDS ----------
+@lru_cache(maxsize=256)
+def record_type(columns):
+    """A namedtuple class per column list: rows read as ``row.status`` with no per-row dict."""
+    return namedtuple("Record", columns, rename=True)
+
+
+def _records(description, rows):
+    if not rows:
+        return []
+    make = record_type(tuple(d[0] for d in description))._make
+    return [make(row) for row in rows]
+
+
+# ---------- PREPARED STATEMENT CACHE ----------
+class StatementCache:
+    """Prepared cursors for one connection, keyed by SQL text, least recently used first.
+
+    MySQL connector re-prepares only when a cursor is given a different SQL
+    object than last time, so each cursor is always handed the cached key.
+    """
+
+    def __init__(self, size=STATEMENT_CACHE_SIZE):
+        self.size = size
+        self._cursors = OrderedDict()
+
+    def get(self, conn, sql):
+        entry = self._cursors.get(sql)
+        if entry is not None:
+            self._cursors.move_to_end(sql)
+            return entry
+        entry = self._cursors[sql] = (sql, conn.cursor(prepared=True))
+        while len(self._cursors) > self.size:
+            _close(self._cursors.popitem(last=False)[1][1])
+        return entry
+
+    def discard(self, sql):
+        entry = self._cursors.pop(sql, None)
+        if entry is not None:
+            _close(entry[1])
+
+    def __len__(self):
+        return len(self._cursors)
+
+
+def _close(cursor):
+    try:
+        cursor.close()     # deallocates the server-side statement
+    except Error:
+        pass
+
+
+# Dropped with the connection: the cached cursors only hold weak proxies to it
+_caches = weakref.WeakKeyDictionary()
+_caches_lock = threading.Lock()
+
+
+def statement_cache(raw_conn):
+    with _caches_lock:
+        cache = _caches.get(raw_conn)
+        if cache is None:
+            cache = _caches[raw_conn] = StatementCache()
+        return cache
+
+
+# ---------- EXECUTION ----------
+Result = namedtuple("Result", "rowcount lastrowid")
+
+
+def _run(conn, sql, params, fetch):
+    raw = instrumentation.unwrap(conn)
+    if PREPARED_STATEMENTS:
+        cache = statement_cache(raw)
+        sql, cursor = cache.get(raw, sql)
+    else:
+        cursor = raw.cursor()
+    # Time it like any other statement when the connection belongs to a request
+    timed = instrumentation.InstrumentedCursor(cursor, instrumentation.current_stats()) if raw is not conn else cursor
+    try:
+        timed.execute(sql, tuple(params))
+        if fetch:
+            # Read to the end: prepared results are unbuffered and would block the connection
+            return _records(cursor.description, timed.fetchall())
+        return Result(cursor.rowcount, cursor.lastrowid)
+    except Error:
+        if PREPARED_STATEMENTS:
+            cache.discard(sql)
+        raise
+    finally:
+        if not PREPARED_STATEMENTS:
+            cursor.close()
+
+
+def fetch_all(conn, sql, params=()):
+    return _run(conn, sql, params, fetch=True)
+
+
+def iter_records(conn, sql, params=(), batch_size=500):
+    """Yield records as they are read, ``batch_size`` rows at a time, for streamed responses.
+
+    The connection is busy until the generator finishes; if it is closed
+    early the rest of the result is read and discarded.
+    """
+    raw = instrumentation.unwrap(conn)
+    if PREPARED_STATEMENTS:
+        cache = statement_cache(raw)
+        sql, cursor = cache.get(raw, sql)
+    else:
+        cursor = raw.cursor()
+    timed = instrumentation.InstrumentedCursor(cursor, instrumentation.current_stats()) if raw is not conn else cursor
+    done = False
+    try:
+        timed.execute(sql, tuple(params))
+        make = record_type(tuple(d[0] for d in cursor.description))._make
+        while True:
+            rows = timed.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield make(row)
+        done = True
+    except Error:
+        if PREPARED_STATEMENTS:
+            cache.discard(sql)
+        raise
+    finally:
+        if not done and cursor.description is not None:
+            try:
+                cursor.fetchall()
+            except Error:
+                pass
+        if not PREPARED_STATEMENTS:
+            cursor.close()
+
+
+def fetch_one(conn, sql, params=()):
+    rows = _run(conn, sql, params, fetch=True)
+    return rows[0] if rows else None
+
+
+def execute(conn, sql, params=()):
+    """Run a write on the caller's transaction; returns Result(rowcount, lastrowid)."""
+    return _run(conn, sql, params, fetch=False)
+
+
+class RecordCursor:
+    """Read-only cursor over ``fetch_all`` so helpers like keyset_page share the statement cache."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._rows = []
+
+    def execute(self, sql, params=()):
+        self._rows = fetch_all(self.conn, sql, params)
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def close(self):
+        self._rows = []
+
+
+# ---------- SCHEMA CHECK ----------
+_NOT_COLUMNS = {"PRIMARY", "FOREIGN", "INDEX", "KEY", "UNIQUE", "CONSTRAINT", "FULLTEXT", "SPATIAL", "CHECK"}
+_KEYWORDS = {
+    "select", "from", "where", "and", "or", "not", "in", "is", "null", "as", "join", "left", "right",
+    "inner", "outer", "cross", "on", "using", "order", "by", "group", "having", "limit", "offset", "asc",
+    "desc", "insert", "into", "values", "update", "set", "delete", "distinct", "exists", "like",
+    "escape", "between", "case", "when", "then", "else", "end", "for", "share", "lock", "mode",
+    "skip", "locked", "nowait", "duplicate", "key", "interval", "day", "hour", "minute", "second",
+    "true", "false", "union", "all", "ignore", "replace", "with", "recursive", "over", "partition",
+    "current_date", "current_timestamp", "match", "against", "boolean", "natural", "language",
+}
+
+
+def load_schema(path=SCHEMA_FILE):
+    """Parse the CREATE/ALTER TABLE statements in ``path`` into {table: {columns}}."""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    tables = {}
+    for name, body in re.findall(r"CREATE TABLE\s+(?:IF NOT EXISTS\s+)?`?(\w+)`?\s*\((.*?)\n\s*\)", text, re.S | re.I):
+        columns = tables.setdefault(name.lower(), set())
+        for line in body.splitlines():
+            m = re.match(r"\s*`?(\w+)`?\s+\w", line)
+            if m and m.group(1).upper() not in _NOT_COLUMNS:
+                columns.add(m.group(1).lower())
+    for name, body in re.findall(r"ALTER TABLE\s+`?(\w+)`?(.*?);", text, re.S | re.I):
+        columns = tables.setdefault(name.lower(), set())
+        columns.update(c.lower() for c in re.findall(r"ADD\s+COLUMN\s+`?(\w+)", body, re.I))
+        columns.difference_update(c.lower() for c in re.findall(r"DROP\s+COLUMN\s+`?(\w+)", body, re.I))
+    return tables
+
+
+def check_query(sql, schema):
+    """Return problems with ``sql``'s table and column names against ``schema`` (empty if none).
+
+    Unqualified names must belong to one of the query's tables; qualified
+    ones to the table behind their alias. Functions, keywords, literals and
+    output aliases (``AS x``) are ignored.
+    """
+    text = re.sub(r"'(?:[^'\\]|\\.)*'", "''", sql)
+    text = text.replace("%s", "?")
+    problems, aliases = [], {}
+    for table, alias in re.findall(r"\b(?:FROM|JOIN|UPDATE|INTO)\s+`?(\w+)`?(?:\s+(?:AS\s+)?(\w+))?", text, re.I):
+        table = table.lower()
+        if table not in schema:
+            problems.append(f"unknown table {table}")
+            continue
+        aliases[table] = table
+        if alias and alias.lower() not in _KEYWORDS:
+            aliases[alias.lower()] = table
+    outputs = {a.lower() for a in re.findall(r"\bAS\s+(\w+)", text, re.I)}
+
+    for alias, column in re.findall(r"\b(\w+)\.(\w+|\*)", text):
+        table = aliases.get(alias.lower())
+        if table is None:
+            problems.append(f"unknown table or alias {alias}")
+        elif column != "*" and column.lower() not in schema[table]:
+            problems.append(f"unknown column {table}.{column}")
+
+    known = set().union(*(schema[t] for t in set(aliases.values()))) if aliases else set()
+    for name in re.findall(r"(?<![.\w])([A-Za-z_]\w*)\b(?!\s*[.(])", text):
+        lowered = name.lower()
+        if lowered in _KEYWORDS or lowered in aliases or lowered in outputs or lowered in known:
+            continue
+        problems.append(f"unknown column {name}")
+    return problems
+
+
+def validate(schema, queries=None):
+    """Check every registered query; returns ["name: problem", ...]."""
+    problems = []
+    for query in (queries or QUERIES).values():
+        problems.extend(f"{query.name}: {p}" for p in check_query(query, schema))
+    return problems
+
+
+def init_app(app):
+    if not os.path.exists(SCHEMA_FILE):
+        app.logger.warning("Query schema check skipped: %s not found", SCHEMA_FILE)
+        return
+    problems = validate(load_schema(SCHEMA_FILE))
+    if problems:
+        raise SchemaMismatch("Queries don't match the schema in %s:\n  %s" % (SCHEMA_FILE, "\n  ".join(problems)))
@@ -0,0 +1,367 @@
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+
+import analytics
+from db import pool
+from search import booking_text_filter
+from tracking import BOOKING_STATUSES
+
+
+BOOKINGS_CSV_HEADER = ["id", "sender", "recipient", "origin", "destination", "status", "booking_date", "username"]
+
+
+REPORTS_DIR = os.environ.get("REPORTS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "generated_reports"))
+REPORT_TTL_HOURS = int(os.environ.get("REPORT_TTL_HOURS", "24"))
+REPORT_WORKERS = int(os.environ.get("REPORT_WORKERS", "2"))
+# A 'generating' row older than this is treated as abandoned (e.g. the worker process died)
+REPORT_STALE_MINUTES = int(os.environ.get("REPORT_STALE_MINUTES", "30"))
+REPORT_CLEANUP_BATCH = int(os.environ.get("REPORT_CLEANUP_BATCH", "500"))
+
+log = logging.getLogger(__name__)
+
+
+class ReportFilterError(ValueError):
+    pass
+
+
+# ---------- FILTERS ----------
+def parse_booking_filters(args):
+    """Validate date range / status / customer / text filters from a query-string or form mapping."""
+    filters = {}
+    for key in ("date_from", "date_to"):
+        value = args.get(key)
+        if value:
+            try:
+                filters[key] = datetime.strptime(value, "%Y-%m-%d").date()
+            except ValueError:
+                raise ReportFilterError(f"Invalid {key}: expected YYYY-MM-DD")
+    status = args.get("status")
+    if status:
+        if status not in BOOKING_STATUSES:
+            raise ReportFilterError(f"Unknown status: {status}")
+        filters["status"] = status
+    customer_id = args.get("customer_id")
+    if customer_id:
+        if not customer_id.isdigit():
+            raise ReportFilterError("customer_id must be a number")
+        filters["customer_id"] = int(customer_id)
+    q = (args.get("q") or "").strip()
+    if q:
+        filters["q"] = q
+    return filters
+
+
+def booking_where(filters):
+    clauses, params = [], []
+    if "date_from" in filters:
+        clauses.append("b.booking_date >= %s")
+        params.append(filters["date_from"])
+    if "date_to" in filters:
+        # date_to is inclusive; compare against the start of the next day so the index range stays sargable
+        clauses.append("b.booking_date < %s")
+        params.append(filters["date_to"] + timedelta(days=1))
+    if "status" in filters:
+        clauses.append("b.status = %s")
+        params.append(filters["status"])
+    if "customer_id" in filters:
+        clauses.append("b.customer_id = %s")
+        params.append(filters["customer_id"])
+    if "q" in filters:
+        # Tracking ID prefix or FULLTEXT words: either way one index, never a LIKE scan
+        clause, text_params = booking_text_filter(filters["q"])
+        clauses.append(clause)
+        params.extend(text_params)
+    return clauses, params
+
+
+# ---------- BOOKINGS EXPORT ----------
+def iter_booking_rows(conn, filters, batch_size=1000):
+    """Yield booking export rows newest first, one keyset-paginated batch at a time.
+
+    Each batch is a bounded query that resumes after the last (booking_date,
+    booking_id) seen, read through an unbuffered cursor, so memory use does
+    not grow with the size of the table.
+    """
+    clauses, params = booking_where(filters)
+    cursor = conn.cursor()
+    last = None
+    try:
+        while True:
+            page_clauses, page_params = list(clauses), list(params)
+            if last:
+                page_clauses.append("(b.booking_date < %s OR (b.booking_date = %s AND b.booking_id < %s))")
+                page_params.extend([last[0], last[0], last[1]])
+            where = ("WHERE " + " AND ".join(page_clauses)) if page_clauses else ""
+            cursor.execute(f"""
+                SELECT b.booking_id, b.sender_name, b.recipient_name, b.sender_address,
+                       b.recipient_address, b.status, b.booking_date, u.username
+                FROM cargo_bookings b
+                JOIN customers c ON b.customer_id = c.customer_id
+                LEFT JOIN users u ON c.user_id = u.user_id
+                {where}
+                ORDER BY b.booking_date DESC, b.booking_id DESC
+                LIMIT %s
+            """, page_params + [batch_size])
+
+            count = 0
+            for row in cursor:
+                count += 1
+                last = (row[6], row[0])
+                yield row
+            if count < batch_size:
+                break
+    finally:
+        cursor.close()
+
+
+def stream_bookings_csv(filters, batch_size=1000):
+    """Generate the bookings report as CSV text chunks, one chunk per batch."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(BOOKINGS_CSV_HEADER)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    # The response outlives the request's app context, so borrow a connection for the generator itself
+    with pool.connection() as conn:
+        for i, row in enumerate(iter_booking_rows(conn, filters, batch_size), 1):
+            booking_id, sender, recipient, origin, destination, status, booking_date, username = row
+            writer.writerow([
+                booking_id, sender or "", recipient or "", origin or "", destination or "",
+                status or "", booking_date, username or "",
+            ])
+            if i % batch_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    yield buffer.getvalue()
+
+
+# ---------- REPORT JOBS ----------
+# Each generator streams (header, rows) for one reports.report_type over [date_from, date_to].
+def _operational_rows(cursor, date_from, date_to):
+    cursor.execute("""
+        SELECT status, COUNT(*),
+               ROUND(AVG(TIMESTAMPDIFF(HOUR, booking_date, actual_delivery_date)), 1),
+               SUM(CASE WHEN DATE(actual_delivery_date) > expected_delivery_date THEN 1 ELSE 0 END)
+        FROM cargo_bookings
+        WHERE booking_date >= %s AND booking_date < %s
+        GROUP BY status
+        ORDER BY status
+    """, (date_from, date_to + timedelta(days=1)))
+    return ["status", "bookings", "avg_delivery_hours", "late_deliveries"], cursor
+
+
+def _customer_activity_rows(cursor, date_from, date_to):
+    cursor.execute("""
+        SELECT c.customer_id, u.username, COUNT(*), SUM(b.total_amount), MAX(b.booking_date)
+        FROM cargo_bookings b
+        JOIN customers c ON b.customer_id = c.customer_id
+        LEFT JOIN users u ON c.user_id = u.user_id
+        WHERE b.booking_date >= %s AND b.booking_date < %s
+        GROUP BY c.customer_id, u.username
+        ORDER BY COUNT(*) DESC
+    """, (date_from, date_to + timedelta(days=1)))
+    return ["customer_id", "username", "bookings", "total_amount", "last_booking"], cursor
+
+
+# financial, shipment_volume and performance read the analytics rollups instead of the base tables
+REPORT_GENERATORS = {
+    "financial": analytics.financial_report,
+    "operational": _operational_rows,
+    "customer_activity": _customer_activity_rows,
+    "shipment_volume": analytics.shipment_volume_report,
+    "performance": analytics.performance_report,
+}
+
+
+class ReportQueue:
+    """Runs report generation on a local thread pool, tracked through the reports table.
+
+    Requests with the same type, date range and parameters reuse an in-flight
+    or unexpired completed report instead of generating it again. The unique
+    cache_key column holds the key only while a report is live, so the
+    database decides which of several concurrent workers queues the job.
+    """
+
+    def __init__(self, reports_dir=REPORTS_DIR, workers=REPORT_WORKERS, ttl_hours=REPORT_TTL_HOURS):
+        self.reports_dir = reports_dir
+        self.ttl_hours = ttl_hours
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report-worker")
+
+    @staticmethod
+    def cache_key(report_type, date_from, date_to, params):
+        raw = json.dumps([report_type, str(date_from), str(date_to), params or {}], sort_keys=True)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def request(self, conn, report_type, date_from, date_to, generated_by, params=None):
+        """Return (report_id, created) for a cached/in-flight report or a newly queued one."""
+        if report_type not in REPORT_GENERATORS:
+            raise ReportFilterError(f"Unknown report type: {report_type}")
+        if date_from is None or date_to is None:
+            raise ReportFilterError("date_from and date_to are required")
+        if date_from > date_to:
+            raise ReportFilterError("date_from must not be after date_to")
+
+        key = self.cache_key(report_type, date_from, date_to, params)
+        cursor = conn.cursor()
+        try:
+            # Free the key held by a failed, expired or abandoned report so it can be queued afresh
+            cursor.execute("""
+                UPDATE reports SET cache_key = NULL
+                WHERE cache_key = %s
+                  AND NOT ((status = 'completed' AND expires_at > NOW())
+                           OR (status = 'generating' AND generated_at > NOW() - INTERVAL %s MINUTE))
+            """, (key, REPORT_STALE_MINUTES))
+            # request_count changes on a duplicate, so rowcount is 2 there and 1 for a new row
+            cursor.execute("""
+                INSERT INTO reports (report_name, report_type, generated_by, date_from, date_to,
+                                     parameters, cache_key, format, status)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, 'csv', 'generating')
+                ON DUPLICATE KEY UPDATE report_id = LAST_INSERT_ID(report_id), request_count = request_count + 1
+            """, (
+                f"{report_type} {date_from} to {date_to}", report_type, generated_by,
+                date_from, date_to, json.dumps({"cache_key": key, "params": params or {}}), key,
+            ))
+            report_id, created = cursor.lastrowid, cursor.rowcount == 1
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+        if not created:
+            return report_id, False
+        self._executor.submit(self._run, report_id, report_type, date_from, date_to)
+        return report_id, True
+
+    def _run(self, report_id, report_type, date_from, date_to):
+        os.makedirs(self.reports_dir, exist_ok=True)
+        path = os.path.join(self.reports_dir, f"report_{report_id}_{report_type}.csv")
+        tmp_path = path + ".part"
+        try:
+            with pool.connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    with open(tmp_path, "w", newline="") as f:
+                        writer = csv.writer(f)
+                        header, rows = REPORT_GENERATORS[report_type](cursor, date_from, date_to)
+                        writer.writerow(header)
+                        for row in rows:
+                            writer.writerow(row)
+                    os.replace(tmp_path, path)
+                    cursor.execute("""
+                        UPDATE reports
+                        SET status = 'completed', file_path = %s, file_size = %s,
+                            generated_at = NOW(), expires_at = NOW() + INTERVAL %s HOUR
+                        WHERE report_id = %s
+                    """, (path, os.path.getsize(path), self.ttl_hours, report_id))
+                    conn.commit()
+                finally:
+                    cursor.close()
+        except Exception:
+            log.exception("Report %s (%s) failed", report_id, report_type)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            with pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("UPDATE reports SET status = 'failed', cache_key = NULL WHERE report_id = %s",
+                               (report_id,))
+                conn.commit()
+                cursor.close()
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+def recent_reports(conn, generated_by, limit=20):
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("""
+        SELECT report_id, report_name, report_type, status, file_size, generated_at,
+               expires_at, download_count, expires_at > NOW() AS available
+        FROM reports
+        WHERE generated_by = %s
+        ORDER BY report_id DESC
+        LIMIT %s
+    """, (generated_by, limit))
+    rows = cursor.fetchall()
+    cursor.close()
+    return rows
+
+
+def claim_download(conn, report_id):
+    """Return the file path of a completed, unexpired report and count the download, else None."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT file_path FROM reports
+            WHERE report_id = %s AND status = 'completed' AND expires_at > NOW()
+        """, (report_id,))
+        row = cursor.fetchone()
+        if not row or not row[0] or not os.path.exists(row[0]):
+            return None
+        cursor.execute("UPDATE reports SET download_count = download_count + 1 WHERE report_id = %s", (report_id,))
+        conn.commit()
+        return row[0]
+    finally:
+        cursor.close()
+
+
+# ---------- CLEANUP ----------
+def cleanup_expired_reports(conn, batch_size=REPORT_CLEANUP_BATCH):
+    """Delete expired and failed reports with their files, a batch per transaction; returns (rows, files)."""
+    rows = files = 0
+    cursor = conn.cursor()
+    try:
+        while True:
+            cursor.execute("""
+                SELECT report_id, file_path FROM reports
+                WHERE expires_at <= NOW()
+                   OR (status = 'failed' AND generated_at <= NOW() - INTERVAL %s MINUTE)
+                ORDER BY report_id
+                LIMIT %s
+            """, (REPORT_STALE_MINUTES, batch_size))
+            batch = cursor.fetchall()
+            if not batch:
+                return rows, files
+            for _, path in batch:
+                if path:
+                    try:
+                        os.remove(path)
+                        files += 1
+                    except FileNotFoundError:
+                        pass
+            cursor.execute(
+                f"DELETE FROM reports WHERE report_id IN ({', '.join(['%s'] * len(batch))})",
+                [report_id for report_id, _ in batch],
+            )
+            conn.commit()
+            rows += len(batch)
+    finally:
+        cursor.close()
+
+
+@click.command("cleanup-reports")
+@click.option("--batch-size", default=REPORT_CLEANUP_BATCH, show_default=True)
+def cleanup_reports_command(batch_size):
+    """Delete expired and failed generated reports and their files (run from cron)."""
+    with pool.connection() as conn:
+        rows, files = cleanup_expired_reports(conn, batch_size)
+    click.echo(f"Removed {rows} reports and {files} files.")
+
+
+report_queue = ReportQueue()
+
+
+def init_app(app):
+    app.cli.add_command(cleanup_reports_command)
@@ -0,0 +1,153 @@
+import os
+import re
+
+import queries
+from pagination import prefix_pattern
+
+
+# innodb_ft_min_token_size: shorter words aren't in a FULLTEXT index at all
+SEARCH_MIN_TOKEN = int(os.environ.get("SEARCH_MIN_TOKEN", "3"))
+SEARCH_DEFAULT_LIMIT = 10
+SEARCH_MAX_LIMIT = 50
+SCOPES = ("bookings", "customers", "tickets")
+
+# Must list the columns of the FULLTEXT indexes in README section 15 exactly
+BOOKING_TEXT_COLUMNS = ("b.sender_name, b.sender_phone, b.sender_address, "
+                        "b.recipient_name, b.recipient_phone, b.recipient_address")
+USER_TEXT_COLUMNS = "u.username, u.full_name, u.email"
+
+_WORD = re.compile(r"\w+")
+_PHONE = re.compile(r"\+?[\d\s()\-]{3,}")
+_SEPARATORS = re.compile(r"[\s\-#]")
+# New-style, or a legacy uuid block. The hex block needs a digit, so words like "cafe" stay
+# a text search, and a letter, so phone digits stay a phone search; an all-letter or
+# all-digit start of a legacy ID (the "ABCD" of ABCDEF12) can't be found by prefix.
+_TRACKING_PREFIX = re.compile(r"TRK[0-9A-Z]*|(?=.*\d)(?=.*[A-F])[0-9A-F]{3,8}")
+_TICKET_PREFIX = re.compile(r"TKT-?[0-9A-Z]*")
+
+
+# ---------- QUERY PARSING ----------
+def fulltext_terms(text):
+    """Boolean-mode terms requiring every word as a prefix ("+harb* +road*"), or None if nothing is searchable.
+
+    Phone numbers aren't searched this way: the FULLTEXT parser splits
+    "+1 (555) 123-4567" at the punctuation, so use phone_prefix instead.
+    """
+    words = [w for w in _WORD.findall(text or "") if len(w) >= SEARCH_MIN_TOKEN]
+    return " ".join(f"+{w}*" for w in words) or None
+
+
+def tracking_prefix(text):
+    """LIKE pattern if ``text`` reads as the start of a tracking ID, else None."""
+    text = _SEPARATORS.sub("", text or "").upper()
+    return prefix_pattern(text) if len(text) >= SEARCH_MIN_TOKEN and _TRACKING_PREFIX.fullmatch(text) else None
+
+
+def ticket_prefix(text):
+    text = (text or "").strip().upper()
+    return prefix_pattern(text) if _TICKET_PREFIX.fullmatch(text) else None
+
+
+def phone_prefix(text):
+    """LIKE pattern on the *_phone_digits columns (README section 19) if ``text`` reads as a phone number."""
+    text = (text or "").strip()
+    if not _PHONE.fullmatch(text):
+        return None
+    digits = re.sub(r"\D", "", text)
+    return prefix_pattern(digits) if len(digits) >= SEARCH_MIN_TOKEN else None
+
+
+# ---------- LISTING FILTERS ----------
+# WHERE fragments for the keyset-paginated listings. Each uses one index:
+# the tracking_id B-tree for ID prefixes, the phone-digit B-trees for phone
+# numbers, the FULLTEXT index otherwise. A query with no searchable word
+# matches nothing rather than scanning.
+def booking_text_filter(text):
+    pattern = tracking_prefix(text)
+    if pattern:
+        return "b.tracking_id LIKE %s", [pattern]
+    pattern = phone_prefix(text)
+    if pattern:
+        return "(b.sender_phone_digits LIKE %s OR b.recipient_phone_digits LIKE %s)", [pattern, pattern]
+    terms = fulltext_terms(text)
+    if terms:
+        return f"MATCH({BOOKING_TEXT_COLUMNS}) AGAINST (%s IN BOOLEAN MODE)", [terms]
+    return "FALSE", []
+
+
+def user_text_filter(text):
+    terms = fulltext_terms(text)
+    if terms:
+        return f"MATCH({USER_TEXT_COLUMNS}) AGAINST (%s IN BOOLEAN MODE)", [terms]
+    return "FALSE", []
+
+
+# ---------- TYPEAHEAD ----------
+def _suggest_bookings(conn, text, limit, customer_id):
+    pattern = tracking_prefix(text)
+    phone = phone_prefix(text)
+    if pattern:
+        rows = queries.fetch_all(conn, queries.SEARCH_BOOKINGS_TRACKING, (pattern, customer_id, customer_id, limit))
+    elif phone:
+        rows = queries.fetch_all(conn, queries.SEARCH_BOOKINGS_PHONE, (phone, phone, customer_id, customer_id, limit))
+    else:
+        terms = fulltext_terms(text)
+        if not terms:
+            return []
+        rows = queries.fetch_all(
+            conn, queries.SEARCH_BOOKINGS_TEXT, (terms, terms, customer_id, customer_id, limit)
+        )
+    return [{
+        "type": "booking", "id": r.booking_id, "label": r.tracking_id,
+        "detail": f"{r.sender_name} → {r.recipient_name} ({r.status})",
+    } for r in rows]
+
+
+def _suggest_customers(conn, text, limit, customer_id):
+    if customer_id is not None:
+        return []
+    pattern = phone_prefix(text)
+    if pattern:
+        rows = queries.fetch_all(conn, queries.SEARCH_CUSTOMERS_PHONE, (pattern, limit))
+    else:
+        terms = fulltext_terms(text)
+        if not terms:
+            return []
+        rows = queries.fetch_all(conn, queries.SEARCH_CUSTOMERS_TEXT, (terms, terms, limit))
+    return [{
+        "type": "customer", "id": r.user_id, "label": r.full_name, "detail": f"{r.username} · {r.email}",
+    } for r in rows]
+
+
+def _suggest_tickets(conn, text, limit, customer_id):
+    pattern = ticket_prefix(text)
+    if pattern:
+        rows = queries.fetch_all(conn, queries.SEARCH_TICKETS_NUMBER, (pattern, customer_id, customer_id, limit))
+    else:
+        terms = fulltext_terms(text)
+        if not terms:
+            return []
+        rows = queries.fetch_all(
+            conn, queries.SEARCH_TICKETS_TEXT, (terms, terms, customer_id, customer_id, limit)
+        )
+    return [{
+        "type": "ticket", "id": r.ticket_id, "label": r.ticket_number, "detail": f"{r.subject} ({r.status})",
+    } for r in rows]
+
+
+_SUGGESTERS = {
+    "bookings": _suggest_bookings,
+    "customers": _suggest_customers,
+    "tickets": _suggest_tickets,
+}
+
+
+def suggest(conn, scope, text, limit=SEARCH_DEFAULT_LIMIT, customer_id=None):
+    """Up to ``limit`` matches for a typeahead box, best first.
+
+    ``customer_id`` restricts bookings and tickets to that customer's own
+    (and customers to none). Every lookup is a single index probe with a
+    LIMIT, so cost doesn't grow with table size.
+    """
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    return _SUGGESTERS[scope](conn, text, limit, customer_id)
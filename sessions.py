@@ -0,0 +1,234 @@
+import hashlib
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from cache import LoadingCache, TTLCache
+
+
+# "sqlite" is shared by every worker on a host; "memory" only works with a single worker process
+SESSION_STORE = os.environ.get("SESSION_STORE", "sqlite")
+SESSION_SQLITE_PATH = os.environ.get("SESSION_SQLITE_PATH")        # default: <instance>/sessions.sqlite3
+SESSION_IDLE_MINUTES = int(os.environ.get("SESSION_IDLE_MINUTES", "120"))
+SESSION_MAX_MEMORY = int(os.environ.get("SESSION_MAX_MEMORY", "100000"))
+# Sessions without a login (e.g. a flash after a failed sign-in) get their own, smaller LRU
+SESSION_MAX_ANONYMOUS = int(os.environ.get("SESSION_MAX_ANONYMOUS", "10000"))
+# Bounds how stale a suspension or password change can be in *other* worker processes
+ACCOUNT_TTL_SECONDS = int(os.environ.get("ACCOUNT_TTL_SECONDS", "60"))
+
+# Sliding expiry is only written back once this much of the idle window has
+# passed, so a read-only request doesn't cost a store write
+_REFRESH_FRACTION = 0.1
+
+
+# ---------- STORES ----------
+class MemorySessionStore:
+    """Sessions held in this process; only for a single worker (other workers can't see them).
+
+    Logged-in and anonymous sessions are kept in separate LRUs, so a flood of
+    unauthenticated requests can't evict signed-in users.
+    """
+
+    def __init__(self, maxsize=SESSION_MAX_MEMORY, max_anonymous=SESSION_MAX_ANONYMOUS):
+        self._users = TTLCache(maxsize=maxsize)
+        self._anonymous = TTLCache(maxsize=max_anonymous)
+        # Stored serialized, like the SQLite store, so requests never share mutable values
+        self._serializer = TaggedJSONSerializer()
+
+    def load(self, sid):
+        """Return (data, expires_at) or None."""
+        record = self._users.get(sid) or self._anonymous.get(sid)
+        return (self._serializer.loads(record[0]), record[1]) if record else None
+
+    def save(self, sid, data, expires_at):
+        cache, other = (self._users, self._anonymous) if data.get("user_id") else (self._anonymous, self._users)
+        other.pop(sid)
+        cache.set(sid, (self._serializer.dumps(dict(data)), expires_at), ttl=max(expires_at - time.time(), 0))
+
+    def delete(self, sid):
+        self._users.pop(sid)
+        self._anonymous.pop(sid)
+
+
+class SQLiteSessionStore:
+    """Sessions in a local SQLite file, shared by all workers on a host and kept across restarts."""
+
+    PURGE_EVERY = 300   # seconds between sweeps of expired rows
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._serializer = TaggedJSONSerializer()
+        self._last_purge = 0
+        with self._conn() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    sid TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, sid):
+        row = self._conn().execute(
+            "SELECT data, expires_at FROM sessions WHERE sid = ? AND expires_at > ?", (sid, time.time())
+        ).fetchone()
+        return (self._serializer.loads(row[0]), row[1]) if row else None
+
+    def save(self, sid, data, expires_at):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)",
+                (sid, self._serializer.dumps(dict(data)), expires_at),
+            )
+            now = time.time()
+            if now - self._last_purge > self.PURGE_EVERY:
+                self._last_purge = now
+                conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+
+    def delete(self, sid):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+
+# ---------- SESSION INTERFACE ----------
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, expires_at=0):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.modified = False
+        self.rotate = False
+
+    def regenerate(self):
+        """Issue a new session ID on save (call on login to prevent session fixation)."""
+        self.rotate = True
+        self.modified = True
+
+
+class ServerSessionInterface(SessionInterface):
+    """Keeps session data server-side; the cookie only carries a random session ID.
+
+    Sessions expire after ``idle`` seconds without a request. Nothing is
+    stored, and no cookie set, until a request writes something to the session.
+    """
+
+    def __init__(self, store, idle=SESSION_IDLE_MINUTES * 60):
+        self.store = store
+        self.idle = idle
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        record = self.store.load(sid) if sid else None
+        if record is None:
+            return ServerSideSession()
+        data, expires_at = record
+        return ServerSideSession(data, sid, expires_at)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.sid:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = time.time()
+        if session.rotate and session.sid:
+            self.store.delete(session.sid)
+            session.sid = None
+        new_sid = session.sid is None
+        if new_sid:
+            session.sid = secrets.token_urlsafe(32)
+        if new_sid or session.modified or session.expires_at - now < self.idle * (1 - _REFRESH_FRACTION):
+            self.store.save(session.sid, session, now + self.idle)
+        if new_sid:
+            response.set_cookie(
+                name, session.sid,
+                expires=self.get_expiration_time(app, session),
+                domain=domain, path=path,
+                secure=self.get_cookie_secure(app),
+                httponly=self.get_cookie_httponly(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+            response.vary.add("Cookie")
+
+
+# ---------- ACCOUNT CHECKS ----------
+def auth_fingerprint(password_hash):
+    """Short digest of the password hash; a session stops matching once the password changes."""
+    return hashlib.sha256(password_hash.encode()).hexdigest()[:16]
+
+
+ACCOUNT_SQL = "SELECT role, status, password_hash FROM users WHERE user_id=%s"
+
+
+def _account(row):
+    if not row:
+        return None
+    role, status, password_hash = row
+    return {"role": role, "status": (status or "active").lower(), "auth": auth_fingerprint(password_hash)}
+
+
+class AccountCache:
+    """role/status/auth fingerprint per user_id, so login_required needs no query on a hit.
+
+    Admin actions and password changes call ``invalidate`` after committing,
+    which takes effect at once in this process and within ``ttl`` elsewhere.
+    """
+
+    def __init__(self, ttl=ACCOUNT_TTL_SECONDS):
+        self._cache = LoadingCache(maxsize=SESSION_MAX_MEMORY, ttl=ttl)
+
+    def get(self, user_id, connect):
+        def load():
+            cursor = connect().cursor()
+            try:
+                cursor.execute(ACCOUNT_SQL, (user_id,))
+                return _account(cursor.fetchone())
+            finally:
+                cursor.close()
+        return self._cache.get(user_id, load)
+
+    async def aget(self, user_id, fetch_one):
+        """``get`` for the ASGI app, with ``fetch_one`` an async query function."""
+        async def load():
+            return _account(await fetch_one(ACCOUNT_SQL, (user_id,)))
+        return await self._cache.aget(user_id, load)
+
+    def invalidate(self, *user_ids):
+        self._cache.invalidate(*user_ids)
+
+
+accounts = AccountCache()
+
+
+def init_app(app):
+    if SESSION_STORE == "sqlite":
+        path = SESSION_SQLITE_PATH or os.path.join(app.instance_path, "sessions.sqlite3")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        store = SQLiteSessionStore(path)
+    else:
+        store = MemorySessionStore()
+    app.session_interface = ServerSessionInterface(store)
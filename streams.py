@@ -0,0 +1,380 @@
+"""Server-Sent Events push of tracking updates.
+
+Flask workers publish status changes after commit as UDP datagrams, signed
+with the app secret, to every stream server in STREAM_PUBLISH_ADDRS (the
+local stand-in for a pub/sub bus, so any worker reaches every subscriber).
+A stream server is a single
+asyncio process holding the open EventSource connections; an idle
+subscriber costs one socket and one small queue, and nothing polls MySQL.
+"""
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import socket
+import time
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+
+import click
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+from ids import normalize_tracking_id
+
+
+log = logging.getLogger(__name__)
+
+# Every stream server listens on one of these; each event is sent to all of them
+STREAM_PUBLISH_ADDRS = [a.strip() for a in os.environ.get("STREAM_PUBLISH_ADDRS", "127.0.0.1:5101").split(",")
+                        if a.strip()]
+# Where browsers reach the stream server; empty turns live updates off in the templates
+STREAM_PUBLIC_URL = os.environ.get("STREAM_PUBLIC_URL", "").rstrip("/")
+STREAM_ALLOW_ORIGIN = os.environ.get("STREAM_ALLOW_ORIGIN", "*")
+STREAM_TOKEN_MAX_AGE = int(os.environ.get("STREAM_TOKEN_MAX_AGE", str(12 * 3600)))
+STREAM_HEARTBEAT_SECONDS = float(os.environ.get("STREAM_HEARTBEAT_SECONDS", "15"))
+# Events buffered per subscriber; a client that falls this far behind is disconnected
+STREAM_QUEUE_SIZE = int(os.environ.get("STREAM_QUEUE_SIZE", "64"))
+STREAM_SECRET = os.environ.get("FLASK_SECRET", "cargo_secret_key")
+# A client that hasn't sent its request headers by then is disconnected
+STREAM_HEADER_TIMEOUT_SECONDS = float(os.environ.get("STREAM_HEADER_TIMEOUT_SECONDS", "10"))
+# Same setting as the app's /metrics; without it /stream/stats answers only local callers
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+MAX_DATAGRAM = 8192
+MAC_LENGTH = 64                    # hex SHA-256 prepended to every datagram
+MAX_HEADER_LINE = 8192
+MAX_HEADERS = 100
+# Fields sent to browsers, as in timeline.py's public view: no booking or customer IDs
+PUBLIC_FIELDS = ("tracking_id", "status", "location", "at")
+TOKEN_KINDS = ("customer",)
+
+
+# ---------- TOKENS ----------
+# EventSource can't send the session cookie cross-origin, so pages embed a
+# short-lived signed token naming what the holder may subscribe to.
+def _serializer():
+    return URLSafeTimedSerializer(STREAM_SECRET, salt="stream")
+
+
+def token_for(kind, subject=None):
+    return _serializer().dumps([kind, subject])
+
+
+def read_token(token, kind):
+    """The subject of a valid ``kind`` token, or raise BadSignature."""
+    token_kind, subject = _serializer().loads(token, max_age=STREAM_TOKEN_MAX_AGE)
+    if token_kind != kind:
+        raise BadSignature("wrong token kind")
+    return subject
+
+
+# ---------- PUBLISHING (request side) ----------
+_addrs = None
+_sock = None
+_sock_pid = None
+
+
+def _socket():
+    global _addrs, _sock, _sock_pid
+    if _sock is None or _sock_pid != os.getpid():
+        _addrs = []
+        for addr in STREAM_PUBLISH_ADDRS:
+            host, _, port = addr.rpartition(":")
+            _addrs.append((host or "127.0.0.1", int(port)))
+        _sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        _sock.setblocking(False)
+        _sock_pid = os.getpid()
+    return _sock
+
+
+def status_event(tracking_id, booking_id, customer_id, status, location=None):
+    return {
+        "tracking_id": tracking_id, "booking_id": booking_id, "customer_id": customer_id,
+        "status": status, "location": location, "at": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def _mac(payload):
+    return hmac.new(STREAM_SECRET.encode(), b"stream-publish:" + payload, hashlib.sha256).hexdigest().encode()
+
+
+def sign(payload):
+    return _mac(payload) + payload
+
+
+def verify(datagram):
+    """The payload of a datagram signed with the app secret, or None."""
+    mac, payload = datagram[:MAC_LENGTH], datagram[MAC_LENGTH:]
+    return payload if hmac.compare_digest(mac, _mac(payload)) else None
+
+
+def _datagrams(events):
+    batch, size = [], 2 + MAC_LENGTH
+    for event in events:
+        encoded = json.dumps(event, separators=(",", ":"))
+        if batch and size + len(encoded) + 1 > MAX_DATAGRAM:
+            yield "[" + ",".join(batch) + "]"
+            batch, size = [], 2 + MAC_LENGTH
+        batch.append(encoded)
+        size += len(encoded) + 1
+    if batch:
+        yield "[" + ",".join(batch) + "]"
+
+
+def publish(events):
+    """Send events to every stream server. Fire-and-forget: call after commit.
+
+    Never blocks or raises; with no stream server running the datagrams
+    are simply dropped and pages fall back to showing state on reload.
+    """
+    if not STREAM_PUBLISH_ADDRS or not events:
+        return
+    try:
+        sock = _socket()
+        for datagram in _datagrams(events):
+            payload = sign(datagram.encode())
+            for addr in _addrs:
+                try:
+                    sock.sendto(payload, addr)
+                except OSError:
+                    pass
+    except (OSError, ValueError) as e:
+        log.warning("stream publish failed: %s", e)
+
+
+# ---------- BROKER ----------
+class Broker:
+    """Topic -> subscriber queues, all on one event loop.
+
+    Topics are ``tracking:<tracking_id>`` and ``customer:<customer_id>``. A
+    subscriber whose queue is full is cut off (its queue is replaced by a
+    single None) rather than buffering without bound; its EventSource
+    reconnects and catches up from the page's current state.
+    """
+
+    def __init__(self, queue_size=STREAM_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.topics = {}
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    def subscribe(self, topic):
+        queue = asyncio.Queue(self.queue_size)
+        self.topics.setdefault(topic, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, topic, queue):
+        subscribers = self.topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self.topics[topic]
+
+    def publish(self, topic, event):
+        for queue in tuple(self.topics.get(topic, ())):
+            try:
+                queue.put_nowait(event)
+                self.delivered += 1
+            except asyncio.QueueFull:
+                self.unsubscribe(topic, queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+                self.dropped += 1
+
+    def dispatch(self, event):
+        self.published += 1
+        # Subscribers only see what the public timeline shows; customer_id is just for routing
+        public = {field: event.get(field) for field in PUBLIC_FIELDS}
+        self.publish(f"tracking:{public['tracking_id']}", public)
+        if event.get("customer_id") is not None:
+            self.publish(f"customer:{event['customer_id']}", public)
+
+    def stats(self):
+        return {
+            "topics": len(self.topics),
+            "subscribers": sum(len(s) for s in self.topics.values()),
+            "published": self.published, "delivered": self.delivered, "dropped": self.dropped,
+            "rejected": self.rejected,
+        }
+
+
+class _Receiver(asyncio.DatagramProtocol):
+    def __init__(self, broker):
+        self.broker = broker
+
+    def datagram_received(self, data, addr):
+        # Only workers holding the app secret may publish; anything else is spoofable
+        payload = verify(data)
+        if payload is None:
+            self.broker.rejected += 1
+            return
+        try:
+            events = json.loads(payload)
+        except ValueError:
+            return
+        for event in events if isinstance(events, list) else ():
+            if isinstance(event, dict):
+                self.broker.dispatch(event)
+
+
+# ---------- STREAM SERVER ----------
+def _stats_allowed(headers, peer):
+    if METRICS_TOKEN:
+        return hmac.compare_digest(headers.get("authorization", ""), f"Bearer {METRICS_TOKEN}")
+    try:
+        return ipaddress.ip_address(peer or "").is_loopback
+    except ValueError:
+        return False
+
+
+class StreamServer:
+    """Minimal HTTP/1.1 server speaking only text/event-stream."""
+
+    def __init__(self, broker, heartbeat=STREAM_HEARTBEAT_SECONDS):
+        self.broker = broker
+        self.heartbeat = heartbeat
+        self.started = time.time()
+
+    def route(self, path, query, headers=None, peer=None):
+        """(topic, None) for a stream, or (None, (status, body)) for a plain reply."""
+        parts = [p for p in path.split("/") if p]
+        token = (query.get("token") or [""])[0]
+        if parts == ["stream", "stats"]:
+            if not _stats_allowed(headers or {}, peer):
+                return None, ("404 Not Found", json.dumps({"error": "not found"}))
+            return None, ("200 OK", json.dumps({**self.broker.stats(), "uptime": int(time.time() - self.started)}))
+        if len(parts) == 3 and parts[:2] == ["stream", "track"]:
+            # Publishers key on the canonical ID, as the /track page does
+            tracking_id = normalize_tracking_id(parts[2])
+            if tracking_id is None:
+                return None, ("404 Not Found", json.dumps({"error": "unknown tracking ID"}))
+            return f"tracking:{tracking_id}", None
+        if len(parts) == 2 and parts[0] == "stream" and parts[1] in TOKEN_KINDS:
+            try:
+                subject = read_token(token, parts[1])
+            except BadSignature:
+                return None, ("403 Forbidden", json.dumps({"error": "invalid or expired token"}))
+            return f"{parts[1]}:{subject}", None
+        return None, ("404 Not Found", json.dumps({"error": "not found"}))
+
+    async def _read_request(self, reader):
+        """(request line, headers) or None for a malformed request."""
+        request_line = (await reader.readline()).decode("latin-1").split()
+        headers = {}
+        for _ in range(MAX_HEADERS + 1):
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                return request_line, headers
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return None
+
+    async def handle(self, reader, writer):
+        try:
+            try:
+                request = await asyncio.wait_for(self._read_request(reader), STREAM_HEADER_TIMEOUT_SECONDS)
+            except (asyncio.TimeoutError, ValueError):
+                # Slow, oversized or never-finished headers; don't hold a socket for them
+                return
+            if request is None:
+                return
+            request_line, headers = request
+            if len(request_line) < 2 or request_line[0] != "GET":
+                await self._reply(writer, "405 Method Not Allowed", json.dumps({"error": "GET only"}))
+                return
+            url = urlsplit(request_line[1])
+            peer = writer.get_extra_info("peername")
+            topic, reply = self.route(url.path, parse_qs(url.query), headers, peer[0] if peer else None)
+            if reply:
+                await self._reply(writer, *reply)
+                return
+            await self._stream(writer, topic)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _reply(self, writer, status, body):
+        body = body.encode()
+        writer.write((
+            f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+            f"Access-Control-Allow-Origin: {STREAM_ALLOW_ORIGIN}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+        ).encode() + body)
+        await writer.drain()
+
+    async def _stream(self, writer, topic):
+        writer.write((
+            "HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+            f"Access-Control-Allow-Origin: {STREAM_ALLOW_ORIGIN}\r\n"
+            "X-Accel-Buffering: no\r\nConnection: keep-alive\r\n\r\n"
+            f"retry: {int(self.heartbeat * 1000)}\n\n"
+        ).encode())
+        await writer.drain()
+        queue = self.broker.subscribe(topic)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    # Also how a closed connection is noticed when nothing is published
+                    writer.write(b": ping\n\n")
+                else:
+                    if event is None:
+                        break
+                    writer.write(f"event: status\ndata: {json.dumps(event)}\n\n".encode())
+                await writer.drain()
+        finally:
+            self.broker.unsubscribe(topic, queue)
+
+
+async def run_server(host, port, udp_host, udp_port, broker=None):
+    broker = broker or Broker()
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(lambda: _Receiver(broker), local_addr=(udp_host, udp_port))
+    server = await asyncio.start_server(StreamServer(broker).handle, host, port, backlog=4096, limit=MAX_HEADER_LINE)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        transport.close()
+
+
+# ---------- CLI ----------
+@click.command("stream-server")
+@click.option("--host", default="0.0.0.0", show_default=True)
+@click.option("--port", default=5100, show_default=True)
+@click.option("--udp-host", default="127.0.0.1", show_default=True)
+@click.option("--udp-port", default=5101, show_default=True, help="Where Flask workers publish events.")
+def stream_server_command(host, port, udp_host, udp_port):
+    """Serve live tracking updates as Server-Sent Events.
+
+    Run one per host (raise the open-file limit for many subscribers), list
+    each one's UDP address in STREAM_PUBLISH_ADDRS, and set STREAM_PUBLIC_URL
+    to where browsers reach them.
+    """
+    click.echo(f"Streaming on :{port}, receiving events on {udp_host}:{udp_port}")
+    try:
+        asyncio.run(run_server(host, port, udp_host, udp_port))
+    except KeyboardInterrupt:
+        pass
+
+
+def stream_url(kind, subject=None):
+    """URL of the event stream for a page, or None when streaming is off."""
+    if not STREAM_PUBLIC_URL:
+        return None
+    if kind == "track":
+        return f"{STREAM_PUBLIC_URL}/stream/track/{subject}"
+    return f"{STREAM_PUBLIC_URL}/stream/{kind}?token={token_for(kind, subject)}"
+
+
+def init_app(app):
+    app.add_template_global(stream_url)
+    app.cli.add_command(stream_server_command)
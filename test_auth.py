@@ -0,0 +1,54 @@
+import pytest
+
+import auth
+from auth import RateLimiter, canonical_method
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(auth.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_burst_then_refused_with_a_retry_delay(clock):
+    limiter = RateLimiter(burst=3, per_minute=6)
+    assert [limiter.take("ip") for _ in range(3)] == [0, 0, 0]
+    assert limiter.take("ip") == pytest.approx(10.0)
+    assert limiter.rejected == 1
+
+
+def test_tokens_refill_at_the_configured_rate(clock):
+    limiter = RateLimiter(burst=2, per_minute=6)
+    limiter.take("ip")
+    limiter.take("ip")
+    clock[0] += 10
+    assert limiter.take("ip") == 0
+    assert limiter.take("ip") > 0
+
+
+def test_refill_never_exceeds_the_burst(clock):
+    limiter = RateLimiter(burst=2, per_minute=60)
+    limiter.take("ip")
+    clock[0] += 3600
+    assert [limiter.take("ip") for _ in range(3)][2] > 0
+
+
+def test_keys_have_separate_buckets(clock):
+    limiter = RateLimiter(burst=1, per_minute=1)
+    assert limiter.take("a") == 0
+    assert limiter.take("b") == 0
+    assert limiter.take("a") > 0
+
+
+def test_canonical_method_spells_out_defaults():
+    assert canonical_method("scrypt") == "scrypt:32768:8:1"
+    assert canonical_method("pbkdf2:sha512").startswith("pbkdf2:sha512:")
+
+
+def test_inline_hasher_round_trip():
+    hasher = auth.PasswordHasher(method="pbkdf2:sha256:1000", workers=0)
+    stored = hasher.hash("s3cret")
+    assert hasher.verify(stored, "s3cret") and not hasher.verify(stored, "wrong")
+    assert not hasher.needs_rehash(stored)
+    assert hasher.in_flight == 0
@@ -0,0 +1,52 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from billing import allocate_invoice_numbers, invoice_amounts
+
+
+@pytest.mark.parametrize("subtotal, rate, expected", [
+    ("100", "18", ("100.00", "18.00", "118.00")),
+    ("0.05", "18", ("0.05", "0.01", "0.06")),     # 0.009 rounds half-up to a cent
+    ("10.005", "18", ("10.01", "1.80", "11.81")),
+    (Decimal("99.99"), Decimal("12.5"), ("99.99", "12.50", "112.49")),
+])
+def test_invoice_amounts_round_half_up_to_cents(subtotal, rate, expected):
+    assert invoice_amounts(subtotal, rate) == tuple(Decimal(v) for v in expected)
+
+
+def test_total_is_exactly_subtotal_plus_tax():
+    for cents in range(1, 2000, 7):
+        subtotal, tax, total = invoice_amounts(Decimal(cents) / 100, "18")
+        assert total == subtotal + tax
+        assert total.as_tuple().exponent == -2
+
+
+class SequenceCursor:
+    """Just enough of invoice_sequences for allocate_invoice_numbers."""
+
+    def __init__(self):
+        self.series = {}
+        self._row = None
+
+    def execute(self, sql, params):
+        if sql.startswith("INSERT"):
+            self.series.setdefault(params[0], 1)
+        elif sql.startswith("SELECT"):
+            self._row = (self.series[params[0]],)
+        elif sql.startswith("UPDATE"):
+            self.series[params[1]] = params[0]
+
+    def fetchone(self):
+        return self._row
+
+
+def test_invoice_numbers_are_consecutive_per_year():
+    cursor = SequenceCursor()
+    first = allocate_invoice_numbers(cursor, 2, date(2026, 3, 1))
+    second = allocate_invoice_numbers(cursor, 1, date(2026, 12, 31))
+    other_year = allocate_invoice_numbers(cursor, 1, date(2027, 1, 1))
+    assert first == ["INV-2026-0000001", "INV-2026-0000002"]
+    assert second == ["INV-2026-0000003"]
+    assert other_year == ["INV-2027-0000001"]
@@ -0,0 +1,52 @@
+import threading
+
+from cache import LoadingCache, TTLCache
+
+
+def test_invalidation_during_a_load_keeps_the_stale_value_out():
+    cache = LoadingCache(ttl=60)
+    loading, release = threading.Event(), threading.Event()
+    results = []
+
+    def slow_load():
+        loading.set()
+        release.wait(5)
+        return "old"
+
+    reader = threading.Thread(target=lambda: results.append(cache.get("k", slow_load)))
+    reader.start()
+    loading.wait(5)
+    cache.invalidate("k")       # a writer commits while the read is still loading
+    release.set()
+    reader.join(5)
+
+    assert results == ["old"]   # the racing caller still gets its answer...
+    assert cache.get("k", lambda: "new") == "new"   # ...but it was never stored
+
+
+def test_loads_after_an_invalidation_are_stored():
+    cache = LoadingCache(ttl=60)
+    cache.invalidate("k")
+    calls = []
+    loader = lambda: calls.append(1) or "v"   # noqa: E731
+    assert cache.get("k", loader) == "v"
+    assert cache.get("k", loader) == "v"
+    assert len(calls) == 1
+
+
+def test_misses_are_cached_for_miss_ttl():
+    cache = LoadingCache(ttl=60, miss_ttl=0)
+    calls = []
+    loader = lambda: calls.append(1)   # noqa: E731
+    cache.get("k", loader)
+    cache.get("k", loader)
+    assert len(calls) == 2
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("a") == 1 and cache.get("b") is None and cache.get("c") == 3
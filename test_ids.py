@@ -0,0 +1,59 @@
+import pytest
+
+import ids
+from ids import TrackingIdGenerator, check_digit, format_tracking_id, normalize_tracking_id, parse_tracking_id
+
+
+def test_format_parse_round_trip():
+    tracking_id = format_tracking_id(1760000000123, 37, 4000)
+    assert len(tracking_id) == 17
+    assert parse_tracking_id(tracking_id) == (1760000000123, 37, 4000)
+
+
+def test_check_digit_catches_single_character_typos():
+    tracking_id = format_tracking_id(1760000000123, 5, 9)
+    body = tracking_id[len(ids.PREFIX):-1]
+    for i, original in enumerate(body):
+        for replacement in ids.ALPHABET:
+            if replacement != original:
+                typo = body[:i] + replacement + body[i + 1:]
+                assert check_digit(typo) != tracking_id[-1]
+
+
+def test_normalize_accepts_lower_case_separators_and_look_alikes():
+    tracking_id = format_tracking_id(1760000000123, 5, 9)
+    typed = "trk-" + tracking_id[3:].lower().replace("0", "o").replace("1", "l")
+    assert normalize_tracking_id(typed) == tracking_id
+
+
+def test_normalize_rejects_a_bad_check_digit():
+    tracking_id = format_tracking_id(1760000000123, 5, 9)
+    wrong = ids.ALPHABET[(ids.ALPHABET.index(tracking_id[-1]) + 1) % 32]
+    assert normalize_tracking_id(tracking_id[:-1] + wrong) is None
+
+
+@pytest.mark.parametrize("legacy", ["TRK12345678", "3F9A0B1C"])
+def test_legacy_ids_pass_through(legacy):
+    assert normalize_tracking_id(legacy.lower()) == legacy
+    with pytest.raises(ids.InvalidTrackingId):
+        parse_tracking_id(legacy)
+
+
+def test_ids_keep_increasing_when_the_clock_steps_back(monkeypatch):
+    clock = iter([1760000000.500, 1760000000.200, 1760000000.200, 1760000000.600])
+    monkeypatch.setattr(ids.time, "time", lambda: next(clock))
+    generator = TrackingIdGenerator(node_id=1)
+    generated = [generator.next() for _ in range(4)]
+    assert generated == sorted(generated)
+    assert len(set(generated)) == 4
+    # Held at the last timestamp while the clock was behind it, counting sequence numbers
+    assert [parse_tracking_id(t)[0] for t in generated[:3]] == [1760000000500] * 3
+    assert [parse_tracking_id(t)[2] for t in generated[:3]] == [0, 1, 2]
+
+
+def test_sequence_overflow_borrows_the_next_millisecond(monkeypatch):
+    monkeypatch.setattr(ids.time, "time", lambda: 1760000000.000)
+    generator = TrackingIdGenerator(node_id=1)
+    generated = generator.reserve(ids.MAX_SEQUENCE + 2)
+    assert len(set(generated)) == len(generated)
+    assert parse_tracking_id(generated[-1])[:3:2] == (1760000000001, 0)
@@ -0,0 +1,56 @@
+import base64
+from datetime import date, datetime
+
+from pagination import decode_cursor, encode_cursor, keyset_page, prefix_pattern
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.sql = self.params = None
+
+    def execute(self, sql, params):
+        self.sql, self.params = sql, params
+
+    def fetchall(self):
+        return list(self.rows)
+
+
+def test_cursor_round_trip_keeps_dates_and_datetimes():
+    values = [datetime(2026, 1, 2, 3, 4, 5), date(2026, 1, 2), 42, "x"]
+    assert decode_cursor(encode_cursor(values)) == values
+
+
+def test_cursor_tokens_are_url_safe_without_padding():
+    token = encode_cursor([datetime(2026, 1, 2, 3, 4, 5), 123456789])
+    assert "=" not in token and "+" not in token and "/" not in token
+
+
+def test_tampered_or_garbage_cursors_decode_to_none():
+    assert decode_cursor("") is None
+    assert decode_cursor("!!!not-base64!!!") is None
+    assert decode_cursor(base64.urlsafe_b64encode(b"{broken json").decode()) is None
+    assert decode_cursor(base64.urlsafe_b64encode(b"42").decode()) is None
+    assert decode_cursor(encode_cursor([{"dt": "not a date"}])) is None
+
+
+def test_a_cursor_of_the_wrong_shape_is_ignored():
+    cursor = FakeCursor([{"booking_date": date(2026, 1, 1), "booking_id": 3}])
+    token = encode_cursor([date(2026, 1, 1), 5, "extra"])
+    keyset_page(cursor, "SELECT * FROM b", [], [], ["b.booking_date", "b.booking_id"], {"after": token}, per_page=2)
+    assert "WHERE" not in cursor.sql
+    assert cursor.params == [3]
+
+
+def test_after_cursor_becomes_an_index_range():
+    cursor = FakeCursor([{"booking_date": date(2026, 1, 1), "booking_id": 4}])
+    token = encode_cursor([date(2026, 1, 2), 9])
+    page = keyset_page(cursor, "SELECT * FROM b", ["b.status = %s"], ["pending"],
+                       ["b.booking_date", "b.booking_id"], {"after": token}, per_page=1)
+    assert "(b.booking_date < %s) OR (b.booking_date = %s AND b.booking_id < %s)" in cursor.sql
+    assert cursor.params == ["pending", date(2026, 1, 2), date(2026, 1, 2), 9, 2]
+    assert not page.has_next and page.has_prev
+
+
+def test_prefix_pattern_escapes_wildcards():
+    assert prefix_pattern("50%_a\\b") == "50\\%\\_a\\\\b%"
@@ -0,0 +1,47 @@
+import pytest
+
+import search
+
+
+def test_fulltext_terms_require_every_word_as_a_prefix():
+    assert search.fulltext_terms("Harbour  road, Kochi") == "+Harbour* +road* +Kochi*"
+
+
+def test_fulltext_terms_drop_words_below_the_index_token_size():
+    assert search.fulltext_terms("to MG rd Kochi") == "+Kochi*"
+    assert search.fulltext_terms("a b") is None
+    assert search.fulltext_terms(None) is None
+
+
+@pytest.mark.parametrize("text, pattern", [
+    ("trk0a8j", "TRK0A8J%"),
+    ("TRK-0A8J", "TRK0A8J%"),
+    ("3f9a", "3F9A%"),
+])
+def test_tracking_prefixes(text, pattern):
+    assert search.tracking_prefix(text) == pattern
+
+
+@pytest.mark.parametrize("text", ["5551234", "555-1234", "cafe", "ABCD", "tr"])
+def test_not_tracking_prefixes(text):
+    assert search.tracking_prefix(text) is None
+
+
+def test_phone_prefix_keeps_only_digits():
+    assert search.phone_prefix("+1 (555) 123-4567") == "15551234567%"
+    assert search.phone_prefix("12") is None
+    assert search.phone_prefix("road 12") is None
+
+
+def test_booking_text_filter_picks_one_index():
+    assert search.booking_text_filter("TRK0A8J") == ("b.tracking_id LIKE %s", ["TRK0A8J%"])
+    clause, params = search.booking_text_filter("555-1234")
+    assert "phone_digits" in clause and params == ["5551234%", "5551234%"]
+    clause, params = search.booking_text_filter("harbour road")
+    assert clause.startswith("MATCH(") and params == ["+harbour* +road*"]
+    assert search.booking_text_filter("?") == ("FALSE", [])
+
+
+def test_ticket_prefix():
+    assert search.ticket_prefix("tkt-00") == "TKT-00%"
+    assert search.ticket_prefix("ticket") is None
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+
+from cache import LoadingCache
+
+
+TIMELINE_CACHE_SIZE = int(os.environ.get("TIMELINE_CACHE_SIZE", "10000"))
+TIMELINE_TTL_SECONDS = int(os.environ.get("TIMELINE_TTL_SECONDS", "300"))
+# Unknown IDs are cached too so scans of bad IDs don't reach MySQL; short, since a
+# booking made by another worker only clears this process's entry on expiry
+TIMELINE_MISS_TTL_SECONDS = int(os.environ.get("TIMELINE_MISS_TTL_SECONDS", "30"))
+
+
+# ---------- LOADING ----------
+BOOKING_SQL = """
+    SELECT booking_id, tracking_id, COALESCE(latest_status, status) AS status, latest_location,
+           latest_update_at, booking_date, expected_delivery_date, actual_delivery_date
+    FROM cargo_bookings WHERE tracking_id = %s
+"""
+UPDATES_SQL = """
+    SELECT status, location, update_timestamp, update_id
+    FROM tracking_updates WHERE booking_id = %s
+    UNION ALL
+    SELECT status, location, update_timestamp, update_id
+    FROM tracking_updates_archive WHERE booking_id = %s
+    ORDER BY update_timestamp DESC, update_id DESC
+"""
+
+
+def load_timeline(cursor, tracking_id):
+    """Return the public view of a shipment, or None if the tracking ID is unknown.
+
+    Only status, places and dates are exposed: names, addresses, phone numbers
+    and employee notes stay behind login.
+    """
+    cursor.execute(BOOKING_SQL, (tracking_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    cursor.execute(UPDATES_SQL, (row[0], row[0]))
+    return _timeline(row, cursor.fetchall())
+
+
+async def aload_timeline(fetch_all, tracking_id):
+    """``load_timeline`` for the ASGI app, with ``fetch_all`` an async query function."""
+    rows = await fetch_all(BOOKING_SQL, (tracking_id,))
+    if not rows:
+        return None
+    return _timeline(rows[0], await fetch_all(UPDATES_SQL, (rows[0][0], rows[0][0])))
+
+
+def _timeline(row, updates):
+    booking_id, tracking_id, status, location, updated_at, booked_at, expected, delivered = row
+    return {
+        "tracking_id": tracking_id,
+        "status": status,
+        "location": location,
+        "updated_at": updated_at,
+        "booking_date": booked_at,
+        "expected_delivery_date": expected,
+        "actual_delivery_date": delivered,
+        "updates": [
+            {"status": s, "location": loc, "timestamp": ts} for s, loc, ts, _ in updates
+        ],
+    }
+
+
+def _isoformat(value):
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+class TimelineEntry:
+    """A cached timeline with its JSON body and ETag computed once, at load time."""
+
+    __slots__ = ("timeline", "json", "etag")
+
+    def __init__(self, timeline):
+        self.timeline = timeline
+        self.json = json.dumps(timeline, default=_isoformat, separators=(",", ":")).encode()
+        self.etag = hashlib.sha1(self.json).hexdigest()[:20]
+
+
+# ---------- CACHE ----------
+class TimelineCache:
+    """Tracking timelines keyed by tracking_id, invalidated by the write paths.
+
+    Writers call ``invalidate`` after committing; other worker processes only
+    see the change once their entry expires.
+    """
+
+    def __init__(self, maxsize=TIMELINE_CACHE_SIZE, ttl=TIMELINE_TTL_SECONDS, miss_ttl=TIMELINE_MISS_TTL_SECONDS):
+        self._cache = LoadingCache(maxsize=maxsize, ttl=ttl, miss_ttl=miss_ttl)
+
+    @property
+    def hits(self):
+        return self._cache.hits
+
+    @property
+    def misses(self):
+        return self._cache.misses
+
+    def get(self, tracking_id, connect):
+        """Return the TimelineEntry for ``tracking_id`` (None if unknown).
+
+        ``connect`` is only called on a miss, so a hit never checks a
+        connection out of the pool.
+        """
+        def load():
+            cursor = connect().cursor()
+            try:
+                timeline = load_timeline(cursor, tracking_id)
+            finally:
+                cursor.close()
+            return TimelineEntry(timeline) if timeline else None
+        return self._cache.get(tracking_id, load)
+
+    async def aget(self, tracking_id, fetch_all):
+        """``get`` for the ASGI app, loading through the async ``fetch_all`` on a miss."""
+        async def load():
+            timeline = await aload_timeline(fetch_all, tracking_id)
+            return TimelineEntry(timeline) if timeline else None
+        return await self._cache.aget(tracking_id, load)
+
+    def invalidate(self, *tracking_ids):
+        """Drop cached timelines; call after the write that changed them has committed."""
+        self._cache.invalidate(*(t for t in tracking_ids if t))
+
+    def clear(self):
+        self._cache.clear()
+
+
+timelines = TimelineCache()
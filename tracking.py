@@ -0,0 +1,208 @@
+import click
+
+from db import pool
+
+
+# Values allowed by cargo_bookings.status
+BOOKING_STATUSES = (
+    "pending", "confirmed", "picked_up", "in_transit", "out_for_delivery", "delivered", "cancelled",
+)
+
+# Values allowed by tracking_updates.status
+TRACKING_STATUSES = (
+    "pending", "confirmed", "picked_up", "in_transit", "at_hub",
+    "out_for_delivery", "delivered", "delivery_failed", "cancelled",
+)
+
+# cargo_bookings.status has no hub / failed-attempt states; those map to the nearest stage
+_BOOKING_STATUS_FOR = {"at_hub": "in_transit", "delivery_failed": "out_for_delivery"}
+
+
+def normalize_status(value):
+    """Return the tracking ENUM value for form/API input such as "picked-up", or None if invalid."""
+    status = (value or "").strip().lower().replace("-", "_").replace(" ", "_")
+    return status if status in TRACKING_STATUSES else None
+
+
+def booking_status_for(tracking_status):
+    return _BOOKING_STATUS_FOR.get(tracking_status, tracking_status)
+
+
+# ---------- WRITE PATH ----------
+def record_tracking_update(cursor, booking_id, status, location=None, notes=None, updated_by=None):
+    """Insert a tracking_updates row and move the booking's latest-status projection to it.
+
+    Runs on the caller's cursor so it commits or rolls back together with the
+    rest of the caller's transaction. Returns the new update_id.
+    """
+    cursor.execute("""
+        INSERT INTO tracking_updates (booking_id, status, location, notes, updated_by)
+        VALUES (%s, %s, %s, %s, %s)
+    """, (booking_id, status, location, notes, updated_by))
+    update_id = cursor.lastrowid
+
+    # Copy from the inserted row so the projection carries the exact DB timestamp.
+    # The update_id guard keeps a slower concurrent writer from rolling it back.
+    cursor.execute("""
+        UPDATE cargo_bookings cb
+        JOIN tracking_updates tu ON tu.update_id = %s
+        SET cb.latest_status = tu.status,
+            cb.latest_location = tu.location,
+            cb.latest_update_at = tu.update_timestamp,
+            cb.latest_update_id = tu.update_id,
+            cb.history_archived_at = NULL
+        WHERE cb.booking_id = %s
+          AND (cb.latest_update_id IS NULL OR cb.latest_update_id < tu.update_id)
+    """, (update_id, booking_id))
+    return update_id
+
+
+def set_booking_status(cursor, booking_ids, tracking_status):
+    """Move bookings to the booking status matching ``tracking_status`` (stamping delivery time)."""
+    if not booking_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(booking_ids))
+    cursor.execute(f"""
+        UPDATE cargo_bookings
+        SET status = %s,
+            actual_delivery_date = IF(%s = 'delivered', NOW(), actual_delivery_date)
+        WHERE booking_id IN ({placeholders})
+    """, [booking_status_for(tracking_status), tracking_status] + list(booking_ids))
+
+
+def record_tracking_updates(cursor, updates):
+    """Bulk form of record_tracking_update for (booking_id, status, location, notes, updated_by) rows.
+
+    The connector rewrites the executemany INSERT into a single multi-row
+    statement, and the projection is refreshed for all touched bookings in one
+    UPDATE instead of one per row.
+    """
+    if not updates:
+        return
+    cursor.executemany("""
+        INSERT INTO tracking_updates (booking_id, status, location, notes, updated_by)
+        VALUES (%s, %s, %s, %s, %s)
+    """, updates)
+
+    booking_ids = sorted({u[0] for u in updates})
+    placeholders = ", ".join(["%s"] * len(booking_ids))
+    cursor.execute(f"""
+        UPDATE cargo_bookings cb
+        JOIN (
+            SELECT booking_id, MAX(update_id) AS update_id
+            FROM tracking_updates
+            WHERE booking_id IN ({placeholders})
+            GROUP BY booking_id
+        ) m ON m.booking_id = cb.booking_id
+        JOIN tracking_updates tu ON tu.update_id = m.update_id
+        SET cb.latest_status = tu.status,
+            cb.latest_location = tu.location,
+            cb.latest_update_at = tu.update_timestamp,
+            cb.latest_update_id = tu.update_id,
+            cb.history_archived_at = NULL
+        WHERE cb.latest_update_id IS NULL OR cb.latest_update_id < tu.update_id
+    """, booking_ids)
+
+
+# ---------- REBUILD / CHECK ----------
+_LATEST_UPDATE_SUBQUERY = """
+    SELECT t.update_id FROM tracking_updates t
+    WHERE t.booking_id = cb.booking_id
+    ORDER BY t.update_timestamp DESC, t.update_id DESC
+    LIMIT 1
+"""
+
+
+def rebuild_latest_status(conn, batch_size=1000):
+    """Recompute the projection for every booking, one booking_id range per transaction.
+
+    Small batches keep row locks short so the rebuild can run against a live
+    database. Bookings whose history was archived keep their projection.
+    Returns the number of bookings processed.
+    """
+    cursor = conn.cursor()
+    processed = 0
+    last_id = 0
+    try:
+        while True:
+            cursor.execute(
+                "SELECT MAX(booking_id), COUNT(*) FROM (SELECT booking_id FROM cargo_bookings "
+                "WHERE booking_id > %s ORDER BY booking_id LIMIT %s) batch",
+                (last_id, batch_size),
+            )
+            upper, count = cursor.fetchone()
+            if not count:
+                break
+            cursor.execute(f"""
+                UPDATE cargo_bookings cb
+                LEFT JOIN tracking_updates tu ON tu.update_id = ({_LATEST_UPDATE_SUBQUERY})
+                SET cb.latest_status = tu.status,
+                    cb.latest_location = tu.location,
+                    cb.latest_update_at = tu.update_timestamp,
+                    cb.latest_update_id = tu.update_id
+                WHERE cb.booking_id > %s AND cb.booking_id <= %s AND cb.history_archived_at IS NULL
+            """, (last_id, upper))
+            conn.commit()
+            processed += count
+            last_id = upper
+    finally:
+        cursor.close()
+    return processed
+
+
+def check_latest_status(conn, batch_size=1000):
+    """Return booking_ids whose projection disagrees with tracking_updates."""
+    cursor = conn.cursor()
+    mismatched = []
+    last_id = 0
+    try:
+        while True:
+            cursor.execute(f"""
+                SELECT cb.booking_id, cb.latest_update_id, ({_LATEST_UPDATE_SUBQUERY}) AS expected_id
+                FROM cargo_bookings cb
+                WHERE cb.booking_id > %s AND cb.history_archived_at IS NULL
+                ORDER BY cb.booking_id
+                LIMIT %s
+            """, (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            mismatched.extend(r[0] for r in rows if r[1] != r[2])
+            last_id = rows[-1][0]
+        conn.rollback()
+    finally:
+        cursor.close()
+    return mismatched
+
+
+# ---------- CLI ----------
+@click.command("rebuild-latest-status")
+@click.option("--batch-size", default=1000, show_default=True)
+def rebuild_latest_status_command(batch_size):
+    """Backfill cargo_bookings.latest_* from tracking_updates."""
+    with pool.connection() as conn:
+        processed = rebuild_latest_status(conn, batch_size)
+    click.echo(f"Rebuilt latest status for {processed} bookings.")
+
+
+@click.command("check-latest-status")
+@click.option("--batch-size", default=1000, show_default=True)
+@click.option("--fix", is_flag=True, help="Rebuild the projection if any booking is out of date.")
+def check_latest_status_command(batch_size, fix):
+    """Report bookings whose latest status projection is stale."""
+    with pool.connection() as conn:
+        mismatched = check_latest_status(conn, batch_size)
+        if not mismatched:
+            click.echo("Latest status projection is consistent.")
+            return
+        click.echo(f"{len(mismatched)} bookings out of date, e.g. {mismatched[:20]}")
+        if fix:
+            rebuild_latest_status(conn, batch_size)
+            click.echo("Projection rebuilt.")
+    if not fix:
+        raise SystemExit(1)
+
+
+def init_app(app):
+    app.cli.add_command(rebuild_latest_status_command)
+    app.cli.add_command(check_latest_status_command)